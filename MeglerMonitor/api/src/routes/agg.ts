@@ -392,7 +392,7 @@ export const aggregateRoutes: FastifyPluginAsync = async (app) => {
         COUNT(*) FILTER (WHERE price IS NOT NULL AND (status IS NULL OR LOWER(status) NOT IN ('sold', 'solgt', 'inactive', 'withdrawn'))) AS count,
         AVG(price) FILTER (WHERE price IS NOT NULL AND (status IS NULL OR LOWER(status) NOT IN ('sold', 'solgt', 'inactive', 'withdrawn'))) AS avg_value
       FROM listings
-      WHERE snapshot_at::date BETWEEN $1::date AND $2::date
+      WHERE snapshot_at >= $1::date AND snapshot_at < $2::date + 1
       GROUP BY chain
       ORDER BY total_value DESC NULLS LAST
       LIMIT $3
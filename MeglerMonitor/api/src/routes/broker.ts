@@ -242,11 +242,11 @@ export const brokerRoutes: FastifyPluginAsync = async (app) => {
     }
     if (since) {
       params.push(since);
-      conditions.push(`snapshot_at::date >= $${params.length}`);
+      conditions.push(`snapshot_at >= $${params.length}::date`);
     }
     if (until) {
       params.push(until);
-      conditions.push(`snapshot_at::date <= $${params.length}`);
+      conditions.push(`snapshot_at < $${params.length}::date + 1`);
     }
 
     const whereClause = conditions.length ? `WHERE ${conditions.join(" AND ")}` : "";
@@ -266,7 +266,7 @@ export const commissionsRoutes: FastifyPluginAsync = async (app) => {
         COALESCE(SUM(commission_est), 0) AS total_commission,
         COALESCE(AVG(commission_est), 0) AS avg_commission
       FROM listings_latest
-      WHERE snapshot_at::date BETWEEN $1::date AND $2::date
+      WHERE snapshot_at >= $1::date AND snapshot_at < $2::date + 1
         ${whereClause}
       GROUP BY broker, chain
       ORDER BY total_commission DESC NULLS LAST
@@ -322,7 +322,7 @@ export const commissionsRoutes: FastifyPluginAsync = async (app) => {
         COALESCE(AVG(commission_est), 0) AS avg_commission
       FROM listings
       WHERE commission_est IS NOT NULL
-        AND snapshot_at::date BETWEEN $1::date AND $2::date
+        AND snapshot_at >= $1::date AND snapshot_at < $2::date + 1
       GROUP BY chain
       ORDER BY total_commission DESC NULLS LAST
       LIMIT $3
@@ -381,6 +381,8 @@ export const commissionsRoutes: FastifyPluginAsync = async (app) => {
                snapshot_at::date AS snapshot_day
         FROM listings
         WHERE commission_est IS NOT NULL
+          AND snapshot_at >= $3::date
+          AND snapshot_at < $2::date + 1
       ),
       now_window AS (
         SELECT broker,
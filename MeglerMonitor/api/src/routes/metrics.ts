@@ -93,7 +93,7 @@ export const metricsRoutes: FastifyPluginAsync = async (app) => {
       WITH windowed AS (
         SELECT *
         FROM listings
-        WHERE snapshot_at::date BETWEEN $1::date AND $2::date
+        WHERE snapshot_at >= $1::date AND snapshot_at < $2::date + 1
       ),
       latest_per_listing AS (
         SELECT DISTINCT ON (source, listing_id)
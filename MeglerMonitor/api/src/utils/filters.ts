@@ -263,10 +263,10 @@ export function buildSqlFilter(filters: ListingFilters, startIndex = 1): {
     }
   }
   if (filters.since) {
-    conditions.push(`snapshot_at::date >= ${addParam(filters.since)}`);
+    conditions.push(`snapshot_at >= ${addParam(filters.since)}::date`);
   }
   if (filters.until) {
-    conditions.push(`snapshot_at::date <= ${addParam(filters.until)}`);
+    conditions.push(`snapshot_at < ${addParam(filters.until)}::date + 1`);
   }
 
   return {
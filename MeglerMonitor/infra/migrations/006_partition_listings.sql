@@ -0,0 +1,219 @@
+-- Monthly range partitions on listings.snapshot_at. Each run appends a full copy of the
+-- corpus, so date-bounded queries only need to touch the months they cover, and old
+-- months can be detached (python -m scraper.partitions) instead of deleted row by row.
+-- Safe to re-run: an already partitioned listings is left alone.
+
+-- Creates the partition holding `moment` (calendar months in UTC) unless it exists, and returns
+-- its name. Used by the scraper loader before it writes a month for the first time. A month
+-- that was detached (python -m scraper.partitions detach) but not dropped is an error: rows
+-- for it would fit no partition, and silently re-attaching would bring retired data back.
+CREATE OR REPLACE FUNCTION ensure_listings_partition(moment TIMESTAMPTZ)
+RETURNS TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start TIMESTAMP := date_trunc('month', moment AT TIME ZONE 'UTC');
+    partition_name TEXT := format('listings_%s', to_char(month_start, 'YYYY_MM'));
+BEGIN
+    IF to_regclass(partition_name) IS NULL THEN
+        BEGIN
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF listings FOR VALUES FROM (%L) TO (%L)',
+                partition_name,
+                month_start AT TIME ZONE 'UTC',
+                (month_start + INTERVAL '1 month') AT TIME ZONE 'UTC'
+            );
+        EXCEPTION
+            -- Another session created it between the check and the CREATE.
+            WHEN duplicate_table OR unique_violation THEN
+                NULL;
+        END;
+    END IF;
+    IF NOT EXISTS (
+        SELECT 1
+        FROM pg_inherits
+        WHERE inhrelid = to_regclass(partition_name)
+          AND inhparent = 'listings'::regclass
+          AND NOT inhdetachpending
+    ) THEN
+        RAISE EXCEPTION 'listings partition % is detached', partition_name
+            USING
+                ERRCODE = 'object_not_in_prerequisite_state',
+                HINT = format(
+                    'Drop it, or re-attach it with ALTER TABLE listings ATTACH PARTITION %I '
+                    'FOR VALUES FROM (%L) TO (%L), before loading rows for that month.',
+                    partition_name,
+                    month_start AT TIME ZONE 'UTC',
+                    (month_start + INTERVAL '1 month') AT TIME ZONE 'UTC'
+                );
+    END IF;
+    RETURN partition_name;
+END;
+$$;
+
+DO $$
+DECLARE
+    legacy_sequence TEXT;
+    first_month TIMESTAMPTZ;
+    last_month TIMESTAMPTZ;
+    month_at TIMESTAMPTZ;
+    item RECORD;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('listings')) THEN
+        RETURN;
+    END IF;
+
+    -- The materialized view depends on listings; it is recreated below.
+    DROP MATERIALIZED VIEW IF EXISTS broker_commission_stats;
+
+    ALTER TABLE listings RENAME TO listings_legacy;
+    -- Free the index and constraint names for the partitioned table. Secondary indexes are
+    -- not needed for the copy and are recreated below.
+    FOR item IN
+        SELECT indexrelid::regclass::text AS name
+        FROM pg_index
+        WHERE indrelid = 'listings_legacy'::regclass
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = indexrelid)
+    LOOP
+        EXECUTE format('DROP INDEX %s', item.name);
+    END LOOP;
+    FOR item IN
+        SELECT conname FROM pg_constraint WHERE conrelid = 'listings_legacy'::regclass
+    LOOP
+        EXECUTE format(
+            'ALTER TABLE listings_legacy RENAME CONSTRAINT %I TO %I',
+            item.conname,
+            'legacy_' || item.conname
+        );
+    END LOOP;
+
+    CREATE TABLE listings (
+        id BIGINT NOT NULL,
+        source TEXT CHECK (source IN ('Hjem.no', 'DNB')),
+        listing_id TEXT NOT NULL,
+        title TEXT,
+        address TEXT,
+        city TEXT,
+        district TEXT,
+        chain TEXT,
+        broker TEXT,
+        price BIGINT,
+        commission_est BIGINT,
+        status TEXT,
+        published TIMESTAMPTZ,
+        property_type TEXT,
+        segment TEXT,
+        price_bucket TEXT,
+        broker_role TEXT,
+        role TEXT,
+        is_sold BOOLEAN,
+        last_seen_at TIMESTAMPTZ DEFAULT now(),
+        snapshot_at TIMESTAMPTZ NOT NULL,
+        -- Unique constraints on a partitioned table must include the partition key.
+        PRIMARY KEY (id, snapshot_at),
+        UNIQUE (source, listing_id, broker, snapshot_at)
+    ) PARTITION BY RANGE (snapshot_at);
+
+    -- Keep numbering ids from the old serial sequence.
+    legacy_sequence := pg_get_serial_sequence('listings_legacy', 'id');
+    IF legacy_sequence IS NULL THEN
+        CREATE SEQUENCE IF NOT EXISTS listings_id_seq;
+        legacy_sequence := 'listings_id_seq';
+        PERFORM setval(
+            legacy_sequence,
+            COALESCE((SELECT max(id) FROM listings_legacy), 0) + 1,
+            false
+        );
+    END IF;
+    EXECUTE format('ALTER TABLE listings ALTER COLUMN id SET DEFAULT nextval(%L)', legacy_sequence);
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY listings.id', legacy_sequence);
+
+    -- Every month with data, through next month.
+    SELECT min(snapshot_at), greatest(max(snapshot_at), now())
+    INTO first_month, last_month
+    FROM listings_legacy;
+    month_at := COALESCE(first_month, now());
+    WHILE month_at < last_month + INTERVAL '2 months' LOOP
+        PERFORM ensure_listings_partition(month_at);
+        month_at := month_at + INTERVAL '1 month';
+    END LOOP;
+
+    INSERT INTO listings (
+        id,
+        source,
+        listing_id,
+        title,
+        address,
+        city,
+        district,
+        chain,
+        broker,
+        price,
+        commission_est,
+        status,
+        published,
+        property_type,
+        segment,
+        price_bucket,
+        broker_role,
+        role,
+        is_sold,
+        last_seen_at,
+        snapshot_at
+    )
+    SELECT
+        id,
+        source,
+        listing_id,
+        title,
+        address,
+        city,
+        district,
+        chain,
+        broker,
+        price,
+        commission_est,
+        status,
+        published,
+        property_type,
+        segment,
+        price_bucket,
+        broker_role,
+        role,
+        is_sold,
+        last_seen_at,
+        snapshot_at
+    FROM listings_legacy;
+
+    DROP TABLE listings_legacy;
+END;
+$$;
+
+-- Indexes on the parent are created on every partition, present and future.
+CREATE INDEX IF NOT EXISTS idx_listings_snapshot_at ON listings (snapshot_at);
+CREATE INDEX IF NOT EXISTS idx_listings_broker_snapshot ON listings (broker, snapshot_at);
+CREATE INDEX IF NOT EXISTS idx_listings_chain_snapshot ON listings (chain, snapshot_at);
+CREATE INDEX IF NOT EXISTS idx_listings_city_chain_district ON listings (city, chain, district);
+CREATE INDEX IF NOT EXISTS idx_listings_property_type ON listings (property_type);
+CREATE INDEX IF NOT EXISTS idx_listings_role ON listings (role);
+CREATE INDEX IF NOT EXISTS idx_listings_city ON listings (city);
+CREATE INDEX IF NOT EXISTS idx_listings_city_district ON listings (city, district);
+CREATE INDEX IF NOT EXISTS idx_listings_broker ON listings (broker);
+CREATE INDEX IF NOT EXISTS idx_listings_chain ON listings (chain);
+CREATE INDEX IF NOT EXISTS idx_listings_broker_role ON listings (broker_role);
+CREATE INDEX IF NOT EXISTS idx_listings_segment ON listings (segment);
+CREATE INDEX IF NOT EXISTS idx_listings_is_sold ON listings (is_sold);
+CREATE INDEX IF NOT EXISTS idx_listings_published ON listings (published);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS broker_commission_stats AS
+SELECT
+    broker,
+    chain,
+    COUNT(*) FILTER (WHERE commission_est IS NOT NULL) AS listings,
+    COALESCE(SUM(commission_est), 0) AS total_commission,
+    COALESCE(AVG(commission_est), 0) AS avg_commission,
+    MAX(snapshot_at) AS last_snapshot
+FROM listings
+GROUP BY broker, chain;
+
+CREATE INDEX IF NOT EXISTS idx_broker_commission_stats_broker ON broker_commission_stats (broker, chain);
@@ -0,0 +1,385 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from typing import Iterator, List, Optional, Sequence
+
+import psycopg
+
+from .importer import EXTENSIONS, read_batches
+from .loader import DEFAULT_CHUNK_ROWS, RejectSink, insert_rows, rebuild_latest
+from .stats import SourceStats
+from .utils import (
+    COMMISSION_RATE_DEFAULT,
+    connect_db,
+    get_logger,
+    getenv,
+    getenv_float,
+    isoformat,
+    now_utc,
+    snapshot_filename,
+)
+
+# Bulk-loads the dated snapshots snapshot_filename leaves in out/raw. Files load in
+# parallel into listings only; listings_latest is rebuilt once when they are all in.
+DEFAULT_ROOT = "out/raw"
+DEFAULT_MARKER_DIR = "out/state/backfill"
+DEFAULT_WORKERS = 4
+SNAPSHOT_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})_(.+)\.(\w+)$")
+# all_listings is the concatenation of the per-source files of the same run, so it is
+# only used for dates that have no per-source file.
+SOURCE_LABELS = ("dnb_listings", "hjem_listings")
+COMBINED_LABEL = "all_listings"
+
+
+@dataclass(slots=True)
+class SnapshotFile:
+    path: str
+    label: str
+    snapshot_at: datetime
+
+    @property
+    def stamp(self) -> str:
+        stat = os.stat(self.path)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def parse_snapshot_name(path: str) -> Optional[SnapshotFile]:
+    match = SNAPSHOT_RE.match(os.path.basename(path))
+    if match is None or f".{match.group(3).lower()}" not in EXTENSIONS:
+        return None
+    try:
+        day = datetime.strptime(match.group(1), "%Y-%m-%d").replace(tzinfo=UTC)
+    except ValueError:
+        return None
+    return SnapshotFile(path=path, label=match.group(2), snapshot_at=day)
+
+
+def discover_snapshots(
+    roots: Sequence[str],
+    labels: Optional[Sequence[str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> List[SnapshotFile]:
+    # Every dated listing snapshot under `roots`, oldest first. Without `labels` each date
+    # contributes its per-source files, or its combined file when it has none.
+    found: dict[str, SnapshotFile] = {}
+    for root in roots:
+        for directory, _, names in os.walk(root):
+            for name in names:
+                snapshot = parse_snapshot_name(os.path.join(directory, name))
+                if snapshot is not None:
+                    found.setdefault(os.path.abspath(snapshot.path), snapshot)
+    snapshots = [
+        snapshot
+        for snapshot in found.values()
+        if (since is None or snapshot.snapshot_at >= since)
+        and (until is None or snapshot.snapshot_at <= until)
+    ]
+    if labels:
+        selected = [snapshot for snapshot in snapshots if snapshot.label in labels]
+    else:
+        dates_with_sources = {s.snapshot_at for s in snapshots if s.label in SOURCE_LABELS}
+        selected = [
+            snapshot
+            for snapshot in snapshots
+            if snapshot.label in SOURCE_LABELS
+            or (snapshot.label == COMBINED_LABEL and snapshot.snapshot_at not in dates_with_sources)
+        ]
+    return sorted(selected, key=lambda snapshot: (snapshot.snapshot_at, snapshot.path))
+
+
+class MarkerStore:
+    # One JSON marker per loaded file. A file is skipped while its marker matches its size,
+    # mtime and the target database; a changed file or another database loads again.
+
+    def __init__(self, directory: str, target: str) -> None:
+        self.directory = directory
+        self.target = target
+
+    def _path(self, snapshot: SnapshotFile) -> str:
+        name = os.path.abspath(snapshot.path).strip(os.sep).replace(os.sep, "__")
+        return os.path.join(self.directory, f"{name}.json")
+
+    def done(self, snapshot: SnapshotFile) -> bool:
+        try:
+            with open(self._path(snapshot), encoding="utf-8") as handle:
+                marker = json.load(handle)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        return marker.get("stamp") == snapshot.stamp and marker.get("target") == self.target
+
+    def mark(self, snapshot: SnapshotFile, result: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(snapshot)
+        marker = dict(
+            result,
+            path=os.path.abspath(snapshot.path),
+            stamp=snapshot.stamp,
+            target=self.target,
+            finished_at=isoformat(now_utc()),
+        )
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(marker, handle, indent=2)
+        os.replace(tmp_path, path)
+
+
+class ConnectionPool:
+    # A fixed set of connections shared by the worker threads, opened on first use.
+
+    def __init__(self, db_url: str, size: int) -> None:
+        self.db_url = db_url
+        self.size = size
+        self._idle: queue.Queue[psycopg.Connection] = queue.Queue()
+        self._opened: List[psycopg.Connection] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> psycopg.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._opened) < self.size:
+                connection = connect_db(self.db_url)
+                self._opened.append(connection)
+                return connection
+        return self._idle.get()
+
+    def release(self, connection: psycopg.Connection) -> None:
+        if connection.closed or connection.broken:
+            with self._lock:
+                self._opened.remove(connection)
+            return
+        self._idle.put(connection)
+
+    def close(self) -> None:
+        with self._lock:
+            for connection in self._opened:
+                connection.close()
+            self._opened.clear()
+
+
+def database_target(connection: psycopg.Connection) -> str:
+    info = connection.info
+    return f"{info.host}:{info.port}/{info.dbname}"
+
+
+def load_snapshot(
+    pool: ConnectionPool,
+    snapshot: SnapshotFile,
+    chunk_rows: int,
+    commission_rate: float,
+    rejects: RejectSink,
+    stats: SourceStats,
+) -> dict:
+    # Rows carrying their own snapshot_at keep it; the others get the date in the name.
+    started = time.perf_counter()
+    rejected_before = rejects.rows_written
+    rows = loaded = 0
+    connection = pool.acquire()
+    try:
+        for batch in read_batches(
+            snapshot.path,
+            chunk_rows=chunk_rows,
+            snapshot_at=isoformat(snapshot.snapshot_at),
+            commission_rate=commission_rate,
+            stats=stats,
+        ):
+            rows += len(batch)
+            loaded += insert_rows(
+                connection, batch, stats, chunk_rows, rejects, merge_latest=False
+            )
+    finally:
+        pool.release(connection)
+    return {
+        "rows": rows,
+        "loaded": loaded,
+        # Approximate with several workers sharing the reject file.
+        "rejected": rejects.rows_written - rejected_before,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def iter_results(
+    pool: ConnectionPool,
+    snapshots: Sequence[SnapshotFile],
+    workers: int,
+    chunk_rows: int,
+    commission_rate: float,
+    rejects: RejectSink,
+    stats: SourceStats,
+) -> Iterator[tuple[SnapshotFile, Optional[dict], Optional[Exception]]]:
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill") as executor:
+        futures = {
+            executor.submit(
+                load_snapshot, pool, snapshot, chunk_rows, commission_rate, rejects, stats
+            ): snapshot
+            for snapshot in snapshots
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as exc:  # noqa: BLE001
+                yield futures[future], None, exc
+
+
+def parse_day(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=UTC)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Backfill archived listing snapshots into Postgres."
+    )
+    parser.add_argument(
+        "roots", nargs="*", default=[DEFAULT_ROOT], help="Directories to search (default: out/raw)."
+    )
+    parser.add_argument(
+        "--db-url", default=getenv("SCRAPER_DB_URL", ""), help="Postgres connection string."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Files loaded at once, one connection each.",
+    )
+    parser.add_argument(
+        "--label",
+        dest="labels",
+        action="append",
+        help="Only load files with this label, e.g. dnb_listings (repeatable).",
+    )
+    parser.add_argument("--since", type=parse_day, help="First snapshot date, YYYY-MM-DD.")
+    parser.add_argument("--until", type=parse_day, help="Last snapshot date, YYYY-MM-DD.")
+    parser.add_argument(
+        "--markers", default=DEFAULT_MARKER_DIR, help="Idempotency marker directory."
+    )
+    parser.add_argument("--force", action="store_true", help="Reload files that have a marker.")
+    parser.add_argument(
+        "--skip-latest",
+        action="store_true",
+        help="Do not rebuild listings_latest at the end.",
+    )
+    parser.add_argument(
+        "--commission-rate",
+        type=float,
+        default=getenv_float("SCRAPER_COMMISSION_RATE", COMMISSION_RATE_DEFAULT),
+    )
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument(
+        "--rejects",
+        help="CSV for rows the database refuses (default: out/raw/<date>_backfill_rejects.csv).",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="List the files that would load.")
+    parser.add_argument("--json", action="store_true", help="Print the backfill summary as JSON.")
+    args = parser.parse_args(argv)
+    if not args.db_url and not args.dry_run:
+        parser.error("--db-url or SCRAPER_DB_URL is required unless --dry-run is given")
+
+    logger = get_logger()
+    snapshots = discover_snapshots(args.roots, args.labels, args.since, args.until)
+    if args.dry_run:
+        for snapshot in snapshots:
+            day = snapshot.snapshot_at.date().isoformat()
+            print(f"{day}  {snapshot.label:<16} {snapshot.path}")
+        logger.info("Backfill dry run files=%s", len(snapshots))
+        return 0
+
+    pool = ConnectionPool(args.db_url, max(1, args.workers))
+    stats = SourceStats("backfill")
+    started = time.perf_counter()
+    reject_path = args.rejects or snapshot_filename(DEFAULT_ROOT, "backfill_rejects", now_utc())
+    results: dict[str, dict] = {}
+    failed: List[str] = []
+    latest_rows: Optional[int] = None
+    try:
+        connection = pool.acquire()
+        markers = MarkerStore(args.markers, database_target(connection))
+        pool.release(connection)
+        pending = [s for s in snapshots if args.force or not markers.done(s)]
+        logger.info(
+            "Backfill files=%s already_loaded=%s workers=%s",
+            len(pending),
+            len(snapshots) - len(pending),
+            args.workers,
+        )
+        with RejectSink(reject_path) as rejects:
+            for snapshot, result, error in iter_results(
+                pool,
+                pending,
+                max(1, args.workers),
+                args.chunk_rows,
+                args.commission_rate,
+                rejects,
+                stats,
+            ):
+                if error is not None:
+                    failed.append(snapshot.path)
+                    logger.error("Backfill of %s failed: %s", snapshot.path, error)
+                    continue
+                markers.mark(snapshot, result)
+                results[snapshot.path] = result
+                rows = sum(r["rows"] for r in results.values())
+                logger.info(
+                    "Backfilled %s rows=%s loaded=%s seconds=%.2f (%s/%s files, %.0f rows/s)",
+                    snapshot.path,
+                    result["rows"],
+                    result["loaded"],
+                    result["seconds"],
+                    len(results) + len(failed),
+                    len(pending),
+                    rows / (time.perf_counter() - started),
+                )
+        if results and not args.skip_latest:
+            rebuild_started = time.perf_counter()
+            connection = pool.acquire()
+            try:
+                latest_rows = rebuild_latest(connection)
+            finally:
+                pool.release(connection)
+            stats.add_time("latest_rebuild", time.perf_counter() - rebuild_started)
+            logger.info("Rebuilt listings_latest rows=%s", latest_rows)
+    finally:
+        pool.close()
+
+    seconds = time.perf_counter() - started
+    rows = sum(result["rows"] for result in results.values())
+    stats.finish(not failed)
+    summary = {
+        "files": len(results),
+        "failed_files": failed,
+        "rows": rows,
+        "loaded": sum(result["loaded"] for result in results.values()),
+        "rejected": rejects.rows_written,
+        "rejects_path": reject_path if rejects.rows_written else None,
+        "latest_rows": latest_rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds else None,
+        "stats": stats.as_dict(),
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    logger.info(
+        "Backfill done files=%s failed=%s rows=%s loaded=%s rejected=%s seconds=%.2f",
+        summary["files"],
+        len(failed),
+        rows,
+        summary["loaded"],
+        summary["rejected"],
+        seconds,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,3 @@
+"""Benchmark tooling for the scraper; see the Benchmarking section of the README."""
+
+__all__ = ["enrichment", "mock_server", "runner", "segments"]
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from typing import Callable, List, Optional, Tuple
+
+from ..enrich import enrich_batch, np
+from ..utils import (
+    COMMISSION_RATE_DEFAULT,
+    ListingBatch,
+    derive_price_bucket,
+    determine_is_sold,
+    estimate_commission,
+)
+from .mock_server import Corpus, MockConfig
+
+STATUSES = ["for_sale", "for_sale", "for_sale", "sold", "Solgt", None]
+
+
+def sample_batch(count: int, seed: int) -> ListingBatch:
+    # Prices from the mock corpus, with a few missing ones as the real feeds have.
+    corpus = Corpus(MockConfig(hjem_listings=count, dnb_listings=count, seed=seed))
+    rng = random.Random(seed)
+    batch = ListingBatch()
+    for index in range(count):
+        price = corpus.hjem_listing(index)["prices"]["asking_price"]["amount"]
+        batch.append(
+            source="Hjem.no",
+            listing_id=str(index),
+            title=None,
+            address=None,
+            city=None,
+            district=None,
+            chain=None,
+            broker=None,
+            price=None if rng.random() < 0.03 else price,
+            commission_est=None,
+            status=rng.choice(STATUSES),
+            published=None,
+            property_type=None,
+            segment=None,
+            price_bucket=None,
+            broker_role=None,
+            role=None,
+            is_sold=None,
+            last_seen_at="",
+            snapshot_at="",
+        )
+    return batch
+
+
+def scalar_columns(batch: ListingBatch, rate: float) -> Tuple[list, list, list]:
+    # The per-row helpers, as normalize_listing used to call them.
+    prices = batch.columns["price"]
+    return (
+        [estimate_commission(price, rate) for price in prices],
+        [derive_price_bucket(price) for price in prices],
+        [determine_is_sold(status) for status in batch.column("status")],
+    )
+
+
+def batch_columns(batch: ListingBatch, rate: float) -> Tuple[list, list, list]:
+    enrich_batch(batch, rate)
+    return batch.column("commission_est"), batch.column("price_bucket"), batch.column("is_sold")
+
+
+def measure(fn: Callable[[], Tuple[list, list, list]], repeat: int) -> Tuple[float, tuple]:
+    timings = []
+    result: tuple = ()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmark scalar and batch price/commission/bucket/sold derivation."
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows to enrich.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per strategy; the best is kept.")
+    parser.add_argument("--rate", type=float, default=COMMISSION_RATE_DEFAULT)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args(argv)
+
+    batch = sample_batch(args.rows, args.seed)
+    strategies = {
+        "scalar": lambda: scalar_columns(batch, args.rate),
+        "enrich_batch": lambda: batch_columns(batch, args.rate),
+    }
+    results = {}
+    reference: Optional[tuple] = None
+    for name, fn in strategies.items():
+        seconds, output = measure(fn, args.repeat)
+        if reference is None:
+            reference = output
+        results[name] = {
+            "seconds": round(seconds, 4),
+            "ns_per_row": round(seconds / len(batch) * 1e9, 1),
+            "matches_reference": output == reference,
+        }
+
+    if args.json:
+        print(json.dumps({"rows": len(batch), "numpy": np is not None, "results": results}, indent=2))
+    else:
+        baseline = results["scalar"]["seconds"]
+        print(f"rows={len(batch)} numpy={np is not None}")
+        for name, result in results.items():
+            print(
+                f"{name:<14} {result['seconds']:>8.4f}s {result['ns_per_row']:>8.1f} ns/row "
+                f"x{baseline / result['seconds']:.2f} matches={result['matches_reference']}"
+            )
+    return 0 if all(result["matches_reference"] for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from ..utils import DOTNET_EPOCH_TICKS, START_2024_TS
+
+HJEM_PATH = "/search-backend/api/v4/property/search"
+DNB_PATH = "/api/v1/cognitivesearch/properties"
+
+CITIES = [
+    ("Oslo", ["0150", "0252", "0458", "0556", "0661", "0778", "0865", "0977"]),
+    ("Bergen", ["5003", "5015", "5052", "5144"]),
+    ("Trondheim", ["7010", "7030", "7048"]),
+    ("Stavanger", ["4006", "4014", "4021"]),
+    ("Drammen", ["3015", "3044"]),
+    ("Tromsø", ["9008", "9019"]),
+]
+STREETS = ["Storgata", "Kirkeveien", "Bygdøy allé", "Thereses gate", "Markveien", "Sandviksveien"]
+CHAINS = ["Krogsveen", "Privatmegleren", "EiendomsMegler 1", "Nordvik", "Obos Eiendomsmeglere", "Em1"]
+FIRST_NAMES = ["Anne", "Lars", "Ingrid", "Ola", "Kari", "Magnus", "Sofie", "Henrik", "Nora", "Jonas"]
+LAST_NAMES = ["Hansen", "Johansen", "Olsen", "Larsen", "Berg", "Haugen", "Bakke", "Lie"]
+POSITIONS = ["Eiendomsmegler", "Eiendomsmeglerfullmektig", "Partner / Megler", "Oppgjørsansvarlig"]
+HJEM_TYPES = ["apartment", "single_dwelling", "townhouse", "twin_dwelling", "plot", "farm"]
+DNB_TYPES = [24, 1, 2, 3, 7, 8]
+TITLE_WORDS = ["Lys leilighet", "Enebolig med hage", "Rekkehus", "Nybygg prosjekt", "Tomannsbolig", "Fritidsbolig"]
+
+
+@dataclass(slots=True)
+class MockConfig:
+    hjem_listings: int = 10_000
+    dnb_listings: int = 10_000
+    start_ts: int = START_2024_TS
+    end_ts: int = START_2024_TS + 2 * 365 * 24 * 3600
+    latency_ms: float = 50.0
+    latency_jitter_ms: float = 20.0
+    error_rate: float = 0.0
+    rate_limit: float = 0.0
+    retry_after: int = 1
+    seed: int = 7
+
+
+@dataclass(slots=True)
+class MockStats:
+    requests: int = 0
+    pages: int = 0
+    rows: int = 0
+    errors: int = 0
+    throttled: int = 0
+    bytes_sent: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "pages": self.pages,
+            "rows": self.rows,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "bytes_sent": self.bytes_sent,
+        }
+
+
+class Corpus:
+    # Listings are derived from (seed, index) on demand, so multi-million-row corpora cost
+    # no memory. Hjem publish dates rise monotonically with the index, which lets a
+    # publish_date window be resolved to an index range by binary search.
+
+    def __init__(self, config: MockConfig) -> None:
+        self.config = config
+
+    def rng(self, source: str, index: int) -> random.Random:
+        return random.Random(f"{self.config.seed}:{source}:{index}")
+
+    def publish_ts(self, index: int) -> int:
+        span = self.config.end_ts - self.config.start_ts
+        return self.config.start_ts + (index * span) // max(1, self.config.hjem_listings)
+
+    def hjem_range(self, publish_min: int, publish_max: int) -> tuple[int, int]:
+        lo = self._first_at_or_after(publish_min)
+        hi = self._first_at_or_after(publish_max + 1)
+        return lo, hi
+
+    def _first_at_or_after(self, ts: int) -> int:
+        lo, hi = 0, self.config.hjem_listings
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.publish_ts(mid) < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def location(self, rng: random.Random) -> tuple[str, str, str]:
+        city, codes = rng.choice(CITIES)
+        street = f"{rng.choice(STREETS)} {rng.randint(1, 120)}"
+        return street, rng.choice(codes), city
+
+    def contacts(self, rng: random.Random) -> list[tuple[str, str]]:
+        return [
+            (f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", rng.choice(POSITIONS))
+            for _ in range(rng.choice((1, 1, 1, 2, 2, 3)))
+        ]
+
+    def price(self, rng: random.Random) -> int:
+        return int(rng.lognormvariate(15.6, 0.5)) // 1000 * 1000
+
+    def hjem_listing(self, index: int) -> dict:
+        rng = self.rng("hjem", index)
+        street, postal_code, city = self.location(rng)
+        return {
+            "id": 10_000_000 + index,
+            "title": f"{rng.choice(TITLE_WORDS)} i {city}",
+            "address": {
+                "display_name": f"{street}, {postal_code} {city}",
+                "postal_place": city,
+                "postal_code": postal_code,
+            },
+            "agency": {"name": rng.choice(CHAINS)},
+            "prices": {"asking_price": {"amount": self.price(rng)}},
+            "contacts": [
+                {"type": "agent", "name": name, "position": position}
+                for name, position in self.contacts(rng)
+            ],
+            "publish_date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.publish_ts(index))),
+            "type": [rng.choice(HJEM_TYPES)],
+            "status": rng.choice(("for_sale", "for_sale", "for_sale", "sold")),
+            "images": [{"url": f"https://img.example/{index}/{n}.jpg"} for n in range(rng.randint(5, 25))],
+        }
+
+    def dnb_document(self, index: int) -> dict:
+        rng = self.rng("dnb", index)
+        street, postal_code, city = self.location(rng)
+        published = self.config.end_ts - index * 600
+        ticks = DOTNET_EPOCH_TICKS + published * 10_000_000
+        return {
+            "id": f"dnb-{index}",
+            "heading": f"{rng.choice(TITLE_WORDS)} - {street}",
+            "propertyTypeId": rng.choice(DNB_TYPES),
+            "status": rng.choice((2, 2, 2, 4)),
+            "forSaleDate": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(published)),
+            "created": None,
+            "locations": [
+                {"type": "STREET", "value": street},
+                {"type": "ZIPCODE", "value": postal_code},
+                {"type": "CITY", "value": city.upper()},
+                {"type": "COUNTRY", "value": "Norge"},
+            ],
+            "price": {"askingPrice": self.price(rng), "totalPrice": None},
+            "brokers": [{"name": name, "title": position} for name, position in self.contacts(rng)],
+            "showings": [{"start": "2025-01-12T12:00:00Z"}] if rng.random() < 0.5 else [],
+            "media": [{"lastModified": ticks, "url": f"https://img.example/dnb/{index}/{n}.jpg"} for n in range(rng.randint(5, 30))],
+        }
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: MockConfig) -> None:
+        super().__init__(address, MockHandler)
+        self.config = config
+        self.corpus = Corpus(config)
+        self.stats = MockStats()
+        self._bucket = max(1.0, config.rate_limit)
+        self._bucket_updated = time.monotonic()
+        self._random = random.Random(config.seed)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def admit(self) -> Optional[int]:
+        # Returns an HTTP error status to inject, or None to serve the page.
+        with self.stats.lock:
+            self.stats.requests += 1
+            if self.config.rate_limit > 0:
+                now = time.monotonic()
+                self._bucket = min(
+                    max(1.0, self.config.rate_limit),
+                    self._bucket + (now - self._bucket_updated) * self.config.rate_limit,
+                )
+                self._bucket_updated = now
+                if self._bucket < 1:
+                    self.stats.throttled += 1
+                    return 429
+                self._bucket -= 1
+            if self.config.error_rate and self._random.random() < self.config.error_rate:
+                self.stats.errors += 1
+                return 500
+        return None
+
+    def hjem_page(self, payload: dict) -> tuple[dict, int]:
+        size = int(payload.get("size") or 50)
+        page = max(1, int(payload.get("page") or 1))
+        lo, hi = self.corpus.hjem_range(
+            int(payload.get("publish_date_min") or self.config.start_ts),
+            int(payload.get("publish_date_max") or self.config.end_ts),
+        )
+        # Newest first, like the real endpoint's order=desc.
+        top = hi - (page - 1) * size
+        indices = range(top - 1, max(lo, top - size) - 1, -1)
+        data = [self.corpus.hjem_listing(index) for index in indices]
+        return {"data": data, "total": hi - lo}, len(data)
+
+    def dnb_page(self, payload: dict) -> tuple[dict, int]:
+        skip = max(0, int(payload.get("skip") or 0))
+        top = int(payload.get("top") or 24)
+        end = min(self.config.dnb_listings, skip + top)
+        documents = [self.corpus.dnb_document(index) for index in range(skip, end)]
+        return {"totalCount": self.config.dnb_listings, "documents": documents}, len(documents)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    server: MockServer
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:  # noqa: N802
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        config = self.server.config
+        delay = config.latency_ms + random.uniform(-config.latency_jitter_ms, config.latency_jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        if self.path == HJEM_PATH:
+            handler = self.server.hjem_page
+        elif self.path == DNB_PATH:
+            handler = self.server.dnb_page
+        else:
+            self.respond(404, {"error": "not found"})
+            return
+
+        status = self.server.admit()
+        if status == 429:
+            self.respond(429, {"error": "too many requests"}, {"Retry-After": str(config.retry_after)})
+            return
+        if status is not None:
+            self.respond(status, {"error": "injected failure"})
+            return
+
+        body, rows = handler(payload)
+        sent = self.respond(200, body)
+        with self.server.stats.lock:
+            self.server.stats.pages += 1
+            self.server.stats.rows += rows
+            self.server.stats.bytes_sent += sent
+
+    def respond(self, status: int, body: dict, headers: Optional[dict] = None) -> int:
+        raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(raw)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(raw)
+        return len(raw)
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        pass
+
+
+def start_server(config: MockConfig, host: str = "127.0.0.1", port: int = 0) -> MockServer:
+    server = MockServer((host, port), config)
+    threading.Thread(target=server.serve_forever, name="mock-server", daemon=True).start()
+    return server
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--listings", type=int, default=10_000, help="Hjem.no corpus size.")
+    parser.add_argument("--dnb-listings", type=int, help="DNB corpus size (defaults to --listings).")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mean response latency.")
+    parser.add_argument("--latency-jitter-ms", type=float, default=20.0, help="Uniform latency jitter.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500.")
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=0.0,
+        help="Requests/second accepted before answering 429 with Retry-After (0 = unlimited).",
+    )
+    parser.add_argument("--seed", type=int, default=7, help="Corpus seed.")
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(
+        hjem_listings=args.listings,
+        dnb_listings=args.dnb_listings if args.dnb_listings is not None else args.listings,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        seed=args.seed,
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Local stand-in for the Hjem.no and DNB search APIs.")
+    add_config_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = MockServer((args.host, args.port), config_from_args(args))
+    print(f"SCRAPER_HJEM_URL={server.base_url}{HJEM_PATH}")
+    print(f"SCRAPER_DNB_URL={server.base_url}{DNB_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats.as_dict()))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from .mock_server import DNB_PATH, HJEM_PATH, add_config_arguments, config_from_args, start_server
+
+
+def peak_child_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def scraper_command(args: argparse.Namespace, workdir: str, start_ts: int, end_ts: int) -> List[str]:
+    command = [
+        sys.executable,
+        "-m",
+        "scraper.run",
+        "--full",
+        "--from",
+        str(start_ts),
+        "--to",
+        str(end_ts),
+        "--out",
+        os.path.join(workdir, "raw"),
+        "--state",
+        os.path.join(workdir, "state", "watermarks.json"),
+        "--checkpoint-dir",
+        os.path.join(workdir, "checkpoints"),
+    ]
+    command += [f"--{source}" for source in args.sources]
+    if args.db_url:
+        command += ["--db-url", args.db_url]
+    if args.sequential:
+        command.append("--sequential")
+    return command
+
+
+def scraper_env(args: argparse.Namespace, base_url: str) -> dict[str, str]:
+    env = dict(os.environ)
+    env["SCRAPER_HJEM_URL"] = base_url + HJEM_PATH
+    env["SCRAPER_DNB_URL"] = base_url + DNB_PATH
+    env["SCRAPER_RATE"] = str(args.rate)
+    env["SCRAPER_MAX_RATE"] = str(args.max_rate)
+    env["SCRAPER_CONCURRENCY"] = str(args.concurrency)
+    if not args.db_url:
+        # Keep a SCRAPER_DB_URL from the caller's shell from loading benchmark rows.
+        env.pop("SCRAPER_DB_URL", None)
+    src_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src_root, env.get("PYTHONPATH")]))
+    return env
+
+
+def load_summary(workdir: str) -> Optional[dict]:
+    paths = sorted(glob.glob(os.path.join(workdir, "raw", "*_run_summary.json")))
+    if not paths:
+        return None
+    with open(paths[-1], encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def stage_seconds(source: dict, *stages: str) -> float:
+    return sum(source["stages"].get(stage, {}).get("seconds", 0.0) for stage in stages)
+
+
+def run_benchmark(args: argparse.Namespace) -> dict:
+    config = config_from_args(args)
+    server = start_server(config)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="scraper-bench-")
+    command = scraper_command(args, workdir, config.start_ts, config.end_ts)
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        env=scraper_env(args, server.base_url),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    assert process.stdout is not None
+    for line in process.stdout:
+        if args.verbose:
+            sys.stderr.write(line)
+    returncode = process.wait()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    summary = load_summary(workdir) or {"sources": {}}
+    sources = summary["sources"]
+    rows = {name: source["counters"].get("rows", 0) for name, source in sources.items()}
+    db_seconds = sum(stage_seconds(source, "db_copy", "db_insert", "db_commit") for source in sources.values())
+    stats = server.stats.as_dict()
+    return {
+        "command": command,
+        "workdir": workdir,
+        "returncode": returncode,
+        "corpus": {"hjem": config.hjem_listings, "dnb": config.dnb_listings},
+        "seconds": round(elapsed, 3),
+        "server": stats,
+        "rows": rows,
+        "pages_per_second": round(stats["pages"] / elapsed, 2) if elapsed else None,
+        "rows_per_second": round(sum(rows.values()) / elapsed, 2) if elapsed else None,
+        "db_seconds": round(db_seconds, 3),
+        "peak_rss_mb": round(peak_child_rss_mb(), 1),
+        "summary": summary,
+    }
+
+
+def print_report(result: dict) -> None:
+    print(f"corpus         hjem={result['corpus']['hjem']} dnb={result['corpus']['dnb']}")
+    print(f"exit code      {result['returncode']}")
+    print(f"wall time      {result['seconds']:.2f}s")
+    server = result["server"]
+    print(
+        f"server         pages={server['pages']} rows={server['rows']} "
+        f"429s={server['throttled']} errors={server['errors']} mb={server['bytes_sent'] / 1e6:.1f}"
+    )
+    for source, rows in result["rows"].items():
+        print(f"scraped        {source} rows={rows}")
+    print(f"pages/s        {result['pages_per_second']}")
+    print(f"rows/s         {result['rows_per_second']}")
+    for name, source in result["summary"]["sources"].items():
+        stages = " ".join(
+            f"{stage}={timing['seconds']:.2f}s" for stage, timing in source["stages"].items()
+        )
+        print(f"stages         {name} wall={source['wall_seconds']:.2f}s {stages}")
+    if result["db_seconds"]:
+        print(f"db load        {result['db_seconds']:.2f}s")
+    print(f"peak rss       {result['peak_rss_mb']} MB")
+    print(f"output         {result['workdir']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Run the scraper end to end against the local mock server and report throughput."
+    )
+    add_config_arguments(parser)
+    parser.add_argument(
+        "--source",
+        dest="sources",
+        action="append",
+        choices=["hjem", "dnb"],
+        help="Source to scrape (repeatable; default both).",
+    )
+    parser.add_argument("--rate", type=float, default=50.0, help="Starting SCRAPER_RATE for the run.")
+    parser.add_argument("--max-rate", type=float, default=200.0, help="SCRAPER_MAX_RATE for the run.")
+    parser.add_argument("--concurrency", type=int, default=8, help="SCRAPER_CONCURRENCY for the run.")
+    parser.add_argument("--db-url", help="Also load rows into this Postgres database.")
+    parser.add_argument("--sequential", action="store_true", help="Scrape sources one after another.")
+    parser.add_argument("--workdir", help="Keep outputs here instead of a temporary directory.")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON.")
+    parser.add_argument("--verbose", action="store_true", help="Echo scraper logs to stderr.")
+    args = parser.parse_args(argv)
+    args.sources = args.sources or ["hjem", "dnb"]
+
+    result = run_benchmark(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+    return result["returncode"]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from ..utils import SEGMENT_ALIASES, classify_segments, derive_segment, map_dnb_type, map_hjem_type
+from .mock_server import Corpus, MockConfig
+
+# Titles without any segment keyword, so the benchmark also covers full misses.
+PLAIN_TITLES = [
+    "Stor villa med utsikt over fjorden",
+    "Sjarmerende bolig i rolig strøk",
+    "Penthouse med takterrasse",
+    "Innholdsrik eiendom nær sentrum",
+    "Hytte ved sjøen med egen brygge",
+]
+
+Rows = List[Tuple[Optional[str], Optional[str]]]
+
+
+def legacy_derive_segment(property_type: Optional[str], title: Optional[str]) -> Optional[str]:
+    # The original per-row implementation, kept as the reference.
+    for value in (property_type, title):
+        if not value:
+            continue
+        lowered = value.lower()
+        for key, segment in SEGMENT_ALIASES.items():
+            if key in lowered:
+                return segment
+    return property_type or None
+
+
+def regex_classify(
+    property_types: Sequence[Optional[str]],
+    titles: Sequence[Optional[str]],
+) -> List[Optional[str]]:
+    # One alternation over every alias with a lookahead so overlapping matches are all
+    # seen, keeping SEGMENT_ALIASES order as the priority.
+    rank = {key: index for index, key in enumerate(SEGMENT_ALIASES)}
+    segments = list(SEGMENT_ALIASES.values())
+    pattern = re.compile("(?=(" + "|".join(re.escape(key) for key in SEGMENT_ALIASES) + "))")
+
+    def best(value: Optional[str]) -> Optional[str]:
+        if not value:
+            return None
+        ranks = [rank[match.group(1)] for match in pattern.finditer(value.lower())]
+        return segments[min(ranks)] if ranks else None
+
+    return [
+        best(property_type) or best(title) or property_type or None
+        for property_type, title in zip(property_types, titles)
+    ]
+
+
+def sample_rows(count: int, seed: int) -> Rows:
+    corpus = Corpus(MockConfig(hjem_listings=count, dnb_listings=count, seed=seed))
+    rng = random.Random(seed)
+    rows: Rows = []
+    index = 0
+    while len(rows) < count:
+        if index % 2:
+            doc = corpus.dnb_document(index)
+            property_type, title = map_dnb_type(doc["propertyTypeId"]), doc["heading"]
+            brokers = len(doc["brokers"]) or 1
+        else:
+            hit = corpus.hjem_listing(index)
+            property_type, title = map_hjem_type(hit["type"]), hit["title"]
+            brokers = len(hit["contacts"]) or 1
+        if rng.random() < 0.3:
+            property_type = "Annet"
+        if rng.random() < 0.3:
+            title = rng.choice(PLAIN_TITLES)
+        # One row per broker, like the normalizers emit.
+        rows.extend([(property_type, title)] * brokers)
+        index += 1
+    return rows[:count]
+
+
+def measure(
+    fn: Callable[[], List[Optional[str]]],
+    repeat: int,
+) -> Tuple[float, List[Optional[str]]]:
+    timings = []
+    result: List[Optional[str]] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmark segment classification strategies.")
+    parser.add_argument("--rows", type=int, default=200_000, help="Rows to classify.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per strategy; the best is kept.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args(argv)
+
+    rows = sample_rows(args.rows, args.seed)
+    property_types = [row[0] for row in rows]
+    titles = [row[1] for row in rows]
+    strategies = {
+        "legacy_loop": lambda: [legacy_derive_segment(pt, title) for pt, title in rows],
+        "derive_segment": lambda: [derive_segment(pt, title) for pt, title in rows],
+        "regex_alternation": lambda: regex_classify(property_types, titles),
+        "classify_segments": lambda: classify_segments(property_types, titles),
+    }
+
+    results = {}
+    reference: Optional[List[Optional[str]]] = None
+    for name, fn in strategies.items():
+        seconds, output = measure(fn, args.repeat)
+        if reference is None:
+            reference = output
+        results[name] = {
+            "seconds": round(seconds, 4),
+            "ns_per_row": round(seconds / len(rows) * 1e9, 1),
+            "matches_reference": output == reference,
+        }
+
+    if args.json:
+        print(json.dumps({"rows": len(rows), "results": results}, indent=2))
+    else:
+        baseline = results["legacy_loop"]["seconds"]
+        print(f"rows={len(rows)}")
+        for name, result in results.items():
+            print(
+                f"{name:<20} {result['seconds']:>8.4f}s {result['ns_per_row']:>8.1f} ns/row "
+                f"x{baseline / result['seconds']:.2f} matches={result['matches_reference']}"
+            )
+    return 0 if all(result["matches_reference"] for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
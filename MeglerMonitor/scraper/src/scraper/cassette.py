@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+CASSETTE_MODES = ("passthrough", "record", "replay")
+DEFAULT_CASSETTE_DIR = "out/cassettes"
+
+
+class CassetteMiss(requests.ConnectionError):
+    pass
+
+
+def request_key(method: str, url: str, body: Optional[bytes | str]) -> str:
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    digest = hashlib.sha256()
+    digest.update(method.upper().encode("ascii"))
+    digest.update(b" ")
+    digest.update(url.encode("utf-8"))
+    digest.update(b"\n")
+    digest.update(body or b"")
+    return digest.hexdigest()
+
+
+class CassetteAdapter(HTTPAdapter):
+    # Stores every request/response pair as one gzipped JSON file named after the hash of
+    # method, URL and payload. One file per interaction keeps concurrent workers from
+    # contending on a shared archive and lets cassettes be diffed or pruned per request.
+
+    def __init__(self, mode: str, directory: str, **kwargs) -> None:
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}; expected one of {CASSETTE_MODES}")
+        super().__init__(**kwargs)
+        self.mode = mode
+        self.directory = directory
+        if mode == "record":
+            os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if self.mode == "passthrough":
+            return super().send(request, **kwargs)
+
+        key = request_key(request.method or "GET", request.url or "", request.body)
+        path = self.path_for(key)
+        if self.mode == "replay":
+            if not os.path.exists(path):
+                raise CassetteMiss(f"No recorded response for {request.method} {request.url} ({key})")
+            with gzip.open(path, "rt", encoding="utf-8") as handle:
+                return self.build_replayed(request, json.load(handle))
+
+        response = super().send(request, **kwargs)
+        entry = {
+            "method": request.method,
+            "url": request.url,
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": dict(response.headers),
+            "body": base64.b64encode(response.content).decode("ascii"),
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as handle:
+            json.dump(entry, handle)
+        os.replace(tmp_path, path)
+        return response
+
+    def build_replayed(self, request: requests.PreparedRequest, entry: dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry.get("reason")
+        response.headers = CaseInsensitiveDict(entry.get("headers") or {})
+        # The recorded body is already decoded; drop encodings that no longer apply.
+        response.headers.pop("Content-Encoding", None)
+        response.headers.pop("Transfer-Encoding", None)
+        response._content = base64.b64decode(entry["body"])
+        response.url = entry.get("url") or request.url
+        response.request = request
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+from datetime import UTC, datetime
+from typing import Optional
+
+from .utils import ListingBatch, ensure_dir, isoformat, parse_datetime
+
+DEFAULT_CHECKPOINT_DIR = "out/checkpoints"
+
+
+def new_run_id(snapshot_at: datetime) -> str:
+    return snapshot_at.astimezone(UTC).strftime("%Y%m%dT%H%M%SZ")
+
+
+class SourceCheckpoint:
+    # Append-only JSONL log of completed units (a DNB skip window, a Hjem slice, ...).
+    # Each line holds the unit key, its cursor and the normalized batch it produced. Only
+    # cursors and file offsets stay in memory; batches are read back one unit at a time.
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._cursors: dict[str, dict] = {}
+        self._offsets: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.incomplete = False
+        if os.path.exists(path):
+            with open(path, "rb") as handle:
+                offset = 0
+                for line in handle:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash is simply redone.
+                        entry = None
+                    if entry:
+                        self._cursors[entry["unit"]] = entry.get("cursor") or {}
+                        self._offsets[entry["unit"]] = offset
+                    offset += len(line)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __contains__(self, unit: str) -> bool:
+        return unit in self._offsets
+
+    def cursor(self, unit: str) -> Optional[dict]:
+        return self._cursors.get(unit)
+
+    def batch(self, unit: str) -> Optional[ListingBatch]:
+        offset = self._offsets.get(unit)
+        if offset is None:
+            return None
+        with open(self.path, "rb") as handle:
+            handle.seek(offset)
+            entry = json.loads(handle.readline())
+        return ListingBatch.from_json(entry["batch"]) if entry.get("batch") else None
+
+    def mark_incomplete(self) -> None:
+        # Some unit failed for good; the run must keep its checkpoint so --resume can retry it.
+        self.incomplete = True
+
+    def record(
+        self,
+        unit: str,
+        batch: Optional[ListingBatch] = None,
+        cursor: Optional[dict] = None,
+    ) -> None:
+        entry = {
+            "unit": unit,
+            "cursor": cursor or {},
+            "batch": batch.to_json() if batch is not None else None,
+        }
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            with open(self.path, "ab") as handle:
+                offset = handle.tell()
+                handle.write(line)
+                handle.flush()
+                os.fsync(handle.fileno())
+            self._cursors[unit] = entry["cursor"]
+            self._offsets[unit] = offset
+
+
+class RunCheckpoint:
+    def __init__(self, root: str, run_id: str, snapshot_at: datetime) -> None:
+        self.root = root
+        self.run_id = run_id
+        self.snapshot_at = snapshot_at
+        self.directory = os.path.join(root, run_id)
+        self._sources: dict[str, SourceCheckpoint] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, root: str, snapshot_at: datetime) -> "RunCheckpoint":
+        checkpoint = cls(root, new_run_id(snapshot_at), snapshot_at)
+        ensure_dir(checkpoint.directory)
+        with open(os.path.join(checkpoint.directory, "meta.json"), "w", encoding="utf-8") as handle:
+            json.dump({"run_id": checkpoint.run_id, "snapshot_at": isoformat(snapshot_at)}, handle)
+        return checkpoint
+
+    @classmethod
+    def resume(cls, root: str, run_id: str) -> "RunCheckpoint":
+        meta_path = os.path.join(root, run_id, "meta.json")
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"No checkpoint found for run id {run_id} under {root}")
+        with open(meta_path, encoding="utf-8") as handle:
+            meta = json.load(handle)
+        snapshot_at = parse_datetime(meta.get("snapshot_at"))
+        if snapshot_at is None:
+            raise ValueError(f"Checkpoint {run_id} has no valid snapshot_at")
+        return cls(root, run_id, snapshot_at)
+
+    def source(self, name: str) -> SourceCheckpoint:
+        with self._lock:
+            if name not in self._sources:
+                self._sources[name] = SourceCheckpoint(os.path.join(self.directory, f"{name}.jsonl"))
+            return self._sources[name]
+
+    def discard(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
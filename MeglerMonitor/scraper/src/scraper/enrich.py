@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import glob
+import os
+from array import array
+from typing import Iterator, List, Optional, Sequence
+
+from .utils import (
+    COMMISSION_RATE_DEFAULT,
+    LISTING_COLUMNS,
+    PRICE_BUCKETS,
+    ListingBatch,
+    classify_segments,
+    clean_price,
+    determine_is_sold,
+    derive_price_bucket,
+    ensure_dir,
+    estimate_commission,
+    get_logger,
+    getenv_float,
+)
+
+try:
+    import numpy as np
+except ImportError:  # optional speed-up, install with the "fast" extra
+    np = None
+
+# Batch versions of the per-row price, commission, bucket and sold-flag helpers. With NumPy
+# they run as array kernels over a whole page or batch; without it they fall back to the
+# scalar helpers. Either way the output equals the scalar helpers row for row: any value a
+# kernel cannot reproduce exactly (a price or commission outside int64, a non-finite rate)
+# is handed to the scalar helper instead.
+INT64_LIMIT = 2.0**63
+# Doubles hold every integer up to 2**53 exactly; larger prices take the scalar path.
+EXACT_LIMIT = 2.0**53
+PRICE_TYPES = frozenset({int, float, type(None)})
+DEFAULT_CHUNK_ROWS = 100_000
+
+Rate = float | Sequence[float]
+
+
+def price_array(prices: Sequence[object]):
+    # (values, exact) with None as NaN and `exact` marking the prices a double holds
+    # exactly, or None when the kernels cannot reproduce the scalar helpers for this input.
+    if np is None or not len(prices) or not set(map(type, prices)) <= PRICE_TYPES:
+        return None
+    try:
+        values = np.array(prices, dtype=np.float64)
+    except OverflowError:
+        return None
+    with np.errstate(invalid="ignore"):
+        exact = np.abs(values) <= EXACT_LIMIT
+    return values, exact
+
+
+def clean_prices(values: Sequence[object]) -> List[Optional[int]]:
+    # Ints pass straight through; strings and floats need clean_price's parsing rules.
+    return [value if type(value) is int else clean_price(value) for value in values]
+
+
+def commission_kernel(prices: Sequence[Optional[int]], parsed, rate: Rate) -> List[Optional[int]]:
+    per_row = not isinstance(rate, (int, float))
+    if per_row and len(rate) != len(prices):
+        raise ValueError(f"Got {len(rate)} commission rates for {len(prices)} prices")
+    if parsed is None:
+        if per_row:
+            return [estimate_commission(price, row_rate) for price, row_rate in zip(prices, rate)]
+        return [estimate_commission(price, rate) for price in prices]
+    values, exact = parsed
+    rate_array = np.asarray(rate, dtype=np.float64) if per_row else np.float64(rate)
+    # int * float in Python converts the int to the nearest double first, exactly like the
+    # float64 price array; np.rint rounds half to even, like round().
+    with np.errstate(invalid="ignore", over="ignore"):
+        rounded = np.rint(values * rate_array)
+        fast = exact & (rate_array > 0) & (np.abs(rounded) < INT64_LIMIT)
+    result: List[Optional[int]] = np.where(fast, rounded, 0).astype(np.int64).tolist()
+    missing = np.isnan(values)
+    for index in np.flatnonzero(missing).tolist():
+        result[index] = None
+    for index in np.flatnonzero(~fast & ~missing).tolist():
+        result[index] = estimate_commission(prices[index], rate[index] if per_row else rate)
+    return result
+
+
+def estimate_commissions(prices: Sequence[Optional[int]], rate: Rate) -> List[Optional[int]]:
+    return commission_kernel(prices, price_array(prices), rate)
+
+
+def bucket_kernel(prices: Sequence[Optional[int]], parsed):
+    # (labels, codes) with code 0 meaning no bucket, or None when the kernel cannot be used.
+    # searchsorted needs the buckets sorted and disjoint; the scalar loop does not.
+    ordered = all(upper is None or lower < upper for lower, upper, _ in PRICE_BUCKETS) and all(
+        upper is not None and upper <= next_lower
+        for (_, upper, _), (next_lower, _, _) in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:])
+    )
+    if parsed is None or not ordered:
+        return None
+    values, exact = parsed
+    lowers = np.array([lower for lower, _, _ in PRICE_BUCKETS], dtype=np.float64)
+    uppers = np.array([upper or 0 for _, upper, _ in PRICE_BUCKETS], dtype=np.float64)
+    unbounded = np.array([upper is None for _, upper, _ in PRICE_BUCKETS], dtype=bool)
+    index = np.searchsorted(lowers, np.where(exact, values, 0), side="right") - 1
+    clipped = np.clip(index, 0, None)
+    hit = exact & (values > 0) & (index >= 0) & (unbounded[clipped] | (values < uppers[clipped]))
+    labels = [None] + [label for _, _, label in PRICE_BUCKETS]
+    codes = np.where(hit, clipped + 1, 0)
+    for position in np.flatnonzero(~exact & ~np.isnan(values)).tolist():
+        codes[position] = labels.index(derive_price_bucket(prices[position]))
+    return labels, codes
+
+
+def derive_price_buckets(prices: Sequence[Optional[int]]) -> List[Optional[str]]:
+    encoded = bucket_kernel(prices, price_array(prices))
+    if encoded is None:
+        return [derive_price_bucket(price) for price in prices]
+    labels, codes = encoded
+    return np.array(labels, dtype=object)[codes].tolist()
+
+
+def determine_sold_flags(statuses: Sequence[Optional[str]]) -> List[bool]:
+    # Statuses are a handful of distinct strings, so each one is classified once.
+    flags = {status: determine_is_sold(status) for status in set(statuses)}
+    return [flags[status] for status in statuses]
+
+
+def classify_batch(batch: ListingBatch) -> ListingBatch:
+    # Fills in the segment of the rows that have none from property_type and title. The
+    # collectors leave segment to this, so each distinct type and title is matched once.
+    if not batch or None not in batch.dictionaries["segment"]:
+        return batch
+    segments = batch.column("segment")
+    missing = [index for index, segment in enumerate(segments) if segment is None]
+    property_types = batch.column("property_type")
+    titles = batch.columns["title"]
+    derived = classify_segments(
+        [property_types[index] for index in missing], [titles[index] for index in missing]
+    )
+    for index, segment in zip(missing, derived):
+        segments[index] = segment
+    batch.set_column("segment", segments)
+    return batch
+
+
+def set_codes(batch: ListingBatch, name: str, dictionary: list, codes) -> None:
+    # Keeps only the dictionary entries in use, so batch.distinct() stays exact.
+    used = np.flatnonzero(np.bincount(codes, minlength=len(dictionary)))
+    remap = np.zeros(len(dictionary), dtype=np.intc)
+    remap[used] = np.arange(len(used), dtype=np.intc)
+    compact = [dictionary[code] for code in used.tolist()]
+    batch.set_encoded(name, compact, array("i", remap[codes].astype(np.intc).tobytes()))
+
+
+def enrich_batch(
+    batch: ListingBatch,
+    commission_rate: Rate = COMMISSION_RATE_DEFAULT,
+) -> ListingBatch:
+    # Derives commission_est, price_bucket and is_sold from the price and status columns.
+    if not batch:
+        return batch
+    prices = batch.columns["price"]
+    parsed = price_array(prices)
+    batch.set_column("commission_est", commission_kernel(prices, parsed, commission_rate))
+    status_flags = [determine_is_sold(status) for status in batch.dictionaries["status"]]
+    encoded = bucket_kernel(prices, parsed)
+    if encoded is None:
+        batch.set_column("price_bucket", [derive_price_bucket(price) for price in prices])
+        batch.set_column("is_sold", [status_flags[code] for code in batch.columns["status"]])
+        return batch
+    labels, codes = encoded
+    set_codes(batch, "price_bucket", labels, codes)
+    status_codes = np.frombuffer(batch.columns["status"], dtype=np.intc)
+    sold = np.array(status_flags, dtype=bool)[status_codes].astype(np.intc)
+    set_codes(batch, "is_sold", [False, True], sold)
+    return batch
+
+
+def read_csv_batches(path: str, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[ListingBatch]:
+    with open(path, newline="", encoding="utf-8") as handle:
+        reader = csv.reader(handle)
+        header = next(reader, None)
+        if header != LISTING_COLUMNS:
+            raise ValueError(f"{path} does not have the listing snapshot header")
+        chunk: List[List[str]] = []
+        for record in reader:
+            chunk.append(record)
+            if len(chunk) >= chunk_rows:
+                yield csv_batch(chunk)
+                chunk = []
+        if chunk:
+            yield csv_batch(chunk)
+
+
+def csv_batch(records: List[List[str]]) -> ListingBatch:
+    # Columns other than price keep their CSV text, so they are written back unchanged.
+    columns = dict(zip(LISTING_COLUMNS, (list(values) for values in zip(*records))))
+    columns["price"] = clean_prices(columns["price"])
+    return ListingBatch.from_columns(columns)
+
+
+def rederive_csv(
+    path: str,
+    out_path: str,
+    commission_rate: Rate = COMMISSION_RATE_DEFAULT,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> int:
+    # Re-derives the price-dependent columns of a CSV snapshot with the current rules.
+    ensure_dir(os.path.dirname(out_path) or ".")
+    tmp_path = f"{out_path}.tmp"
+    rows = 0
+    with open(tmp_path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(LISTING_COLUMNS)
+        for batch in read_csv_batches(path, chunk_rows):
+            enrich_batch(batch, commission_rate)
+            writer.writerows(batch.tuples())
+            rows += len(batch)
+    os.replace(tmp_path, out_path)
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Re-derive commission, price bucket and sold flag in CSV snapshots."
+    )
+    parser.add_argument("paths", nargs="+", help="Snapshot CSV files or glob patterns.")
+    parser.add_argument(
+        "--commission-rate",
+        type=float,
+        default=getenv_float("SCRAPER_COMMISSION_RATE", COMMISSION_RATE_DEFAULT),
+    )
+    parser.add_argument("--out", help="Write re-derived files here instead of in place.")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    logger = get_logger()
+    paths = sorted({path for pattern in args.paths for path in glob.glob(pattern) or [pattern]})
+    failed = 0
+    for path in paths:
+        out_path = os.path.join(args.out, os.path.basename(path)) if args.out else path
+        try:
+            rows = rederive_csv(path, out_path, args.commission_rate, args.chunk_rows)
+        except Exception as exc:  # noqa: BLE001
+            failed += 1
+            logger.exception("Failed to re-derive %s: %s", path, exc)
+            continue
+        logger.info("Re-derived %s rows=%s -> %s", path, rows, out_path)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Iterable, Iterator, Optional, Tuple, TypeVar
+
+import requests
+
+from . import profiling
+from .ratelimit import AdaptiveRateLimiter
+from .stats import SourceStats
+from .utils import decode_json
+
+K = TypeVar("K")
+R = TypeVar("R")
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_ATTEMPTS = 3
+REQUEST_TIMEOUT = 30
+
+
+def post_json(
+    session: requests.Session,
+    url: str,
+    payload: dict,
+    limiter: AdaptiveRateLimiter,
+    headers: Optional[dict] = None,
+    stats: Optional[SourceStats] = None,
+) -> dict:
+    waited = time.perf_counter()
+    limiter.acquire()
+    with profiling.stage("fetch"):
+        started = time.perf_counter()
+        try:
+            response = session.post(url, headers=headers, json=payload, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as exc:
+            limiter.observe_error(exc)
+            if stats is not None:
+                stats.add("requests")
+                stats.add("http_errors")
+            raise
+        latency = time.perf_counter() - started
+        limiter.observe_response(response, latency)
+        if stats is not None:
+            stats.add_time("rate_limit_wait", started - waited)
+            stats.add_time("http", latency)
+            stats.observe("request_latency_seconds", latency)
+            stats.add("requests")
+            stats.add("bytes", len(response.content))
+            retries = getattr(getattr(response, "raw", None), "retries", None)
+            stats.add("transport_retries", len(getattr(retries, "history", None) or ()))
+            if response.status_code >= 400:
+                stats.add("http_errors")
+        response.raise_for_status()
+        if stats is None:
+            return decode_json(response.content)
+        with stats.timer("decode"):
+            data = decode_json(response.content)
+        stats.add("pages")
+        return data
+
+
+def fetch_ordered(
+    fetch: Callable[[K], R],
+    keys: Iterable[K],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    is_last: Callable[[R], bool] | None = None,
+) -> Iterator[Tuple[K, R]]:
+    # Keeps up to ``concurrency`` requests in flight and yields results in key order.
+    # ``keys`` may be unbounded; iteration stops after the first result for which
+    # ``is_last`` is true, so at most ``concurrency - 1`` surplus pages are requested.
+    concurrency = max(1, concurrency)
+    key_iter = iter(keys)
+    pending: Deque[Tuple[K, Future]] = deque()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="fetch") as pool:
+
+        def submit_next() -> bool:
+            try:
+                key = next(key_iter)
+            except StopIteration:
+                return False
+            pending.append((key, pool.submit(fetch, key)))
+            return True
+
+        try:
+            while len(pending) < concurrency and submit_next():
+                pass
+            while pending:
+                key, future = pending.popleft()
+                result = future.result()
+                yield key, result
+                if is_last is not None and is_last(result):
+                    break
+                submit_next()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def fetch_unordered(
+    fetch: Callable[[K], R],
+    keys: Iterable[K],
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> Iterator[Tuple[K, R]]:
+    # Yields results as soon as they complete, so one slow key never holds back the rest.
+    # Only ``concurrency`` keys are submitted at a time; a slow consumer therefore pauses
+    # fetching instead of piling finished pages up in memory.
+    concurrency = max(1, concurrency)
+    key_iter = iter(keys)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="fetch") as pool:
+        pending: dict[Future, K] = {}
+
+        def submit_next() -> bool:
+            try:
+                key = next(key_iter)
+            except StopIteration:
+                return False
+            pending[pool.submit(fetch, key)] = key
+            return True
+
+        try:
+            while len(pending) < concurrency and submit_next():
+                pass
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = pending.pop(future)
+                    yield key, future.result()
+                    submit_next()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def retry_call(
+    fn: Callable[[], R],
+    logger: logging.Logger,
+    label: str,
+    attempts: int = DEFAULT_ATTEMPTS,
+    backoff: float = 1.0,
+    stats: Optional[SourceStats] = None,
+) -> R:
+    for attempt in range(1, attempts + 1):
+        try:
+            return fn()
+        except Exception as exc:  # noqa: BLE001
+            if attempt >= attempts:
+                raise
+            if stats is not None:
+                stats.add("retries")
+            delay = backoff * 2 ** (attempt - 1)
+            logger.warning(
+                "%s failed (attempt %s/%s), retrying in %.1fs: %s", label, attempt, attempts, delay, exc
+            )
+            time.sleep(delay)
+    raise RuntimeError("unreachable")
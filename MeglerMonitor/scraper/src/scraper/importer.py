@@ -0,0 +1,463 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import time
+from typing import IO, Iterator, List, Optional, Sequence
+
+import psycopg
+
+from .enrich import classify_batch, clean_prices, enrich_batch
+from .loader import DEFAULT_CHUNK_ROWS, RejectSink, insert_rows
+from .stats import SourceStats
+from .utils import (
+    COMMISSION_RATE_DEFAULT,
+    LISTING_COLUMNS,
+    ListingBatch,
+    connect_db,
+    decode_json,
+    get_logger,
+    getenv,
+    getenv_float,
+    isoformat,
+    now_utc,
+    parse_datetime,
+    snapshot_filename,
+)
+
+# Loads CSV, JSON or NDJSON listing snapshots into Postgres through the same COPY loader as
+# the scraper. Files are parsed in chunks, cleaned column by column and handed to
+# insert_rows, so memory stays bounded by --chunk-rows whatever the file size.
+FORMATS = ("csv", "json", "ndjson")
+EXTENSIONS = {".csv": "csv", ".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+TIMESTAMP_COLUMNS = ("published", "last_seen_at", "snapshot_at")
+# Derived from price and status by enrich_batch with the current rules. Values a snapshot
+# already has are kept unless the import asks to re-derive them.
+DERIVED_COLUMNS = ("commission_est", "price_bucket", "is_sold")
+# is_sold as JSON, Python's csv module or Postgres' COPY writes it.
+FLAGS = {"true": True, "t": True, "1": True, "false": False, "f": False, "0": False}
+JSON_BLOCK_SIZE = 1 << 20
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+DEFAULT_OUT_DIR = "out/raw"
+PROGRESS_SECONDS = 5.0
+
+
+def detect_format(path: str, fmt: Optional[str] = None) -> str:
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXTENSIONS:
+        raise ValueError(f"Cannot tell the format of {path}; pass --format")
+    return EXTENSIONS[extension]
+
+
+def iter_json_array(handle: IO[str], block_size: int = JSON_BLOCK_SIZE) -> Iterator[object]:
+    # Yields the items of a top-level JSON array while reading the file block by block.
+    decoder = json.JSONDecoder()
+    buffer = ""
+    index = 0
+    eof = False
+    opened = False
+    first = True
+    after_value = False
+    while True:
+        index = WHITESPACE.match(buffer, index).end()
+        if index >= len(buffer):
+            if eof:
+                raise ValueError("Truncated JSON array" if opened else "Empty JSON file")
+            block = handle.read(block_size)
+            eof = not block
+            buffer, index = buffer[index:] + block, 0
+            continue
+        char = buffer[index]
+        if not opened:
+            if char != "[":
+                raise ValueError("Expected a JSON array of listings")
+            opened = True
+            index += 1
+            continue
+        if after_value:
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or ']' in JSON array, got {char!r}")
+            index += 1
+            after_value = False
+            continue
+        if first and char == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, index)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            block = handle.read(block_size)
+            eof = not block
+            buffer, index = buffer[index:] + block, 0
+            continue
+        first = False
+        after_value = True
+        index = end
+        yield item
+
+
+def record_columns(records: List[dict]) -> dict[str, list]:
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError(f"Expected listing objects, got {type(record).__name__}")
+    return {name: [record.get(name) for record in records] for name in LISTING_COLUMNS}
+
+
+def read_json_chunks(path: str, chunk_rows: int) -> Iterator[dict[str, list]]:
+    with open(path, encoding="utf-8") as handle:
+        chunk: List[dict] = []
+        for item in iter_json_array(handle):
+            chunk.append(item)
+            if len(chunk) >= chunk_rows:
+                yield record_columns(chunk)
+                chunk = []
+        if chunk:
+            yield record_columns(chunk)
+
+
+def read_ndjson_chunks(path: str, chunk_rows: int) -> Iterator[dict[str, list]]:
+    with open(path, "rb") as handle:
+        chunk: List[dict] = []
+        for line in handle:
+            if not line.strip():
+                continue
+            chunk.append(decode_json(line))
+            if len(chunk) >= chunk_rows:
+                yield record_columns(chunk)
+                chunk = []
+        if chunk:
+            yield record_columns(chunk)
+
+
+def read_csv_chunks(path: str, chunk_rows: int) -> Iterator[dict[str, list]]:
+    # Any subset of the listing columns, in any order; unknown columns are ignored.
+    with open(path, newline="", encoding="utf-8") as handle:
+        reader = csv.reader(handle)
+        header = [name.strip() for name in next(reader, None) or []]
+        if "listing_id" not in header:
+            raise ValueError(f"{path} has no listing_id column")
+        width = len(header)
+        positions = [(name, header.index(name)) for name in LISTING_COLUMNS if name in header]
+
+        def columns(records: List[List[str]]) -> dict[str, list]:
+            padded = (
+                record if len(record) == width else (record + [""] * width)[:width]
+                for record in records
+            )
+            values = list(zip(*padded))
+            return {name: list(values[position]) for name, position in positions}
+
+        chunk: List[List[str]] = []
+        for record in reader:
+            chunk.append(record)
+            if len(chunk) >= chunk_rows:
+                yield columns(chunk)
+                chunk = []
+        if chunk:
+            yield columns(chunk)
+
+
+READERS = {"csv": read_csv_chunks, "json": read_json_chunks, "ndjson": read_ndjson_chunks}
+
+
+def clean_text(values: Sequence[object]) -> List[Optional[str]]:
+    # Strips whitespace and turns empty strings into NULL; numbers become their text.
+    return [
+        (value.strip() or None)
+        if type(value) is str
+        else (None if value is None else str(value))
+        for value in values
+    ]
+
+
+def clean_timestamps(values: Sequence[Optional[str]]) -> List[Optional[str]]:
+    # A snapshot repeats a handful of timestamps, so each distinct value is parsed once.
+    parsed = {}
+    for value in set(values):
+        moment = parse_datetime(value) if value else None
+        parsed[value] = isoformat(moment) if moment else None
+    return [parsed[value] for value in values]
+
+
+def clean_flags(values: Sequence[object]) -> List[Optional[bool]]:
+    return [
+        value if type(value) is bool or value is None else FLAGS.get(str(value).strip().lower())
+        for value in values
+    ]
+
+
+def fill(values: List[Optional[object]], defaults: Sequence[Optional[object]]) -> list:
+    return [value if value is not None else default for value, default in zip(values, defaults)]
+
+
+def clean_columns(
+    columns: dict[str, list],
+    snapshot_at: str,
+    commission_rate: float = COMMISSION_RATE_DEFAULT,
+    rederive: bool = False,
+) -> ListingBatch:
+    # Derived columns the snapshot leaves empty are filled with the current rules; with
+    # rederive=True all of them are recomputed.
+    count = len(next(iter(columns.values()), []))
+    missing = [None] * count
+    cleaned = {
+        name: clean_text(columns[name]) if name in columns else list(missing)
+        for name in LISTING_COLUMNS
+        if name not in ("price", *TIMESTAMP_COLUMNS, *DERIVED_COLUMNS)
+    }
+    cleaned["price"] = clean_prices(columns.get("price", missing))
+    for name in TIMESTAMP_COLUMNS:
+        cleaned[name] = clean_timestamps(columns.get(name, missing))
+    cleaned["snapshot_at"] = [value or snapshot_at for value in cleaned["snapshot_at"]]
+    cleaned["last_seen_at"] = fill(cleaned["last_seen_at"], cleaned["snapshot_at"])
+    cleaned["role"], cleaned["broker_role"] = (
+        fill(cleaned["role"], cleaned["broker_role"]),
+        fill(cleaned["broker_role"], cleaned["role"]),
+    )
+    kept = {
+        "commission_est": clean_prices(columns.get("commission_est", missing)),
+        "price_bucket": clean_text(columns.get("price_bucket", missing)),
+        "is_sold": clean_flags(columns.get("is_sold", missing)),
+    }
+    for name in DERIVED_COLUMNS:
+        cleaned[name] = list(missing)
+    batch = enrich_batch(classify_batch(ListingBatch.from_columns(cleaned)), commission_rate)
+    if not rederive:
+        for name, values in kept.items():
+            if any(value is not None for value in values):
+                batch.set_column(name, fill(values, batch.column(name)))
+    return batch
+
+
+def read_batches(
+    path: str,
+    fmt: Optional[str] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    snapshot_at: Optional[str] = None,
+    commission_rate: float = COMMISSION_RATE_DEFAULT,
+    stats: Optional[SourceStats] = None,
+    rederive: bool = False,
+) -> Iterator[ListingBatch]:
+    # Rows without a snapshot_at of their own get `snapshot_at` (default: now).
+    reader = READERS[detect_format(path, fmt)]
+    default_snapshot = snapshot_at or isoformat(now_utc())
+    chunks = reader(path, max(1, chunk_rows))
+    while True:
+        started = time.perf_counter()
+        columns = next(chunks, None)
+        if columns is None:
+            return
+        parsed = time.perf_counter()
+        batch = clean_columns(columns, default_snapshot, commission_rate, rederive)
+        if stats is not None:
+            stats.add_time("parse", parsed - started)
+            stats.add_time("clean", time.perf_counter() - parsed)
+            stats.add("rows", len(batch))
+        yield batch
+
+
+def expand_paths(patterns: Sequence[str]) -> List[str]:
+    # Globs are expanded here so quoting them works the same on every shell.
+    paths: List[str] = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def replace_tables(connection: psycopg.Connection) -> None:
+    # Left uncommitted: the import commits it together with the loaded rows.
+    with connection.cursor() as cur:
+        cur.execute("TRUNCATE listings, listings_latest")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Import CSV, JSON or NDJSON listing snapshots into Postgres."
+    )
+    parser.add_argument("paths", nargs="+", help="Snapshot files or glob patterns.")
+    parser.add_argument(
+        "--db-url", default=getenv("SCRAPER_DB_URL", ""), help="Postgres connection string."
+    )
+    parser.add_argument("--format", choices=FORMATS, help="Default: taken from the extension.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--replace",
+        action="store_true",
+        help=(
+            "Empty listings and listings_latest and import in one transaction, rolled back "
+            "if any file fails. Readers of both tables wait until it ends."
+        ),
+    )
+    mode.add_argument(
+        "--append",
+        dest="replace",
+        action="store_false",
+        help="Merge into the existing tables (default).",
+    )
+    parser.add_argument(
+        "--rederive",
+        action="store_true",
+        help="Recompute commission_est, price_bucket and is_sold even where a file has them.",
+    )
+    parser.add_argument("--snapshot-at", help="snapshot_at for rows that have none (default: now).")
+    parser.add_argument(
+        "--commission-rate",
+        type=float,
+        default=getenv_float("SCRAPER_COMMISSION_RATE", COMMISSION_RATE_DEFAULT),
+    )
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=DEFAULT_CHUNK_ROWS,
+        help="Rows per parsed chunk and per commit (per savepoint with --replace).",
+    )
+    parser.add_argument(
+        "--rejects",
+        help="CSV for rows the database refuses (default: out/raw/<date>_import_rejects.csv).",
+    )
+    parser.add_argument(
+        "--progress-seconds",
+        type=float,
+        default=PROGRESS_SECONDS,
+        help="Seconds between progress lines.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Parse and clean the files without touching the database.",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the import summary as JSON.")
+    args = parser.parse_args(argv)
+    if not args.db_url and not args.dry_run:
+        parser.error("--db-url or SCRAPER_DB_URL is required unless --dry-run is given")
+
+    logger = get_logger()
+    snapshot_at = None
+    if args.snapshot_at:
+        moment = parse_datetime(args.snapshot_at)
+        if moment is None:
+            parser.error(f"Cannot parse --snapshot-at {args.snapshot_at!r}")
+        snapshot_at = isoformat(moment)
+    paths = expand_paths(args.paths)
+    reject_path = args.rejects or snapshot_filename(DEFAULT_OUT_DIR, "import_rejects", now_utc())
+    stats = SourceStats("import")
+    started = time.perf_counter()
+    last_progress = started
+    rows = loaded = 0
+    failed: List[str] = []
+
+    connection = None if args.dry_run else connect_db(args.db_url)
+    try:
+        if connection is not None and args.replace:
+            logger.info("Emptying listings and listings_latest")
+            replace_tables(connection)
+        with RejectSink(reject_path) as rejects:
+            for number, path in enumerate(paths, start=1):
+                file_started = time.perf_counter()
+                file_rows = file_loaded = 0
+                try:
+                    for batch in read_batches(
+                        path,
+                        args.format,
+                        args.chunk_rows,
+                        snapshot_at,
+                        args.commission_rate,
+                        stats,
+                        args.rederive,
+                    ):
+                        file_rows += len(batch)
+                        if connection is not None:
+                            file_loaded += insert_rows(
+                                connection,
+                                batch,
+                                stats,
+                                args.chunk_rows,
+                                rejects,
+                                commit=not args.replace,
+                            )
+                        now = time.perf_counter()
+                        if now - last_progress >= args.progress_seconds:
+                            last_progress = now
+                            logger.info(
+                                "Progress file=%s/%s rows=%s rows/s=%.0f rejected=%s",
+                                number,
+                                len(paths),
+                                rows + file_rows,
+                                (rows + file_rows) / (now - started),
+                                rejects.rows_written,
+                            )
+                except (psycopg.OperationalError, psycopg.InterfaceError):
+                    raise
+                except Exception as exc:  # noqa: BLE001
+                    failed.append(path)
+                    logger.exception("Failed to import %s after rows=%s: %s", path, file_rows, exc)
+                rows += file_rows
+                loaded += file_loaded
+                logger.info(
+                    "Imported %s rows=%s loaded=%s seconds=%.2f",
+                    path,
+                    file_rows,
+                    file_loaded,
+                    time.perf_counter() - file_started,
+                )
+                if failed and args.replace:
+                    break
+            rejected = rejects.rows_written
+        if connection is not None and args.replace:
+            if failed:
+                # The tables keep their contents from before the import.
+                connection.rollback()
+                logger.error(
+                    "Rolled back the replace after %s failed; skipped %s files",
+                    failed[0],
+                    len(paths) - number,
+                )
+                loaded = 0
+            else:
+                connection.commit()
+    finally:
+        if connection is not None:
+            connection.close()
+
+    seconds = time.perf_counter() - started
+    stats.finish(not failed)
+    summary = {
+        "files": len(paths),
+        "failed_files": failed,
+        "rows": rows,
+        "loaded": loaded,
+        "rejected": rejected,
+        "rejects_path": reject_path if rejected else None,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds else None,
+        "stats": stats.as_dict(),
+    }
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    logger.info(
+        "Import done files=%s rows=%s loaded=%s rejected=%s seconds=%.2f rows/s=%s",
+        len(paths),
+        rows,
+        loaded,
+        rejected,
+        seconds,
+        summary["rows_per_second"],
+    )
+    if rejected:
+        logger.warning("Rejected rows written to %s", reject_path)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+import csv
+import os
+import threading
+import time
+import weakref
+from datetime import UTC, datetime
+from typing import TYPE_CHECKING, List, Optional, Sequence
+
+import psycopg
+from psycopg import sql
+
+from .utils import (
+    LISTING_COLUMNS,
+    ListingBatch,
+    ListingRow,
+    ensure_dir,
+    get_logger,
+    location_enriched_tuples,
+    parse_datetime,
+)
+
+if TYPE_CHECKING:
+    from .stats import SourceStats
+
+logger = get_logger()
+
+# Rows are streamed with COPY into a session-local staging table and merged into listings
+# and listings_latest with one INSERT ... SELECT each, instead of two statements per row.
+# The staging table empties itself on commit, so the loader needs a connection that is not
+# in autocommit mode (connect_db opens one).
+STAGE_TABLE = "listings_stage"
+DEFAULT_CHUNK_ROWS = 5000
+# Errors caused by the values of a row (bad timestamp, over-long text, failed CHECK), as
+# opposed to the connection or the schema; only these are bisected down to single rows
+# (see row_error).
+ROW_ERRORS = (psycopg.DataError, psycopg.IntegrityError)
+SNAPSHOT_INDEX = LISTING_COLUMNS.index("snapshot_at")
+COLUMNS = sql.SQL(", ").join(map(sql.Identifier, LISTING_COLUMNS))
+LATEST_UPDATES = sql.SQL(", ").join(
+    sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(name))
+    for name in LISTING_COLUMNS
+    if name not in ("source", "listing_id")
+)
+
+# `ordinal` numbers the rows in the order they were copied, so the merges can resolve
+# duplicates the way the old row-by-row inserts did.
+CREATE_STAGE = sql.SQL(
+    """
+    CREATE TEMP TABLE IF NOT EXISTS {stage} (
+        LIKE listings_latest,
+        ordinal BIGINT GENERATED ALWAYS AS IDENTITY
+    ) ON COMMIT DELETE ROWS
+    """
+).format(stage=sql.Identifier(STAGE_TABLE))
+
+# The stage only empties itself on commit; a load that keeps one transaction open across
+# chunks empties it after each merge instead.
+TRUNCATE_STAGE = sql.SQL("TRUNCATE {stage}").format(stage=sql.Identifier(STAGE_TABLE))
+
+COPY_STAGE = sql.SQL("COPY {stage} ({columns}) FROM STDIN").format(
+    stage=sql.Identifier(STAGE_TABLE), columns=COLUMNS
+)
+
+# The first copy of a (source, listing_id, broker, snapshot_at) row is kept.
+MERGE_LISTINGS = sql.SQL(
+    """
+    INSERT INTO listings ({columns})
+    SELECT {columns} FROM {stage} ORDER BY ordinal
+    ON CONFLICT (source, listing_id, broker, snapshot_at) DO NOTHING
+    """
+).format(columns=COLUMNS, stage=sql.Identifier(STAGE_TABLE))
+
+# One row per listing: the newest snapshot, and of its broker rows the last one copied.
+# ON CONFLICT DO UPDATE cannot touch the same row twice in one statement, hence DISTINCT ON.
+MERGE_LATEST = sql.SQL(
+    """
+    INSERT INTO listings_latest ({columns})
+    SELECT DISTINCT ON (source, listing_id) {columns}
+    FROM {stage}
+    ORDER BY source, listing_id, snapshot_at DESC, ordinal DESC
+    ON CONFLICT (source, listing_id) DO UPDATE
+    SET {updates}
+    WHERE listings_latest.snapshot_at <= EXCLUDED.snapshot_at
+    """
+).format(columns=COLUMNS, stage=sql.Identifier(STAGE_TABLE), updates=LATEST_UPDATES)
+
+# The same choice as MERGE_LATEST over the whole history; ids follow the copy order. Only the
+# copy listings kept of a (source, listing_id, broker, snapshot_at) row is visible here, so
+# where a load held differing copies of one the first wins, not the last as in MERGE_LATEST.
+REBUILD_LATEST = sql.SQL(
+    """
+    INSERT INTO listings_latest ({columns})
+    SELECT DISTINCT ON (source, listing_id) {columns}
+    FROM listings
+    ORDER BY source, listing_id, snapshot_at DESC, id DESC
+    """
+).format(columns=COLUMNS)
+
+# listings may be range-partitioned by month (infra/migrations/006_partition_listings.sql).
+# Rows reach their partition through the merge's tuple routing, so the loader only has to
+# make sure the partitions exist; the database function creates any that are missing.
+PARTITIONED = """
+    SELECT to_regproc('ensure_listings_partition') IS NOT NULL
+       AND EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('listings'))
+"""
+ENSURE_PARTITIONS = (
+    "SELECT ensure_listings_partition(month) FROM unnest(%s::timestamptz[]) AS month"
+)
+_partitioned: weakref.WeakKeyDictionary[psycopg.Connection, bool] = weakref.WeakKeyDictionary()
+
+
+class RejectSink:
+    # CSV of the rows the database refused, with the error; created on the first reject.
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.rows_written = 0
+        self._handle = None
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def write(self, values: tuple, error: str) -> None:
+        with self._lock:
+            if self._writer is None:
+                ensure_dir(os.path.dirname(self.path))
+                self._handle = open(self.path, "w", newline="", encoding="utf-8")
+                self._writer = csv.writer(self._handle)
+                self._writer.writerow([*LISTING_COLUMNS, "error"])
+            self._writer.writerow([*values, error])
+            self._handle.flush()
+            self.rows_written += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+    def __enter__(self) -> "RejectSink":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+def listings_partitioned(connection: psycopg.Connection) -> bool:
+    # Checked once per connection.
+    partitioned = _partitioned.get(connection)
+    if partitioned is None:
+        with connection.cursor() as cur:
+            cur.execute(PARTITIONED)
+            partitioned = _partitioned[connection] = bool(cur.fetchone()[0])
+    return partitioned
+
+
+def partition_months(params: Sequence[tuple]) -> List[datetime]:
+    # The first instant of every UTC month in the rows, plus the month after the newest
+    # one, so the next run does not have to create its partition.
+    months = set()
+    for value in {values[SNAPSHOT_INDEX] for values in params}:
+        moment = parse_datetime(value)
+        if moment is not None:
+            moment = moment.astimezone(UTC)
+            months.add(datetime(moment.year, moment.month, 1, tzinfo=UTC))
+    if months:
+        newest = max(months)
+        months.add(datetime(newest.year + newest.month // 12, newest.month % 12 + 1, 1, tzinfo=UTC))
+    return sorted(months)
+
+
+def ensure_partitions(cur: psycopg.Cursor, params: Sequence[tuple]) -> int:
+    months = partition_months(params)
+    if months:
+        cur.execute(ENSURE_PARTITIONS, (months,))
+    return len(months)
+
+
+def copy_to_stage(cur: psycopg.Cursor, params: Sequence[tuple]) -> int:
+    cur.execute(CREATE_STAGE)
+    with cur.copy(COPY_STAGE) as copy:
+        for values in params:
+            copy.write_row(values)
+    return len(params)
+
+
+def merge_stage(cur: psycopg.Cursor, merge_latest: bool = True) -> tuple[int, int]:
+    # Returns the rows inserted into listings and inserted or updated in listings_latest.
+    cur.execute(MERGE_LISTINGS)
+    inserted = cur.rowcount
+    if not merge_latest:
+        return inserted, 0
+    cur.execute(MERGE_LATEST)
+    return inserted, cur.rowcount
+
+
+def rebuild_latest(connection: psycopg.Connection) -> int:
+    # Recomputes listings_latest from listings in one transaction, for bulk loads that
+    # skip the per-chunk merge. Readers of listings_latest wait until it commits.
+    with connection.cursor() as cur:
+        cur.execute("TRUNCATE listings_latest")
+        cur.execute(REBUILD_LATEST)
+        rows = cur.rowcount
+    connection.commit()
+    return rows
+
+
+def row_error(exc: psycopg.Error) -> bool:
+    # A row that fits no partition of listings fails with a check violation that names no
+    # constraint. That is a missing or detached month, not bad data: bisecting it would
+    # reject the whole month one row at a time, so it fails the load instead.
+    if isinstance(exc, psycopg.errors.CheckViolation) and exc.diag.constraint_name is None:
+        return False
+    return isinstance(exc, ROW_ERRORS)
+
+
+def load_chunk(
+    connection: psycopg.Connection,
+    params: Sequence[tuple],
+    stats: Optional[SourceStats] = None,
+    merge_latest: bool = True,
+    commit: bool = True,
+) -> int:
+    # Copies, merges and commits one chunk; on failure the chunk is rolled back. With
+    # commit=False the chunk runs in a savepoint of the open transaction instead, and only
+    # the savepoint is released or rolled back; the caller commits.
+    started = time.perf_counter()
+    savepoint = False
+    try:
+        with connection.cursor() as cur:
+            if not commit:
+                cur.execute("SAVEPOINT load_chunk")
+                savepoint = True
+            partitioned = listings_partitioned(connection)
+            if partitioned:
+                ensure_partitions(cur, params)
+            copy_to_stage(cur, params)
+            copied = time.perf_counter()
+            inserted, latest = merge_stage(cur, merge_latest)
+            committing = time.perf_counter()
+            if not commit:
+                cur.execute(TRUNCATE_STAGE)
+                cur.execute("RELEASE SAVEPOINT load_chunk")
+        if commit:
+            connection.commit()
+    except Exception:
+        if savepoint:
+            connection.execute("ROLLBACK TO SAVEPOINT load_chunk")
+            connection.execute("RELEASE SAVEPOINT load_chunk")
+        else:
+            connection.rollback()
+        if stats is not None:
+            stats.add_time("db_rollback", time.perf_counter() - started)
+        raise
+    if stats is not None:
+        stats.add_time("db_copy", copied - started)
+        stats.add_time("db_insert", committing - copied)
+        stats.add_time("db_commit", time.perf_counter() - committing)
+        stats.observe("db_insert_batch_seconds", time.perf_counter() - started)
+        # Partition upkeep, CREATE IF NOT EXISTS, COPY and the merges, plus the savepoint
+        # and stage truncation without a commit.
+        stats.add(
+            "db_statements",
+            (4 if merge_latest else 3) + int(partitioned) + (0 if commit else 3),
+        )
+        stats.add("db_rows", len(params))
+        stats.add("db_rows_inserted", inserted)
+        stats.add("db_latest_upserts", latest)
+    return len(params)
+
+
+def load_isolating(
+    connection: psycopg.Connection,
+    params: Sequence[tuple],
+    rejects: Optional[RejectSink] = None,
+    stats: Optional[SourceStats] = None,
+    merge_latest: bool = True,
+    commit: bool = True,
+) -> int:
+    # A chunk that fails on its data is split in half until the offending rows stand
+    # alone; those are rejected and everything else is loaded. Other errors propagate.
+    try:
+        return load_chunk(connection, params, stats, merge_latest, commit)
+    except ROW_ERRORS as exc:
+        if not row_error(exc):
+            raise
+        if len(params) > 1:
+            middle = len(params) // 2
+            return load_isolating(
+                connection, params[:middle], rejects, stats, merge_latest, commit
+            ) + load_isolating(connection, params[middle:], rejects, stats, merge_latest, commit)
+        message = str(exc).strip()
+        error = message.splitlines()[0] if message else type(exc).__name__
+        logger.warning("Rejected listing source=%s id=%s: %s", params[0][0], params[0][1], error)
+        if rejects is not None:
+            rejects.write(params[0], error)
+        if stats is not None:
+            stats.add("db_rejected")
+        return 0
+
+
+def insert_rows(
+    connection: psycopg.Connection,
+    rows: ListingBatch | Sequence[ListingRow],
+    stats: Optional[SourceStats] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    rejects: Optional[RejectSink] = None,
+    merge_latest: bool = True,
+    commit: bool = True,
+) -> int:
+    # Returns the number of rows loaded, rejected rows excluded. Each chunk of at most
+    # `chunk_rows` rows is its own transaction, or with commit=False a savepoint in the
+    # caller's transaction. With merge_latest=False only listings is written and
+    # listings_latest is left to rebuild_latest.
+    batch = rows if isinstance(rows, ListingBatch) else ListingBatch.from_rows(rows)
+    if not batch:
+        return 0
+    params = location_enriched_tuples(batch)
+    chunk_rows = max(1, chunk_rows)
+    return sum(
+        load_isolating(
+            connection, params[start : start + chunk_rows], rejects, stats, merge_latest, commit
+        )
+        for start in range(0, len(params), chunk_rows)
+    )
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, List, Optional
+
+# Opt-in memoization of pure normalizer helpers. Wrapped functions call straight through
+# until enable() is called; each then gets its own size-capped LRU with hit/miss counters.
+DEFAULT_MAXSIZE = 4096
+CACHE_FORMAT = 1
+
+_enabled = False
+_MISSING = object()
+MEMOS: dict[str, "Memo"] = {}
+
+
+class Memo:
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        maxsize: int,
+        key: Optional[Callable[..., Any]] = None,
+    ) -> None:
+        self.name = name
+        self.fn = fn
+        self.maxsize = maxsize
+        self.key = key
+        self.data: OrderedDict[Any, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncacheable = 0
+        self.loaded = 0
+        self.miss_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def call(self, args: tuple) -> Any:
+        try:
+            key = self.key(*args) if self.key is not None else args
+            hash(key)
+        except Exception:  # noqa: BLE001 - unhashable or unexpected input: no caching
+            with self._lock:
+                self.uncacheable += 1
+            return self.fn(*args)
+        with self._lock:
+            value = self.data.get(key, _MISSING)
+            if value is not _MISSING:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return value
+        started = time.perf_counter()
+        value = self.fn(*args)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.misses += 1
+            self.miss_seconds += elapsed
+            self._store(key, value)
+        return value
+
+    def _store(self, key: Any, value: Any) -> None:
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.data.clear()
+            self.hits = self.misses = self.evictions = self.uncacheable = self.loaded = 0
+            self.miss_seconds = 0.0
+
+    def entries(self) -> List[list]:
+        with self._lock:
+            return [[key, value] for key, value in self.data.items()]
+
+    def load(self, entries: Iterable[list]) -> None:
+        with self._lock:
+            for key, value in entries:
+                self._store(frozen(key), frozen(value))
+            self.loaded = len(self.data)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            calls = self.hits + self.misses
+            per_miss = self.miss_seconds / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / calls, 4) if calls else None,
+                "size": len(self.data),
+                "maxsize": self.maxsize,
+                "evictions": self.evictions,
+                "uncacheable": self.uncacheable,
+                "loaded": self.loaded,
+                "miss_seconds": round(self.miss_seconds, 4),
+                # What the hits would have cost at the average miss time; lookup overhead
+                # is not subtracted.
+                "seconds_saved": round(self.hits * per_miss, 4),
+            }
+
+
+def frozen(value: Any) -> Any:
+    # JSON turns tuples into lists; keys and results here only ever hold tuples.
+    if isinstance(value, list):
+        return tuple(frozen(item) for item in value)
+    return value
+
+
+def memoized(
+    name: str,
+    maxsize: int = DEFAULT_MAXSIZE,
+    key: Optional[Callable[..., Any]] = None,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    # `key` maps the arguments to a hashable key when they are not hashable themselves.
+    def decorate(fn: Callable[..., Any]) -> Callable[..., Any]:
+        memo = MEMOS[name] = Memo(name, fn, maxsize, key)
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _enabled or kwargs:
+                return fn(*args, **kwargs)
+            return memo.call(args)
+
+        wrapper.memo = memo  # type: ignore[attr-defined]
+        return wrapper
+
+    return decorate
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+    for memo in MEMOS.values():
+        memo.clear()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def summary() -> dict:
+    return {name: memo.as_dict() for name, memo in sorted(MEMOS.items())}
+
+
+def fingerprint(paths: Iterable[Optional[str]]) -> str:
+    # A cache is only reused while the code and data that produced it are unchanged.
+    parts = []
+    for path in paths:
+        if path and os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return "|".join(parts)
+
+
+def load(path: str, stamp: str) -> int:
+    # Returns the number of entries loaded; a missing or stale cache loads nothing.
+    try:
+        with open(path, encoding="utf-8") as handle:
+            data = json.load(handle)
+    except FileNotFoundError:
+        return 0
+    if data.get("format") != CACHE_FORMAT or data.get("fingerprint") != stamp:
+        return 0
+    total = 0
+    for name, entries in (data.get("caches") or {}).items():
+        memo = MEMOS.get(name)
+        if memo is not None:
+            memo.load(entries)
+            total += memo.loaded
+    return total
+
+
+def save(path: str, stamp: str) -> int:
+    caches = {name: memo.entries() for name, memo in sorted(MEMOS.items())}
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        json.dump({"format": CACHE_FORMAT, "fingerprint": stamp, "caches": caches}, handle)
+    os.replace(tmp_path, path)
+    return sum(len(entries) for entries in caches.values())
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import bisect
+import math
+import os
+import time
+from typing import List, Optional, Sequence
+
+import requests
+
+from .utils import ensure_dir
+
+METRIC_PREFIX = "megler_scraper"
+DEFAULT_PUSH_JOB = "megler_scraper"
+PUSH_TIMEOUT = 10
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Histograms exported per source, with buckets sized for what each one measures.
+HISTOGRAMS = {
+    "request_latency_seconds": (
+        "HTTP request latency per search API call.",
+        (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
+    ),
+    "normalize_rows_per_second": (
+        "Rows normalized per second, observed per page, window or slice.",
+        (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000),
+    ),
+    "db_insert_batch_seconds": (
+        "Time to insert and commit one batch of rows.",
+        (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+    ),
+    "run_duration_seconds": (
+        "Wall time of one source run.",
+        (30, 60, 120, 300, 600, 900, 1800, 3600, 7200),
+    ),
+}
+
+
+class Histogram:
+    # Cumulative-bucket histogram in the Prometheus sense; not thread-safe on its own,
+    # SourceStats serialises access under its lock.
+
+    __slots__ = ("bounds", "counts", "count", "total")
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.bounds = tuple(sorted(bounds))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def cumulative(self) -> List[tuple[float, int]]:
+        running = 0
+        buckets = []
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            running += count
+            buckets.append((bound, running))
+        return buckets
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "buckets": {format_bound(bound): count for bound, count in self.cumulative()},
+        }
+
+
+def histogram_for(name: str) -> Histogram:
+    return Histogram(HISTOGRAMS[name][1] if name in HISTOGRAMS else DEFAULT_BUCKETS)
+
+
+def format_bound(bound: float) -> str:
+    if math.isinf(bound):
+        return "+Inf"
+    return repr(float(bound)) if bound != int(bound) else f"{int(bound)}"
+
+
+def escape_label(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict[str, object]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def render(summary: dict) -> str:
+    # Prometheus text exposition format (0.0.4) built from a RunStats summary, readable by
+    # the node_exporter textfile collector and accepted by a Pushgateway.
+    lines: List[str] = []
+    sources = summary.get("sources") or {}
+
+    def family(name: str, kind: str, help_text: str) -> str:
+        metric = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        return metric
+
+    for name, (help_text, _) in HISTOGRAMS.items():
+        observed = {
+            source: data["histograms"][name]
+            for source, data in sources.items()
+            if name in (data.get("histograms") or {})
+        }
+        if not observed:
+            continue
+        metric = family(name, "histogram", help_text)
+        for source, hist in observed.items():
+            for bound, count in hist["buckets"].items():
+                labels = format_labels({"source": source, "le": bound})
+                lines.append(f"{metric}_bucket{labels} {count}")
+            lines.append(f"{metric}_sum{format_labels({'source': source})} {hist['sum']}")
+            lines.append(f"{metric}_count{format_labels({'source': source})} {hist['count']}")
+
+    counters = sorted({key for data in sources.values() for key in data.get("counters") or {}})
+    for key in counters:
+        metric = family(f"{key}_total", "counter", f"Scraper {key.replace('_', ' ')} in the last run.")
+        for source, data in sources.items():
+            value = (data.get("counters") or {}).get(key, 0)
+            lines.append(f"{metric}{format_labels({'source': source})} {value}")
+
+    metric = family("stage_seconds", "gauge", "Thread-seconds spent per pipeline stage in the last run.")
+    for source, data in sources.items():
+        for stage, timing in (data.get("stages") or {}).items():
+            labels = format_labels({"source": source, "stage": stage})
+            lines.append(f"{metric}{labels} {timing['seconds']}")
+
+    metric = family("last_run_success", "gauge", "1 if the source's last run completed cleanly.")
+    for source, data in sources.items():
+        lines.append(f"{metric}{format_labels({'source': source})} {int(bool(data.get('ok')))}")
+
+    caches = summary.get("memo") or {}
+    if caches:
+        metric = family("memo_hit_ratio", "gauge", "Share of memoized helper calls served from cache.")
+        for name, cache in caches.items():
+            if cache["hit_rate"] is not None:
+                lines.append(f"{metric}{format_labels({'function': name})} {cache['hit_rate']}")
+        metric = family("memo_seconds_saved", "gauge", "Estimated time saved by memoized helpers.")
+        for name, cache in caches.items():
+            lines.append(f"{metric}{format_labels({'function': name})} {cache['seconds_saved']}")
+
+    metric = family("last_run_timestamp_seconds", "gauge", "Unix time the last run finished.")
+    lines.append(f"{metric} {time.time():.3f}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str, text: str) -> None:
+    # The textfile collector may read at any moment, so never expose a half-written file.
+    ensure_dir(os.path.dirname(path) or ".")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        handle.write(text)
+    os.replace(tmp_path, path)
+
+
+def push(url: str, text: str, job: str = DEFAULT_PUSH_JOB) -> None:
+    # PUT replaces every metric of the job's group, so a source that did not run this
+    # time does not keep reporting stale numbers.
+    response = requests.put(
+        f"{url.rstrip('/')}/metrics/job/{job}",
+        data=text.encode("utf-8"),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        timeout=PUSH_TIMEOUT,
+    )
+    response.raise_for_status()
+
+
+def export(
+    summary: dict,
+    textfile: Optional[str] = None,
+    push_url: Optional[str] = None,
+    job: str = DEFAULT_PUSH_JOB,
+) -> List[str]:
+    # Returns where the metrics went, for logging.
+    text = render(summary)
+    targets: List[str] = []
+    if textfile:
+        write_textfile(textfile, text)
+        targets.append(textfile)
+    if push_url:
+        push(push_url, text, job)
+        targets.append(push_url)
+    return targets
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import argparse
+import gzip
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+import psycopg
+from psycopg import sql
+
+from .utils import connect_db, ensure_dir, get_logger, getenv
+
+# Upkeep of the monthly listings partitions created by
+# infra/migrations/006_partition_listings.sql: list them, create upcoming months, and retire
+# old months by detaching them, optionally archiving them to gzipped CSV and dropping them.
+PARTITION_RE = re.compile(r"^listings_(\d{4})_(\d{2})$")
+MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+DEFAULT_MONTHS_AHEAD = 2
+
+LIST_PARTITIONS = """
+    SELECT c.relname, c.relispartition, c.reltuples::bigint, pg_total_relation_size(c.oid)
+    FROM pg_class c
+    LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+    WHERE c.relkind = 'r'
+      AND c.relname ~ '^listings_[0-9]{4}_[0-9]{2}$'
+      AND (i.inhparent IS NULL OR i.inhparent = 'listings'::regclass)
+      AND c.relnamespace = (SELECT relnamespace FROM pg_class WHERE oid = 'listings'::regclass)
+    ORDER BY c.relname
+"""
+ENSURE_AHEAD = """
+    SELECT ensure_listings_partition(now() + make_interval(months => n))
+    FROM generate_series(0, %s) AS n
+"""
+
+
+@dataclass(slots=True)
+class Partition:
+    name: str
+    month: str
+    attached: bool
+    rows: int
+    size_bytes: int
+
+
+def list_partitions(connection: psycopg.Connection) -> List[Partition]:
+    # Attached partitions and detached ones that have not been dropped yet. Row counts are
+    # the planner's estimates.
+    with connection.cursor() as cur:
+        cur.execute(LIST_PARTITIONS)
+        records = cur.fetchall()
+    partitions = []
+    for name, attached, rows, size_bytes in records:
+        match = PARTITION_RE.match(name)
+        partitions.append(
+            Partition(
+                name=name,
+                month=f"{match.group(1)}-{match.group(2)}",
+                attached=attached,
+                rows=max(rows, 0),
+                size_bytes=size_bytes,
+            )
+        )
+    return partitions
+
+
+def ensure_ahead(connection: psycopg.Connection, months_ahead: int) -> List[str]:
+    # The partitions for this month and the next `months_ahead` months.
+    with connection.cursor() as cur:
+        cur.execute(ENSURE_AHEAD, (max(0, months_ahead),))
+        names = [name for (name,) in cur.fetchall()]
+    connection.commit()
+    return names
+
+
+def archive_partition(connection: psycopg.Connection, name: str, directory: str) -> str:
+    # Gzipped CSV with a header row, loadable again with COPY ... FROM.
+    ensure_dir(directory)
+    path = os.path.join(directory, f"{name}.csv.gz")
+    tmp_path = f"{path}.tmp"
+    query = sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(sql.Identifier(name))
+    with connection.cursor() as cur, gzip.open(tmp_path, "wb") as handle:
+        with cur.copy(query) as copy:
+            for data in copy:
+                handle.write(data)
+    connection.commit()
+    os.replace(tmp_path, path)
+    return path
+
+
+def detach_partition(
+    connection: psycopg.Connection,
+    name: str,
+    concurrently: bool = False,
+) -> None:
+    # CONCURRENTLY keeps readers and writers of listings unblocked but cannot run inside a
+    # transaction block, so it needs an autocommit connection.
+    statement = sql.SQL("ALTER TABLE listings DETACH PARTITION {}{}").format(
+        sql.Identifier(name), sql.SQL(" CONCURRENTLY" if concurrently else "")
+    )
+    with connection.cursor() as cur:
+        cur.execute(statement)
+    if not connection.autocommit:
+        connection.commit()
+
+
+def drop_partition(connection: psycopg.Connection, name: str) -> None:
+    with connection.cursor() as cur:
+        cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+    if not connection.autocommit:
+        connection.commit()
+
+
+def month_arg(value: str) -> str:
+    if not MONTH_RE.match(value):
+        raise argparse.ArgumentTypeError(f"Expected YYYY-MM, got {value!r}")
+    return value
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Manage the monthly listings partitions.")
+    parser.add_argument(
+        "--db-url", default=getenv("SCRAPER_DB_URL", ""), help="Postgres connection string."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Show attached and detached partitions.")
+    ensure = commands.add_parser("ensure", help="Create this month's and upcoming partitions.")
+    ensure.add_argument("--months-ahead", type=int, default=DEFAULT_MONTHS_AHEAD)
+    detach = commands.add_parser("detach", help="Detach the months before --before.")
+    detach.add_argument(
+        "--before", type=month_arg, required=True, help="First month to keep, YYYY-MM."
+    )
+    detach.add_argument(
+        "--archive", metavar="DIR", help="Write each detached month to DIR/<name>.csv.gz."
+    )
+    detach.add_argument(
+        "--drop", action="store_true", help="Drop the tables once detached (and archived)."
+    )
+    detach.add_argument(
+        "--concurrently",
+        action="store_true",
+        help="DETACH ... CONCURRENTLY, without blocking queries on listings.",
+    )
+    detach.add_argument("--dry-run", action="store_true", help="Only list what would be detached.")
+    args = parser.parse_args(argv)
+    if not args.db_url:
+        parser.error("--db-url or SCRAPER_DB_URL is required")
+
+    logger = get_logger()
+    if args.command == "detach" and args.concurrently:
+        connection = psycopg.connect(args.db_url, autocommit=True)
+    else:
+        connection = connect_db(args.db_url)
+    try:
+        if args.command == "list":
+            for partition in list_partitions(connection):
+                state = "attached" if partition.attached else "detached"
+                print(
+                    f"{partition.month}  {partition.name:<16} {state:<9} "
+                    f"rows~{partition.rows:<10} {partition.size_bytes / 1e6:.1f} MB"
+                )
+            return 0
+        if args.command == "ensure":
+            for name in ensure_ahead(connection, args.months_ahead):
+                logger.info("Partition ready %s", name)
+            return 0
+
+        retired = [p for p in list_partitions(connection) if p.month < args.before]
+        if not retired:
+            logger.info("No partitions before %s", args.before)
+            return 0
+        for partition in retired:
+            if args.dry_run:
+                logger.info("Would retire %s rows~%s", partition.name, partition.rows)
+                continue
+            if partition.attached:
+                detach_partition(connection, partition.name, args.concurrently)
+                logger.info("Detached %s", partition.name)
+            if args.archive:
+                path = archive_partition(connection, partition.name, args.archive)
+                logger.info("Archived %s to %s", partition.name, path)
+            if args.drop:
+                drop_partition(connection, partition.name)
+                logger.info("Dropped %s", partition.name)
+        return 0
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import os
+from array import array
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+# Four-digit Norwegian postcodes index straight into fixed tables of 10,000 slots, so a
+# lookup is one array read per field. Slots hold indexes into a shared table of names.
+SLOTS = 10_000
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_REGISTER_PATH = os.path.join(DATA_DIR, "postnummer.tsv")
+# Posten/Bring publish the full register as "Postnummerregister-ansi.txt" (cp1252).
+BRING_ENCODING = "cp1252"
+LOWERCASE_WORDS = {"i", "på", "og"}
+
+
+@dataclass(slots=True)
+class PostalPlace:
+    postcode: str
+    poststed: Optional[str]
+    kommunenummer: Optional[str]
+    kommune: Optional[str]
+    bydel: Optional[str]
+
+
+def display_name(value: str) -> str:
+    # "MO I RANA" -> "Mo i Rana", "BØ I TELEMARK" -> "Bø i Telemark".
+    words = value.strip().lower().split()
+    return " ".join(
+        word
+        if index and word in LOWERCASE_WORDS
+        else "-".join(part.capitalize() for part in word.split("-"))
+        for index, word in enumerate(words)
+    )
+
+
+def postcode_slot(postcode: object) -> Optional[int]:
+    if not postcode:
+        return None
+    text = postcode if type(postcode) is str else str(postcode)
+    if len(text) != 4 or not text.isdigit():
+        text = text.strip()
+        if len(text) != 4 or not text.isdigit():
+            return None
+    return int(text)
+
+
+class PostalRegister:
+    __slots__ = ("names", "_codes", "poststed", "kommunenummer", "kommune", "bydel")
+
+    def __init__(self) -> None:
+        self.names: list[Optional[str]] = [None]
+        self._codes: dict[str, int] = {}
+        self.poststed = array("H", [0]) * SLOTS
+        self.kommunenummer = array("H", [0]) * SLOTS
+        self.kommune = array("H", [0]) * SLOTS
+        self.bydel = array("H", [0]) * SLOTS
+
+    def _code(self, name: Optional[str]) -> int:
+        if not name:
+            return 0
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def assign(
+        self,
+        start: int,
+        end: int,
+        poststed: Optional[str] = None,
+        kommunenummer: Optional[str] = None,
+        kommune: Optional[str] = None,
+        bydel: Optional[str] = None,
+    ) -> None:
+        # Sets the given fields on every slot in start..end; empty fields are left alone,
+        # so later rows can refine earlier ones.
+        if not 0 <= start <= end < SLOTS:
+            raise ValueError(f"Postcode range {start:04d}-{end:04d} is outside 0000-9999")
+        for field, value in (
+            (self.poststed, poststed),
+            (self.kommunenummer, kommunenummer),
+            (self.kommune, kommune),
+            (self.bydel, bydel),
+        ):
+            code = self._code(value)
+            if code:
+                field[start : end + 1] = array("H", [code]) * (end - start + 1)
+
+    def lookup(self, postcode: object) -> Optional[PostalPlace]:
+        slot = postcode_slot(postcode)
+        if slot is None or not (self.poststed[slot] or self.kommune[slot]):
+            return None
+        names = self.names
+        return PostalPlace(
+            postcode=f"{slot:04d}",
+            poststed=names[self.poststed[slot]],
+            kommunenummer=names[self.kommunenummer[slot]],
+            kommune=names[self.kommune[slot]],
+            bydel=names[self.bydel[slot]],
+        )
+
+    def city(self, postcode: object) -> Optional[str]:
+        # Municipality rather than post town, so "5141 Fyllingsdalen" files under Bergen.
+        slot = postcode_slot(postcode)
+        if slot is None:
+            return None
+        return self.names[self.kommune[slot]] or self.names[self.poststed[slot]]
+
+    def district(self, postcode: object, city: Optional[str] = None) -> Optional[str]:
+        # The bydel, unless `city` contradicts the postcode. Codes without a known post
+        # town cannot be checked and are trusted.
+        slot = postcode_slot(postcode)
+        if slot is None or not self.bydel[slot]:
+            return None
+        names = self.names
+        poststed = names[self.poststed[slot]]
+        if city and poststed:
+            kommune = names[self.kommune[slot]] or ""
+            if city.strip().casefold() not in (poststed.casefold(), kommune.casefold()):
+                return None
+        return names[self.bydel[slot]]
+
+    def load_ranges(self, lines: Iterable[str]) -> None:
+        # Tab-separated: from, to, poststed, kommunenummer, kommune, bydel. Blank lines and
+        # lines starting with "#" are skipped.
+        for number, line in enumerate(lines, start=1):
+            line = line.rstrip("\r\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = (line.split("\t") + [""] * 6)[:6]
+            start, end = postcode_slot(fields[0]), postcode_slot(fields[1] or fields[0])
+            if start is None or end is None:
+                raise ValueError(f"Invalid postcode range on line {number}: {line!r}")
+            self.assign(start, end, *(field.strip() or None for field in fields[2:]))
+
+    def load_bring(self, lines: Iterable[str]) -> None:
+        # Posten's register: postnummer, poststed, kommunenummer, kommunenavn, kategori.
+        # It is authoritative for post town and municipality; districts are kept.
+        for line in lines:
+            fields = line.rstrip("\r\n").split("\t")
+            slot = postcode_slot(fields[0]) if len(fields) >= 4 else None
+            if slot is None:
+                continue
+            self.assign(
+                slot,
+                slot,
+                display_name(fields[1]),
+                fields[2].strip() or None,
+                display_name(fields[3]),
+            )
+
+
+def load_register(
+    path: str = DEFAULT_REGISTER_PATH,
+    bring_path: Optional[str] = None,
+) -> PostalRegister:
+    register = PostalRegister()
+    with open(path, encoding="utf-8") as handle:
+        register.load_ranges(handle)
+    if bring_path:
+        with open(bring_path, encoding=BRING_ENCODING) as handle:
+            register.load_bring(handle)
+    return register
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from types import FrameType
+from typing import ContextManager, Iterator, List, Optional
+
+from .utils import ensure_dir
+
+PROFILE_MODES = ("cprofile", "sample")
+DEFAULT_SAMPLE_INTERVAL_MS = 5.0
+# Stages profiled on their own; everything a stage calls is attributed to it.
+PROFILE_STAGES = ("fetch", "normalize", "csv", "state", "db")
+TOP_FUNCTIONS = 40
+
+_NULL_STAGE = nullcontext()
+_active: Optional["Profiler"] = None
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # Per-thread stack of open stages, so nested stages hand back to their parent.
+        self._stages: dict[int, List[str]] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        thread_id = threading.get_ident()
+        with self._lock:
+            stack = self._stages.setdefault(thread_id, [])
+            parent = stack[-1] if stack else None
+            stack.append(name)
+        self._enter(name, parent)
+        try:
+            yield
+        finally:
+            self._exit(name, parent)
+            with self._lock:
+                stack.pop()
+                if not stack:
+                    self._stages.pop(thread_id, None)
+
+    def _enter(self, name: str, parent: Optional[str]) -> None:
+        pass
+
+    def _exit(self, name: str, parent: Optional[str]) -> None:
+        pass
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def write(self, directory: str) -> List[str]:
+        # The base profiler records nothing, so there is nothing to write.
+        return []
+
+
+class CProfileProfiler(Profiler):
+    # cProfile hooks only the thread that enables it, so each (thread, stage) pair gets its
+    # own Profile object and the results are merged per stage when the run ends. On
+    # interpreters where profiling is process-wide (3.12+) a stage that starts while another
+    # one is being profiled is skipped and counted instead.
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._local = threading.local()
+        self._profiles: dict[str, List[cProfile.Profile]] = {}
+        self.skipped: Counter[str] = Counter()
+
+    def _profile(self, name: str) -> cProfile.Profile:
+        profiles = getattr(self._local, "profiles", None)
+        if profiles is None:
+            profiles = self._local.profiles = {}
+        profile = profiles.get(name)
+        if profile is None:
+            profile = profiles[name] = cProfile.Profile()
+            with self._lock:
+                self._profiles.setdefault(name, []).append(profile)
+        return profile
+
+    def _enable(self, name: str) -> None:
+        try:
+            self._profile(name).enable()
+            self._local.enabled = name
+        except ValueError:
+            self._local.enabled = None
+            with self._lock:
+                self.skipped[name] += 1
+
+    def _disable(self) -> None:
+        enabled = getattr(self._local, "enabled", None)
+        if enabled is not None:
+            self._profile(enabled).disable()
+            self._local.enabled = None
+
+    def _enter(self, name: str, parent: Optional[str]) -> None:
+        self._disable()
+        self._enable(name)
+
+    def _exit(self, name: str, parent: Optional[str]) -> None:
+        self._disable()
+        if parent is not None:
+            self._enable(parent)
+
+    def write(self, directory: str) -> List[str]:
+        written: List[str] = []
+        with self._lock:
+            profiles = {name: list(items) for name, items in self._profiles.items()}
+        for name, items in sorted(profiles.items()):
+            merged: Optional[pstats.Stats] = None
+            for profile in items:
+                try:
+                    stats = pstats.Stats(profile)
+                except TypeError:
+                    # A profile that never recorded a call has nothing to merge.
+                    continue
+                if merged is None:
+                    merged = stats
+                else:
+                    merged.add(stats)
+            if merged is None:
+                continue
+            path = os.path.join(directory, f"{name}.prof")
+            merged.dump_stats(path)
+            report = io.StringIO()
+            pstats.Stats(path, stream=report).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            with open(os.path.join(directory, f"{name}.txt"), "w", encoding="utf-8") as handle:
+                handle.write(report.getvalue())
+            written.append(path)
+        return written
+
+
+class SamplingProfiler(Profiler):
+    # Wall-clock stack sampler over every thread currently inside a stage. Works across the
+    # fetch worker pools, adds no per-call overhead and writes collapsed stacks that
+    # flamegraph.pl, speedscope or inferno read directly.
+
+    def __init__(self, interval_ms: float = DEFAULT_SAMPLE_INTERVAL_MS) -> None:
+        super().__init__()
+        self.interval = max(0.001, interval_ms / 1000)
+        self.samples: Counter[tuple[str, str]] = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                staged = [(thread_id, stack[-1]) for thread_id, stack in self._stages.items() if stack]
+            for thread_id, name in staged:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.samples[(name, fold_stack(frame))] += 1
+
+    def write(self, directory: str) -> List[str]:
+        written: List[str] = []
+        by_stage: dict[str, Counter[str]] = {}
+        for (name, stack), count in self.samples.items():
+            by_stage.setdefault(name, Counter())[stack] += count
+
+        combined = os.path.join(directory, "all.collapsed")
+        with open(combined, "w", encoding="utf-8") as handle:
+            for name, stacks in sorted(by_stage.items()):
+                for stack, count in stacks.most_common():
+                    handle.write(f"{name};{stack} {count}\n")
+        written.append(combined)
+
+        for name, stacks in sorted(by_stage.items()):
+            path = os.path.join(directory, f"{name}.collapsed")
+            with open(path, "w", encoding="utf-8") as handle:
+                for stack, count in stacks.most_common():
+                    handle.write(f"{stack} {count}\n")
+            with open(os.path.join(directory, f"{name}.txt"), "w", encoding="utf-8") as handle:
+                handle.write(top_frames(stacks))
+            written.append(path)
+        return written
+
+
+def frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+def fold_stack(frame: FrameType) -> str:
+    labels: List[str] = []
+    current: Optional[FrameType] = frame
+    while current is not None:
+        labels.append(frame_label(current))
+        current = current.f_back
+    return ";".join(reversed(labels))
+
+
+def top_frames(stacks: Counter[str], limit: int = TOP_FUNCTIONS) -> str:
+    # Self samples (leaf frame) and total samples (anywhere on the stack) per function.
+    total = sum(stacks.values())
+    own: Counter[str] = Counter()
+    inclusive: Counter[str] = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for label in set(frames):
+            inclusive[label] += count
+    lines = [f"samples={total}", "", f"{'self':>8} {'total':>8}  function"]
+    for label, count in own.most_common(limit):
+        lines.append(f"{count / total:>8.1%} {inclusive[label] / total:>8.1%}  {label}")
+    return "\n".join(lines) + "\n"
+
+
+def start(mode: str, interval_ms: float = DEFAULT_SAMPLE_INTERVAL_MS) -> Profiler:
+    global _active
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode {mode!r}; expected one of {PROFILE_MODES}")
+    profiler: Profiler = CProfileProfiler() if mode == "cprofile" else SamplingProfiler(interval_ms)
+    profiler.start()
+    _active = profiler
+    return profiler
+
+
+def stop(directory: str) -> List[str]:
+    global _active
+    profiler, _active = _active, None
+    if profiler is None:
+        return []
+    profiler.stop()
+    ensure_dir(directory)
+    return profiler.write(directory)
+
+
+def stage(name: str) -> ContextManager[None]:
+    # Cheap no-op unless a profiler is running.
+    profiler = _active
+    return profiler.stage(name) if profiler is not None else _NULL_STAGE
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import requests
+
+THROTTLE_STATUSES = {429, 503}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=UTC)
+    return max(0.0, (when - datetime.now(UTC)).total_seconds())
+
+
+class AdaptiveRateLimiter:
+    # Token bucket whose refill rate follows AIMD: every healthy response nudges the rate
+    # up additively, while throttling, errors or latency spikes cut it multiplicatively.
+
+    def __init__(
+        self,
+        host: str,
+        logger: logging.Logger,
+        rate: float = 1.0,
+        min_rate: float = 0.2,
+        max_rate: float = 10.0,
+        increase: float = 0.05,
+        decrease: float = 0.5,
+        burst: float = 1.0,
+        spike_factor: float = 3.0,
+        cooldown: float = 1.0,
+        log_every: int = 50,
+    ) -> None:
+        self.host = host
+        self.logger = logger
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, min_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = max(1.0, burst)
+        self.spike_factor = spike_factor
+        self.cooldown = cooldown
+        self.log_every = log_every
+
+        self._rate = min(max(rate, min_rate), self.max_rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_backoff = 0.0
+        self._latency_ewma: Optional[float] = None
+        self._requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+    def observe_response(self, response: requests.Response, latency: float) -> None:
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if response.status_code in THROTTLE_STATUSES or retry_after is not None:
+            self._back_off(f"status={response.status_code}", retry_after)
+            return
+        # urllib3 retries 429/5xx transparently; its history still tells us we were throttled.
+        retries = getattr(getattr(response, "raw", None), "retries", None)
+        history = getattr(retries, "history", None) or ()
+        throttled = [entry.status for entry in history if entry.status in THROTTLE_STATUSES]
+        if throttled:
+            self._back_off(f"retried status={throttled[-1]}")
+            return
+        if response.status_code >= 500:
+            self._back_off(f"status={response.status_code}")
+            return
+        self._observe_latency(latency)
+
+    def observe_error(self, exc: BaseException) -> None:
+        self._back_off(f"error={type(exc).__name__}")
+
+    def _observe_latency(self, latency: float) -> None:
+        with self._lock:
+            ewma = self._latency_ewma
+            spike = ewma is not None and latency > ewma * self.spike_factor
+            self._latency_ewma = latency if ewma is None else 0.8 * ewma + 0.2 * latency
+            self._requests += 1
+            if not spike:
+                self._rate = min(self.max_rate, self._rate + self.increase)
+            rate, requests_seen = self._rate, self._requests
+        if spike:
+            self._back_off(f"latency={latency:.2f}s ewma={ewma:.2f}s")
+        elif self.log_every and requests_seen % self.log_every == 0:
+            self.logger.info(
+                "Rate limiter host=%s rate=%.2f/s latency_ewma=%.2fs requests=%s",
+                self.host,
+                rate,
+                self._latency_ewma or 0.0,
+                requests_seen,
+            )
+
+    def _back_off(self, reason: str, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            # Responses already in flight when we got throttled should not compound the cut.
+            if now - self._last_backoff < self.cooldown:
+                return
+            self._last_backoff = now
+            self._rate = max(self.min_rate, self._rate * self.decrease)
+            self._tokens = min(self._tokens, 0.0)
+            rate = self._rate
+        self.logger.warning(
+            "Rate limiter host=%s backing off to %.2f/s (%s%s)",
+            self.host,
+            rate,
+            reason,
+            f", pause={retry_after:.1f}s" if retry_after else "",
+        )
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self._rate)
@@ -1,30 +1,54 @@
 from __future__ import annotations
 
 import argparse
+import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
+from logging import Logger
+from typing import Iterator, List, Optional
+from urllib.parse import urlparse
 
-from . import scrape_dnb, scrape_hjem
+from . import memo, metrics, profiling, scrape_dnb, scrape_hjem
+from .cassette import CASSETTE_MODES, DEFAULT_CASSETTE_DIR
+from .checkpoint import DEFAULT_CHECKPOINT_DIR, RunCheckpoint
+from .fetcher import DEFAULT_CONCURRENCY
+from .loader import RejectSink, insert_rows
+from .profiling import DEFAULT_SAMPLE_INTERVAL_MS, PROFILE_MODES
+from .ratelimit import AdaptiveRateLimiter
+from .state import (
+    DEFAULT_FULL_SWEEP_DAYS,
+    DEFAULT_OVERLAP_HOURS,
+    DEFAULT_STATE_PATH,
+    WatermarkStore,
+    WatermarkTracker,
+)
+from .stats import RunStats
 from .utils import (
     COMMISSION_RATE_DEFAULT,
-    ListingRow,
+    CsvSink,
+    ListingBatch,
     build_session,
     connect_db,
     getenv,
     getenv_float,
     getenv_int,
     get_logger,
-    insert_rows,
     isoformat,
+    memo_fingerprint,
     now_utc,
+    rebatch,
     snapshot_filename,
-    write_csv,
 )
 
 DEFAULT_OUT_DIR = "out/raw"
+DEFAULT_BATCH_SIZE = 500
+REPLAY_RATE = 1_000_000.0
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Megler Monitor scraper runner.")
     parser.add_argument("--all", action="store_true", help="Run all scrapers.")
     parser.add_argument("--dnb", action="store_true", help="Run DNB scraper.")
@@ -33,7 +57,122 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--to", dest="publish_to", type=int, help="UNIX timestamp upper bound for Hjem publish_date.")
     parser.add_argument("--out", dest="out_dir", default=DEFAULT_OUT_DIR, help="Output directory root for CSV snapshots.")
     parser.add_argument("--db-url", dest="db_url", help="Override Postgres connection string.")
-    return parser.parse_args()
+    parser.add_argument(
+        "--state",
+        dest="state_path",
+        default=DEFAULT_STATE_PATH,
+        help="Path of the JSON file holding per-source watermarks.",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignore watermarks and run a full reconciliation sweep.",
+    )
+    parser.add_argument(
+        "--resume",
+        dest="resume_run_id",
+        metavar="RUN_ID",
+        help="Continue an interrupted run from its checkpoint, reusing its snapshot_at.",
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        dest="checkpoint_dir",
+        default=DEFAULT_CHECKPOINT_DIR,
+        help="Directory holding per-run checkpoints.",
+    )
+    parser.add_argument(
+        "--cassette",
+        dest="cassette_mode",
+        choices=CASSETTE_MODES,
+        default=getenv("SCRAPER_CASSETTE_MODE", "passthrough"),
+        help="Record HTTP traffic to, or replay it from, an on-disk cassette.",
+    )
+    parser.add_argument(
+        "--cassette-dir",
+        dest="cassette_dir",
+        default=DEFAULT_CASSETTE_DIR,
+        help="Directory holding recorded request/response pairs.",
+    )
+    parser.add_argument(
+        "--sequential",
+        action="store_true",
+        help="Run sources one after another instead of concurrently.",
+    )
+    parser.add_argument(
+        "--log-stats",
+        action="store_true",
+        help="Also log the per-stage timings and counters written to the run summary.",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        dest="metrics_file",
+        default=getenv("SCRAPER_METRICS_FILE", ""),
+        help=(
+            "Write Prometheus metrics to this .prom file "
+            "(e.g. inside the node_exporter textfile collector directory)."
+        ),
+    )
+    parser.add_argument(
+        "--metrics-push-url",
+        dest="metrics_push_url",
+        default=getenv("SCRAPER_METRICS_PUSH_URL", ""),
+        help="Push Prometheus metrics to this Pushgateway base URL.",
+    )
+    parser.add_argument(
+        "--memoize",
+        action="store_true",
+        default=getenv_int("SCRAPER_MEMOIZE", 0) > 0,
+        help="Cache results of the pure normalizer helpers and report hit rates in the run summary.",
+    )
+    parser.add_argument(
+        "--memo-cache",
+        dest="memo_cache",
+        default=getenv("SCRAPER_MEMO_CACHE", ""),
+        help="Load the helper caches from this file at start and save them at the end (implies --memoize).",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="cprofile",
+        choices=PROFILE_MODES,
+        help="Profile each pipeline stage with cprofile (default) or sample (collapsed stacks).",
+    )
+    parser.add_argument(
+        "--profile-interval",
+        dest="profile_interval_ms",
+        type=float,
+        default=DEFAULT_SAMPLE_INTERVAL_MS,
+        help="Sampling interval in milliseconds for --profile sample.",
+    )
+    return parser.parse_args(argv)
+
+
+@dataclass(slots=True)
+class RunSettings:
+    user_agent: str
+    rate: float
+    min_rate: float
+    max_rate: float
+    commission_rate: float
+    concurrency: int
+    snapshot_at: datetime
+    out_dir: str
+    db_url: str
+    batch_size: int
+    cassette_mode: str
+    cassette_dir: str
+    watermarks: WatermarkStore
+    checkpoint: RunCheckpoint
+    stats: RunStats
+    full_sweep_days: int
+    overlap_hours: int
+
+
+SOURCE_LABELS = {"dnb": "DNB", "hjem": "Hjem"}
+SOURCE_HOSTS = {
+    "dnb": urlparse(scrape_dnb.DNB_URL).netloc,
+    "hjem": urlparse(scrape_hjem.HJEM_URL).netloc,
+}
 
 
 def should_run(args: argparse.Namespace, flag: str) -> bool:
@@ -42,62 +181,269 @@ def should_run(args: argparse.Namespace, flag: str) -> bool:
     return getattr(args, flag)
 
 
+def plan_crawl(
+    source: str,
+    args: argparse.Namespace,
+    settings: RunSettings,
+) -> tuple[Optional[int], bool]:
+    # Returns (publish_from, full_sweep). Only Hjem can filter on publish_date, so DNB
+    # always sweeps; an explicit --from and/or --to window is honoured but is neither a full
+    # sweep nor incremental.
+    if source != "hjem":
+        return None, True
+    if args.publish_from is not None or args.publish_to is not None:
+        return args.publish_from, False
+    if args.full or settings.watermarks.needs_full_sweep(
+        source, settings.snapshot_at, settings.full_sweep_days
+    ):
+        return None, True
+    publish_from = settings.watermarks.incremental_from(source, settings.overlap_hours)
+    return publish_from, publish_from is None
+
+
+def iter_source(
+    source: str,
+    args: argparse.Namespace,
+    settings: RunSettings,
+    logger: Logger,
+    publish_from: Optional[int],
+) -> Iterator[ListingBatch]:
+    # Every source gets its own session (connection pool, retry budget) so a slow
+    # or throttled host never starves the other one.
+    session = build_session(
+        settings.user_agent,
+        pool_size=max(10, settings.concurrency),
+        cassette_mode=settings.cassette_mode,
+        cassette_dir=settings.cassette_dir,
+    )
+    # Replayed responses never touch the network, so pacing would only skew benchmarks.
+    unthrottled = settings.cassette_mode == "replay"
+    limiter = AdaptiveRateLimiter(
+        SOURCE_HOSTS[source],
+        logger,
+        rate=REPLAY_RATE if unthrottled else settings.rate,
+        min_rate=settings.min_rate,
+        max_rate=REPLAY_RATE if unthrottled else settings.max_rate,
+    )
+    if source == "dnb":
+        return scrape_dnb.iter_batches(
+            session,
+            logger,
+            limiter,
+            settings.snapshot_at,
+            settings.commission_rate,
+            concurrency=settings.concurrency,
+            checkpoint=settings.checkpoint.source(source),
+            stats=settings.stats.source(source),
+        )
+    return scrape_hjem.iter_batches(
+        session,
+        logger,
+        limiter,
+        settings.snapshot_at,
+        settings.commission_rate,
+        publish_from,
+        args.publish_to,
+        concurrency=settings.concurrency,
+        checkpoint=settings.checkpoint.source(source),
+        stats=settings.stats.source(source),
+    )
+
+
+def run_source(
+    source: str,
+    args: argparse.Namespace,
+    settings: RunSettings,
+    logger: Logger,
+    combined: CsvSink,
+) -> tuple[int, bool]:
+    # Streams batches from the collector straight into the CSV sinks and the database in
+    # bounded batches, so memory stays flat regardless of corpus size.
+    label = SOURCE_LABELS[source]
+    publish_from, full_sweep = plan_crawl(source, args, settings)
+    logger.info(
+        "%s crawl mode=%s publish_from=%s",
+        label,
+        "full" if full_sweep else "incremental",
+        publish_from,
+    )
+    tracker = WatermarkTracker()
+    stats = settings.stats.source(source)
+    conn = None
+    db_ok = True
+    inserted = 0
+    db_seconds = 0.0
+    total = 0
+    try:
+        if settings.db_url:
+            conn = connect_db(settings.db_url)
+        path = snapshot_filename(settings.out_dir, f"{source}_listings", settings.snapshot_at)
+        reject_path = snapshot_filename(settings.out_dir, f"{source}_rejects", settings.snapshot_at)
+        with CsvSink(path) as sink, RejectSink(reject_path) as rejects:
+            stream = iter_source(source, args, settings, logger, publish_from)
+            for batch in rebatch(stream, settings.batch_size):
+                with stats.timer("csv"), profiling.stage("csv"):
+                    sink.write(batch)
+                    combined.write(batch)
+                with stats.timer("state"), profiling.stage("state"):
+                    tracker.observe(batch)
+                total += len(batch)
+                stats.add("rows", len(batch))
+                if conn is not None and db_ok:
+                    try:
+                        started = time.perf_counter()
+                        with profiling.stage("db"):
+                            inserted += insert_rows(conn, batch, stats, rejects=rejects)
+                        db_seconds += time.perf_counter() - started
+                    except Exception as exc:  # noqa: BLE001
+                        db_ok = False
+                        stats.add("db_failures")
+                        logger.exception("Failed to insert %s rows into DB: %s", label, exc)
+        logger.info("%s rows=%s", label, total)
+        if rejects.rows_written:
+            logger.warning(
+                "%s rejected rows=%s written to %s", label, rejects.rows_written, reject_path
+            )
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("%s scraper failed after rows=%s: %s", label, total, exc)
+        stats.finish(False)
+        return total, False
+    finally:
+        if conn is not None:
+            conn.close()
+    if conn is not None and db_ok:
+        logger.info("%s inserted rows=%s seconds=%.2f", label, inserted, db_seconds)
+    complete = not settings.checkpoint.source(source).incomplete
+    if not (complete and db_ok):
+        # Advancing the watermark past slices or windows that failed (or rows the database
+        # never got) would make the next incremental run skip them for good.
+        logger.warning("%s run incomplete; keeping the previous watermark", label)
+        stats.finish(False)
+        return total, False
+
+    try:
+        new_ids, gone_ids = settings.watermarks.update(
+            source, tracker, settings.snapshot_at, full_sweep
+        )
+        settings.watermarks.save()
+        logger.info(
+            "%s watermark published=%s new_listings=%s gone_listings=%s",
+            label,
+            settings.watermarks.get(source).max_published,
+            new_ids,
+            gone_ids,
+        )
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Failed to persist %s watermark: %s", label, exc)
+
+    stats.finish(True)
+    return total, True
+
+
 def run() -> int:
     args = parse_args()
     logger = get_logger("scraper")
 
-    user_agent = getenv("SCRAPER_USER_AGENT", "MeglerMonitor/POC (+contact: you@example.com)")
-    min_sleep_ms = getenv_int("SCRAPER_MIN_SLEEP_MS", 500)
-    max_sleep_ms = getenv_int("SCRAPER_MAX_SLEEP_MS", 1500)
-    commission_rate = getenv_float("SCRAPER_COMMISSION_RATE", COMMISSION_RATE_DEFAULT)
-
-    session = build_session(user_agent)
-    snapshot_at = now_utc()
-    snapshot_iso = isoformat(snapshot_at)
-    logger.info("Starting scraper run snapshot_at=%s", snapshot_iso)
+    # The legacy jitter bounds still seed the starting rate when SCRAPER_RATE is unset.
+    legacy_interval_ms = (
+        getenv_int("SCRAPER_MIN_SLEEP_MS", 500) + getenv_int("SCRAPER_MAX_SLEEP_MS", 1500)
+    ) / 2
+    if args.resume_run_id:
+        checkpoint = RunCheckpoint.resume(args.checkpoint_dir, args.resume_run_id)
+    else:
+        checkpoint = RunCheckpoint.create(args.checkpoint_dir, now_utc())
+    settings = RunSettings(
+        user_agent=getenv("SCRAPER_USER_AGENT", "MeglerMonitor/POC (+contact: you@example.com)"),
+        rate=getenv_float("SCRAPER_RATE", 1000 / max(legacy_interval_ms, 1)),
+        min_rate=getenv_float("SCRAPER_MIN_RATE", 0.2),
+        max_rate=getenv_float("SCRAPER_MAX_RATE", 10.0),
+        commission_rate=getenv_float("SCRAPER_COMMISSION_RATE", COMMISSION_RATE_DEFAULT),
+        concurrency=max(1, getenv_int("SCRAPER_CONCURRENCY", DEFAULT_CONCURRENCY)),
+        snapshot_at=checkpoint.snapshot_at,
+        out_dir=args.out_dir,
+        db_url=args.db_url or getenv("SCRAPER_DB_URL", ""),
+        batch_size=max(1, getenv_int("SCRAPER_BATCH_SIZE", DEFAULT_BATCH_SIZE)),
+        cassette_mode=args.cassette_mode,
+        cassette_dir=args.cassette_dir,
+        watermarks=WatermarkStore.load(args.state_path),
+        checkpoint=checkpoint,
+        stats=RunStats(checkpoint.run_id, checkpoint.snapshot_at),
+        full_sweep_days=getenv_int("SCRAPER_FULL_SWEEP_DAYS", DEFAULT_FULL_SWEEP_DAYS),
+        overlap_hours=getenv_int("SCRAPER_WATERMARK_OVERLAP_HOURS", DEFAULT_OVERLAP_HOURS),
+    )
+    snapshot_iso = isoformat(settings.snapshot_at)
+    sources = [source for source in SOURCE_LABELS if should_run(args, source)]
+    logger.info(
+        "Starting scraper run run_id=%s snapshot_at=%s sources=%s mode=%s%s",
+        checkpoint.run_id,
+        snapshot_iso,
+        ",".join(sources),
+        "sequential" if args.sequential else "concurrent",
+        " (resumed)" if args.resume_run_id else "",
+    )
 
-    results: list[ListingRow] = []
-
-    if should_run(args, "dnb"):
+    if args.memoize or args.memo_cache:
+        memo.enable()
+    memo_stamp = memo_fingerprint()
+    if args.memo_cache:
         try:
-            dnb_rows = scrape_dnb.collect(session, logger, min_sleep_ms, max_sleep_ms, snapshot_at, commission_rate)
-            results.extend(dnb_rows)
-            write_csv(dnb_rows, snapshot_filename(args.out_dir, "dnb_listings", snapshot_at))
-            logger.info("DNB rows=%s", len(dnb_rows))
+            loaded = memo.load(args.memo_cache, memo_stamp)
+            logger.info("Memo cache %s entries=%s", args.memo_cache, loaded)
         except Exception as exc:  # noqa: BLE001
-            logger.exception("DNB scraper failed: %s", exc)
-
-    if should_run(args, "hjem"):
+            logger.warning("Ignoring unreadable memo cache %s: %s", args.memo_cache, exc)
+    if args.profile:
+        profiling.start(args.profile, args.profile_interval_ms)
+    combined_path = snapshot_filename(settings.out_dir, "all_listings", settings.snapshot_at)
+    try:
+        with CsvSink(combined_path, lazy=True) as combined:
+            if args.sequential or len(sources) < 2:
+                outcomes = [run_source(source, args, settings, logger, combined) for source in sources]
+            else:
+                with ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix="source") as pool:
+                    futures = [
+                        pool.submit(run_source, source, args, settings, logger, combined)
+                        for source in sources
+                    ]
+                    outcomes = [future.result() for future in futures]
+    finally:
+        if args.profile:
+            profile_dir = os.path.join(settings.out_dir, "profile", checkpoint.run_id)
+            written = profiling.stop(profile_dir)
+            logger.info("Profile (%s) written to %s files=%s", args.profile, profile_dir, len(written))
+    succeeded = all(ok for _, ok in outcomes)
+    if args.memo_cache:
         try:
-            hjem_rows = scrape_hjem.collect(
-                session,
-                logger,
-                min_sleep_ms,
-                max_sleep_ms,
-                snapshot_at,
-                commission_rate,
-                args.publish_from,
-                args.publish_to,
-            )
-            results.extend(hjem_rows)
-            write_csv(hjem_rows, snapshot_filename(args.out_dir, "hjem_listings", snapshot_at))
-            logger.info("Hjem rows=%s", len(hjem_rows))
+            saved = memo.save(args.memo_cache, memo_stamp)
+            logger.info("Memo cache saved to %s entries=%s", args.memo_cache, saved)
         except Exception as exc:  # noqa: BLE001
-            logger.exception("Hjem scraper failed: %s", exc)
-
-    if results:
-        write_csv(results, snapshot_filename(args.out_dir, "all_listings", snapshot_at))
-        logger.info("Total rows=%s", len(results))
+            logger.exception("Failed to save memo cache %s: %s", args.memo_cache, exc)
+    if combined.rows_written:
+        logger.info("Total rows=%s", combined.rows_written)
 
-    db_url = args.db_url or getenv("SCRAPER_DB_URL", "")
-    if db_url and results:
+    summary_path = snapshot_filename(settings.out_dir, "run_summary", settings.snapshot_at, "json")
+    summary = None
+    try:
+        summary = settings.stats.write(summary_path)
+        logger.info("Run summary written to %s", summary_path)
+        if args.log_stats:
+            settings.stats.log(logger, summary)
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Failed to write run summary: %s", exc)
+    if summary is not None and (args.metrics_file or args.metrics_push_url):
         try:
-            with connect_db(db_url) as conn:
-                inserted = insert_rows(conn, results)
-                logger.info("Inserted rows=%s", inserted)
+            targets = metrics.export(summary, args.metrics_file or None, args.metrics_push_url or None)
+            logger.info("Metrics exported to %s", ", ".join(targets))
         except Exception as exc:  # noqa: BLE001
-            logger.exception("Failed to insert into DB: %s", exc)
+            logger.exception("Failed to export metrics: %s", exc)
 
+    if succeeded:
+        checkpoint.discard()
+    else:
+        logger.warning(
+            "Run incomplete; continue it with --resume %s (checkpoint in %s)",
+            checkpoint.run_id,
+            checkpoint.directory,
+        )
     logger.info("Scraper run complete snapshot_at=%s", snapshot_iso)
     return 0
 
@@ -1,48 +1,46 @@
 from __future__ import annotations
 
 import math
+import time
 from datetime import datetime
-from typing import List
+from typing import Iterator, List, Optional
 
+from .checkpoint import SourceCheckpoint
+from .enrich import classify_batch, enrich_batch
+from .fetcher import DEFAULT_CONCURRENCY, fetch_unordered, post_json, retry_call
+from . import profiling
+from .ratelimit import AdaptiveRateLimiter
+from .stats import SourceStats
 from .utils import (
+    ListingBatch,
     ListingRow,
     clean_price,
-    derive_price_bucket,
-    derive_segment,
     detect_broker_role,
-    determine_is_sold,
-    estimate_commission,
     extract_dnb_location_fields,
     extract_dnb_published,
     extract_postal_code,
+    getenv,
     infer_district,
     isoformat,
-    jitter_sleep,
     map_dnb_status,
     map_dnb_type,
     now_utc,
     parse_datetime,
 )
 
-DNB_URL = "https://dnbeiendom.no/api/v1/cognitivesearch/properties"
+DNB_URL = getenv("SCRAPER_DNB_URL", "https://dnbeiendom.no/api/v1/cognitivesearch/properties")
 HEADERS = {"Referer": "https://dnbeiendom.no/"}
 BASE_PAYLOAD = {
     "facets": [],
     "filter": "(status eq 2 and projectRelation eq 3 or (projectRelation eq 1 and status ne 99)) and status ne 3 and status ne null and not (projectRelation eq 1 and status eq 99) and not (projectRelation eq 2 and status eq 99)",
     "orderBy": ["forSaleDate desc", "created desc"],
+    # Only the fields normalize_listing reads; everything else is dropped server-side
+    # instead of being transferred and decoded for nothing.
     "select": [
         "id",
-        "size",
-        "area",
-        "units",
-        "areas",
-        "noOfBedRooms",
-        "propertyBaseType",
         "propertyTypeId",
-        "ownership",
         "heading",
         "showings",
-        "assignmentNum",
         "forSaleDate",
         "created",
         "status",
@@ -56,7 +54,12 @@ BASE_PAYLOAD = {
 }
 
 
-def normalize_listing(doc: dict, snapshot_at: datetime, commission_rate: float) -> List[ListingRow]:
+def normalize_listing(
+    doc: dict,
+    snapshot_at: datetime,
+    commission_rate: float,
+    batch: Optional[ListingBatch] = None,
+) -> ListingBatch:
     snapshot_iso = isoformat(snapshot_at)
     last_seen = isoformat(now_utc())
 
@@ -71,10 +74,7 @@ def normalize_listing(doc: dict, snapshot_at: datetime, commission_rate: float)
     price_obj = doc.get("price") or {}
     price = price_obj.get("salePrice") or price_obj.get("askingPrice") or price_obj.get("totalPrice")
     price_int = clean_price(price)
-    commission_est = estimate_commission(price_int, commission_rate)
-    price_bucket = derive_price_bucket(price_int)
     property_type = map_dnb_type(doc.get("propertyTypeId"))
-    segment = derive_segment(property_type, title)
 
     brokers = {}
     for broker in doc.get("brokers") or []:
@@ -92,76 +92,190 @@ def normalize_listing(doc: dict, snapshot_at: datetime, commission_rate: float)
     published_dt = parse_datetime(published_raw)
     published = isoformat(published_dt) if published_dt else published_raw
     status = map_dnb_status(doc.get("status"))
-    is_sold = determine_is_sold(status)
-
-    rows: List[ListingRow] = []
-    for name, title_text in brokers.items():
-        role = detect_broker_role(title_text)
-        rows.append(
-            ListingRow(
-                source="DNB",
-                listing_id=listing_id,
-                title=title,
-                address=address,
-                city=city,
-                district=district,
-                chain="DNB Eiendom",
-                broker=name,
-                price=price_int,
-                commission_est=commission_est,
-                status=status,
-                published=published,
-                property_type=property_type,
-                segment=segment,
-                price_bucket=price_bucket,
-                broker_role=role,
-                role=role,
-                is_sold=is_sold,
-                last_seen_at=last_seen,
-                snapshot_at=snapshot_iso,
-            )
+
+    # Roles are resolved before anything is appended, so a failure cannot leave a
+    # half-written listing in the batch.
+    roles = [(name, detect_broker_role(title_text)) for name, title_text in brokers.items()]
+    # segment, commission_est, price_bucket and is_sold are derived for the whole batch by
+    # classify_batch and enrich_batch; a caller passing its own batch runs them after the
+    # last listing.
+    own_batch = batch is None
+    if batch is None:
+        batch = ListingBatch()
+    for name, role in roles:
+        batch.append(
+            source="DNB",
+            listing_id=listing_id,
+            title=title,
+            address=address,
+            city=city,
+            district=district,
+            chain="DNB Eiendom",
+            broker=name,
+            price=price_int,
+            commission_est=None,
+            status=status,
+            published=published,
+            property_type=property_type,
+            segment=None,
+            price_bucket=None,
+            broker_role=role,
+            role=role,
+            is_sold=None,
+            last_seen_at=last_seen,
+            snapshot_at=snapshot_iso,
         )
-    return rows
+    if own_batch:
+        enrich_batch(classify_batch(batch), commission_rate)
+    return batch
 
 
-def collect(
+def fetch_window(
     session,
     logger,
-    min_sleep_ms: int,
-    max_sleep_ms: int,
+    limiter: AdaptiveRateLimiter,
+    skip: int,
+    top: int,
+    stats: Optional[SourceStats] = None,
+) -> dict:
+    payload = dict(BASE_PAYLOAD, skip=skip, top=top)
+    logger.info("DNB skip=%s top=%s", skip, top)
+    return post_json(session, DNB_URL, payload, limiter, headers=HEADERS, stats=stats)
+
+
+def plan_windows(total: int, top: int, start: int = 0) -> List[int]:
+    return list(range(start, total, top))
+
+
+def iter_batches(
+    session,
+    logger,
+    limiter: AdaptiveRateLimiter,
     snapshot_at: datetime,
     commission_rate: float,
-) -> List[ListingRow]:
-    rows: List[ListingRow] = []
+    concurrency: int = DEFAULT_CONCURRENCY,
+    checkpoint: Optional[SourceCheckpoint] = None,
+    stats: Optional[SourceStats] = None,
+) -> Iterator[ListingBatch]:
+    # Yields one ListingBatch per result window.
+    seen_ids: set[str] = set()
     top = BASE_PAYLOAD["top"]
-    skip = 0
-    total = None
 
-    while True:
-        payload = dict(BASE_PAYLOAD, skip=skip, top=top)
-        logger.info("DNB skip=%s top=%s", skip, top)
-        response = session.post(DNB_URL, headers=HEADERS, json=payload, timeout=30)
-        response.raise_for_status()
-        data = response.json()
+    def normalize_window(skip: int, documents: list, total: Optional[int] = None) -> ListingBatch:
+        window_rows = ListingBatch()
+        duplicates = failures = 0
+        started = time.perf_counter()
+        with profiling.stage("normalize"):
+            for doc in documents:
+                doc_id = str(doc.get("id") or "")
+                if doc_id and doc_id in seen_ids:
+                    duplicates += 1
+                    continue
+                seen_ids.add(doc_id)
+                try:
+                    normalize_listing(doc, snapshot_at, commission_rate, window_rows)
+                except Exception as exc:  # noqa: BLE001
+                    failures += 1
+                    logger.warning("Failed to normalize DNB hit: %s", exc, exc_info=True)
+            enrich_batch(classify_batch(window_rows), commission_rate)
+        if stats is not None:
+            elapsed = time.perf_counter() - started
+            stats.add_time("normalize", elapsed)
+            if window_rows and elapsed > 0:
+                stats.observe("normalize_rows_per_second", len(window_rows) / elapsed)
+            stats.add("hits", len(documents))
+            stats.add("duplicates", duplicates)
+            stats.add("normalize_failures", failures)
+        if checkpoint is not None:
+            checkpoint.record(f"skip={skip}", window_rows, {"skip": skip, "top": top, "total": total})
+        return window_rows
+
+    def restore(skip: int) -> Optional[ListingBatch]:
+        restored = checkpoint.batch(f"skip={skip}") if checkpoint is not None else None
+        if restored is not None:
+            seen_ids.update(filter(None, restored.distinct("listing_id")))
+        return restored
 
-        documents = data.get("documents") or []
+    def load_window(skip: int) -> Optional[dict]:
+        try:
+            return retry_call(
+                lambda: fetch_window(session, logger, limiter, skip, top, stats),
+                logger,
+                f"DNB window skip={skip}",
+                stats=stats,
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.error("DNB window skip=%s failed permanently: %s", skip, exc)
+            return None
+
+    # The first window tells us the corpus size; everything after it is planned up front.
+    first_rows = restore(0)
+    resumed = first_rows is not None
+    if first_rows is not None:
+        total = (checkpoint.cursor("skip=0") or {}).get("total") or 0
+    else:
+        first = retry_call(
+            lambda: fetch_window(session, logger, limiter, 0, top, stats),
+            logger,
+            "DNB window skip=0",
+            stats=stats,
+        )
+        documents = first.get("documents") or []
         if not documents:
-            logger.info("DNB no more results at skip=%s", skip)
-            break
+            logger.info("DNB no results")
+            return
+        total = first.get("totalCount") or 0
+        first_rows = normalize_window(0, documents, total)
+    yield first_rows
 
-        for doc in documents:
-            try:
-                rows.extend(normalize_listing(doc, snapshot_at, commission_rate))
-            except Exception as exc:  # noqa: BLE001
-                logger.warning("Failed to normalize DNB hit: %s", exc, exc_info=True)
+    windows = plan_windows(total, top, start=top)
+    pending: List[int] = []
+    completed: List[int] = []
+    for skip in windows:
+        done = checkpoint is not None and f"skip={skip}" in checkpoint
+        (completed if done else pending).append(skip)
+    logger.info(
+        "DNB totalCount=%s windows=%s resumed=%s concurrency=%s",
+        total,
+        len(windows) + 1,
+        int(resumed) + len(completed),
+        concurrency,
+    )
+    for skip in completed:
+        restored = restore(skip)
+        if restored is not None:
+            yield restored
 
-        skip += top
-        total = data.get("totalCount") or total
-        if total and skip >= total:
-            break
-        if len(documents) < top:
-            break
+    failed: List[int] = []
+    for skip, data in fetch_unordered(load_window, pending, concurrency=concurrency):
+        if data is None:
+            failed.append(skip)
+            continue
+        yield normalize_window(skip, data.get("documents") or [], total)
+
+    if failed:
+        if checkpoint is not None:
+            checkpoint.mark_incomplete()
+        if stats is not None:
+            stats.add("failed_units", len(failed))
+        logger.warning(
+            "DNB incomplete: %s of %s windows failed skips=%s",
+            len(failed),
+            len(windows) + 1,
+            sorted(failed),
+        )
 
-        jitter_sleep(min_sleep_ms, max_sleep_ms)
 
-    return rows
+def collect(
+    session,
+    logger,
+    limiter: AdaptiveRateLimiter,
+    snapshot_at: datetime,
+    commission_rate: float,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    checkpoint: Optional[SourceCheckpoint] = None,
+) -> List[ListingRow]:
+    batches = iter_batches(
+        session, logger, limiter, snapshot_at, commission_rate, concurrency, checkpoint
+    )
+    return [row for batch in batches for row in batch.rows()]
@@ -1,29 +1,40 @@
 from __future__ import annotations
 
+import itertools
 import math
+import time
+from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
+from .checkpoint import SourceCheckpoint
+from .enrich import classify_batch, enrich_batch
+from .fetcher import DEFAULT_CONCURRENCY, fetch_ordered, fetch_unordered, post_json, retry_call
+from . import profiling
+from .ratelimit import AdaptiveRateLimiter
+from .stats import SourceStats
 from .utils import (
     START_2024_TS,
+    ListingBatch,
     ListingRow,
     clean_price,
-    derive_price_bucket,
-    derive_segment,
     detect_broker_role,
-    determine_is_sold,
-    estimate_commission,
     extract_postal_code,
+    getenv,
     infer_district,
     isoformat,
-    jitter_sleep,
     map_hjem_type,
     now_utc,
     parse_datetime,
+    postal_city,
 )
 
-HJEM_URL = "https://apigw.hjem.no/search-backend/api/v4/property/search"
+HJEM_URL = getenv("SCRAPER_HJEM_URL", "https://apigw.hjem.no/search-backend/api/v4/property/search")
+HEADERS = {"Referer": "https://hjem.no/"}
 PAGE_SIZE = 50
+SLICE_SECONDS = 30 * 24 * 3600
+MAX_SLICE_RESULTS = 20 * PAGE_SIZE
+MIN_SLICE_SECONDS = 3600
 
 BASE_PAYLOAD = {
     "listing_type": "residential_sale",
@@ -34,6 +45,46 @@ BASE_PAYLOAD = {
 }
 
 
+@dataclass(frozen=True, slots=True)
+class Slice:
+    # Inclusive publish_date window; neighbouring slices never share a second.
+    start: int
+    end: int
+
+    def bisect(self) -> tuple["Slice", "Slice"]:
+        middle = (self.start + self.end) // 2
+        return Slice(self.start, middle), Slice(middle + 1, self.end)
+
+    @property
+    def seconds(self) -> int:
+        return self.end - self.start + 1
+
+
+def plan_initial_slices(publish_from: int, publish_to: int, width: int = SLICE_SECONDS) -> List[Slice]:
+    slices: List[Slice] = []
+    start = publish_from
+    while start <= publish_to:
+        end = min(start + width - 1, publish_to)
+        slices.append(Slice(start, end))
+        start = end + 1
+    # Newest first, matching the API's own ordering.
+    return list(reversed(slices))
+
+
+def slice_unit(window: Slice) -> str:
+    return f"slice={window.start}..{window.end}"
+
+
+def response_total(data: dict) -> Optional[int]:
+    # The search backend has reported the hit count under a few different keys.
+    for container in (data, data.get("meta") or {}, data.get("pagination") or {}):
+        for key in ("total", "total_count", "totalCount", "total_hits"):
+            value = container.get(key)
+            if isinstance(value, int):
+                return value
+    return None
+
+
 def build_payload(page: int, publish_from: Optional[int], publish_to: Optional[int]) -> dict:
     payload = dict(BASE_PAYLOAD, page=page)
     payload["publish_date_min"] = publish_from or START_2024_TS
@@ -41,7 +92,12 @@ def build_payload(page: int, publish_from: Optional[int], publish_to: Optional[i
     return payload
 
 
-def normalize_listing(hit: dict, snapshot_at: datetime, commission_rate: float) -> List[ListingRow]:
+def normalize_listing(
+    hit: dict,
+    snapshot_at: datetime,
+    commission_rate: float,
+    batch: Optional[ListingBatch] = None,
+) -> ListingBatch:
     snapshot_iso = isoformat(snapshot_at)
     last_seen = isoformat(now_utc())
 
@@ -52,6 +108,7 @@ def normalize_listing(hit: dict, snapshot_at: datetime, commission_rate: float)
     address = address_info.get("display_name")
     city = address_info.get("postal_place") or address_info.get("city")
     postal_code = address_info.get("postal_code") or extract_postal_code(address, hit.get("title"))
+    city = city or postal_city(postal_code)
     district = infer_district(city, postal_code)
 
     agency = hit.get("agency") or {}
@@ -63,8 +120,6 @@ def normalize_listing(hit: dict, snapshot_at: datetime, commission_rate: float)
         or prices.get("total_price", {}).get("amount")
     )
     price_int = clean_price(amount)
-    commission_est = estimate_commission(price_int, commission_rate)
-    price_bucket = derive_price_bucket(price_int)
 
     contacts = [
         contact
@@ -76,81 +131,290 @@ def normalize_listing(hit: dict, snapshot_at: datetime, commission_rate: float)
 
     published_dt = parse_datetime(hit.get("publish_date"))
     property_type = map_hjem_type(hit.get("type"))
-    segment = derive_segment(property_type, title)
     status = hit.get("status")
-    is_sold = determine_is_sold(status)
-
-    rows: List[ListingRow] = []
-    for contact in contacts:
-        broker_name = contact.get("name") if contact else None
-        broker_title = contact.get("position") if contact else None
-        role = detect_broker_role(broker_title)
-        rows.append(
-            ListingRow(
-                source="Hjem.no",
-                listing_id=listing_id,
-                title=title,
-                address=address,
-                city=city,
-                district=district,
-                chain=chain,
-                broker=broker_name,
-                price=price_int,
-                commission_est=commission_est,
-                status=status,
-                published=isoformat(published_dt) if published_dt else None,
-                property_type=property_type,
-                segment=segment,
-                price_bucket=price_bucket,
-                broker_role=role,
-                role=role,
-                is_sold=is_sold,
-                last_seen_at=last_seen,
-                snapshot_at=snapshot_iso,
+
+    # Roles are resolved before anything is appended, so a failure cannot leave a
+    # half-written listing in the batch.
+    brokers = [
+        (
+            contact.get("name") if contact else None,
+            detect_broker_role(contact.get("position") if contact else None),
+        )
+        for contact in contacts
+    ]
+    # segment, commission_est, price_bucket and is_sold are derived for the whole batch by
+    # classify_batch and enrich_batch; a caller passing its own batch runs them after the
+    # last listing.
+    own_batch = batch is None
+    if batch is None:
+        batch = ListingBatch()
+    published = isoformat(published_dt) if published_dt else None
+    for broker_name, role in brokers:
+        batch.append(
+            source="Hjem.no",
+            listing_id=listing_id,
+            title=title,
+            address=address,
+            city=city,
+            district=district,
+            chain=chain,
+            broker=broker_name,
+            price=price_int,
+            commission_est=None,
+            status=status,
+            published=published,
+            property_type=property_type,
+            segment=None,
+            price_bucket=None,
+            broker_role=role,
+            role=role,
+            is_sold=None,
+            last_seen_at=last_seen,
+            snapshot_at=snapshot_iso,
+        )
+    if own_batch:
+        enrich_batch(classify_batch(batch), commission_rate)
+    return batch
+
+
+def fetch_page(
+    session,
+    logger,
+    limiter: AdaptiveRateLimiter,
+    window: Slice,
+    page: int,
+    stats: Optional[SourceStats] = None,
+) -> dict:
+    payload = build_payload(page, window.start, window.end)
+    logger.info("Hjem.no slice=%s..%s page=%s", window.start, window.end, page)
+    return post_json(session, HJEM_URL, payload, limiter, headers=HEADERS, stats=stats)
+
+
+def plan_slices(
+    session,
+    logger,
+    limiter: AdaptiveRateLimiter,
+    initial: List[Slice],
+    concurrency: int,
+    stats: Optional[SourceStats] = None,
+) -> tuple[List[tuple[Slice, dict]], List[Slice]]:
+    # Probe page 1 of every slice and bisect the ones that would need deep pagination.
+    # The probe response is kept so the crawl does not request page 1 twice. Windows whose
+    # probe fails for good are returned separately so the caller can treat them as failed
+    # slices instead of losing the whole crawl.
+    leaves: List[tuple[Slice, dict]] = []
+    unprobed: List[Slice] = []
+
+    def probe(window: Slice) -> Optional[dict]:
+        try:
+            return retry_call(
+                lambda: fetch_page(session, logger, limiter, window, 1, stats),
+                logger,
+                f"Hjem.no probe {window.start}..{window.end}",
+                stats=stats,
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.error(
+                "Hjem.no probe slice=%s..%s failed permanently: %s", window.start, window.end, exc
             )
+            return None
+
+    pending = initial
+    while pending:
+        split: List[Slice] = []
+        for window, data in fetch_unordered(probe, pending, concurrency=concurrency):
+            if data is None:
+                unprobed.append(window)
+                continue
+            total = response_total(data)
+            if total is not None and total > MAX_SLICE_RESULTS and window.seconds > MIN_SLICE_SECONDS:
+                logger.info("Hjem.no bisecting slice=%s..%s total=%s", window.start, window.end, total)
+                if stats is not None:
+                    stats.add("bisections")
+                split.extend(window.bisect())
+            else:
+                leaves.append((window, data))
+        pending = split
+    leaves.sort(key=lambda leaf: leaf[0].start, reverse=True)
+    unprobed.sort(key=lambda window: window.start, reverse=True)
+    return leaves, unprobed
+
+
+def crawl_slice(
+    session,
+    logger,
+    limiter: AdaptiveRateLimiter,
+    window: Slice,
+    first_page: Optional[dict],
+    concurrency: int,
+    stats: Optional[SourceStats] = None,
+) -> List[dict]:
+    if first_page is None:
+        first_page = fetch_page(session, logger, limiter, window, 1, stats)
+    ads: List[dict] = list(first_page.get("data") or [])
+    if len(ads) < PAGE_SIZE:
+        return ads
+    pages = fetch_ordered(
+        lambda page: fetch_page(session, logger, limiter, window, page, stats).get("data") or [],
+        itertools.count(2),
+        concurrency=concurrency,
+        is_last=lambda page_ads: len(page_ads) < PAGE_SIZE,
+    )
+    for _, page_ads in pages:
+        ads.extend(page_ads)
+    return ads
+
+
+def iter_batches(
+    session,
+    logger,
+    limiter: AdaptiveRateLimiter,
+    snapshot_at: datetime,
+    commission_rate: float,
+    publish_from: Optional[int],
+    publish_to: Optional[int],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    checkpoint: Optional[SourceCheckpoint] = None,
+    stats: Optional[SourceStats] = None,
+) -> Iterator[ListingBatch]:
+    # Yields one ListingBatch per publish-date slice.
+    seen_ids: set[str] = set()
+    # Pin the bounds so every slice is planned against the same window.
+    publish_from = publish_from or START_2024_TS
+    publish_to = publish_to or int(datetime.now().timestamp())
+
+    # A resumed run reuses the recorded plan so completed slices line up exactly; windows
+    # whose probe failed are planned again.
+    plan = (checkpoint.cursor("plan") or {}) if checkpoint is not None else {}
+    leaves: List[tuple[Slice, Optional[dict]]]
+    if "slices" in plan:
+        leaves = [(Slice(start, end), None) for start, end in plan["slices"]]
+        to_plan = [Slice(start, end) for start, end in plan.get("unprobed") or []]
+    else:
+        leaves = []
+        to_plan = plan_initial_slices(publish_from, publish_to)
+    unprobed: List[Slice] = []
+    if to_plan:
+        planned, unprobed = plan_slices(session, logger, limiter, to_plan, concurrency, stats)
+        leaves.extend(planned)
+        leaves.sort(key=lambda leaf: leaf[0].start, reverse=True)
+        if checkpoint is not None:
+            checkpoint.record(
+                "plan",
+                cursor={
+                    "slices": [[window.start, window.end] for window, _ in leaves],
+                    "unprobed": [[window.start, window.end] for window in unprobed],
+                },
+            )
+
+    pending: List[tuple[Slice, Optional[dict]]] = []
+    completed: List[Slice] = []
+    for window, first_page in leaves:
+        if checkpoint is not None and slice_unit(window) in checkpoint:
+            completed.append(window)
+        else:
+            pending.append((window, first_page))
+    if completed:
+        logger.info("Hjem.no resumed slices=%s of %s", len(completed), len(leaves))
+    for window in completed:
+        restored = checkpoint.batch(slice_unit(window))
+        if restored is not None:
+            seen_ids.update(filter(None, restored.distinct("listing_id")))
+            yield restored
+    slice_workers = max(1, min(concurrency, len(pending)))
+    page_concurrency = max(1, concurrency // slice_workers)
+    logger.info(
+        "Hjem.no slices=%s slice_workers=%s page_concurrency=%s",
+        len(leaves),
+        slice_workers,
+        page_concurrency,
+    )
+
+    def load_slice(leaf: tuple[Slice, Optional[dict]]) -> Optional[List[dict]]:
+        window, first_page = leaf
+        try:
+            return retry_call(
+                lambda: crawl_slice(
+                    session, logger, limiter, window, first_page, page_concurrency, stats
+                ),
+                logger,
+                f"Hjem.no slice {window.start}..{window.end}",
+                stats=stats,
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.error("Hjem.no slice=%s..%s failed permanently: %s", window.start, window.end, exc)
+            return None
+
+    failed: List[Slice] = list(unprobed)
+    for (window, _), ads in fetch_unordered(load_slice, pending, concurrency=slice_workers):
+        if ads is None:
+            failed.append(window)
+            continue
+        slice_rows = ListingBatch()
+        duplicates = failures = 0
+        started = time.perf_counter()
+        with profiling.stage("normalize"):
+            for ad in ads:
+                ad_id = str(ad.get("id") or "")
+                if ad_id and ad_id in seen_ids:
+                    duplicates += 1
+                    continue
+                seen_ids.add(ad_id)
+                try:
+                    normalize_listing(ad, snapshot_at, commission_rate, slice_rows)
+                except Exception as exc:  # noqa: BLE001
+                    failures += 1
+                    logger.warning("Failed to normalize Hjem hit: %s", exc, exc_info=True)
+            enrich_batch(classify_batch(slice_rows), commission_rate)
+        if stats is not None:
+            elapsed = time.perf_counter() - started
+            stats.add_time("normalize", elapsed)
+            if slice_rows and elapsed > 0:
+                stats.observe("normalize_rows_per_second", len(slice_rows) / elapsed)
+            stats.add("hits", len(ads))
+            stats.add("duplicates", duplicates)
+            stats.add("normalize_failures", failures)
+        if checkpoint is not None:
+            checkpoint.record(
+                slice_unit(window),
+                slice_rows,
+                {"start": window.start, "end": window.end, "hits": len(ads)},
+            )
+        yield slice_rows
+
+    if failed:
+        if checkpoint is not None:
+            checkpoint.mark_incomplete()
+        if stats is not None:
+            stats.add("failed_units", len(failed))
+        logger.warning(
+            "Hjem.no incomplete: %s of %s slices failed; re-run with --resume or --from/--to: %s",
+            len(failed),
+            len(leaves) + len(unprobed),
+            ", ".join(f"{window.start}..{window.end}" for window in failed),
         )
-    return rows
 
 
 def collect(
     session,
     logger,
-    min_sleep_ms: int,
-    max_sleep_ms: int,
+    limiter: AdaptiveRateLimiter,
     snapshot_at: datetime,
     commission_rate: float,
     publish_from: Optional[int],
     publish_to: Optional[int],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    checkpoint: Optional[SourceCheckpoint] = None,
 ) -> List[ListingRow]:
-    rows: List[ListingRow] = []
-    page = 1
-
-    while True:
-        payload = build_payload(page, publish_from, publish_to)
-        logger.info("Hjem.no page=%s", page)
-        response = session.post(
-            HJEM_URL,
-            headers={"Referer": "https://hjem.no/"},
-            json=payload,
-            timeout=30,
-        )
-        response.raise_for_status()
-        data = response.json()
-
-        ads = data.get("data") or []
-        if not ads:
-            logger.info("Hjem.no no data at page=%s", page)
-            break
-
-        for ad in ads:
-            try:
-                rows.extend(normalize_listing(ad, snapshot_at, commission_rate))
-            except Exception as exc:  # noqa: BLE001
-                logger.warning("Failed to normalize Hjem hit: %s", exc, exc_info=True)
-
-        if len(ads) < payload["size"]:
-            break
-        page += 1
-        jitter_sleep(min_sleep_ms, max_sleep_ms)
-
-    return rows
+    batches = iter_batches(
+        session,
+        logger,
+        limiter,
+        snapshot_at,
+        commission_rate,
+        publish_from,
+        publish_to,
+        concurrency,
+        checkpoint,
+    )
+    return [row for batch in batches for row in batch.rows()]
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+
+from .utils import ListingBatch, ensure_dir, isoformat, parse_datetime
+
+DEFAULT_STATE_PATH = "out/state/watermarks.json"
+DEFAULT_FULL_SWEEP_DAYS = 7
+DEFAULT_OVERLAP_HOURS = 24
+
+
+@dataclass(slots=True)
+class SourceWatermark:
+    max_published: Optional[str] = None
+    last_run_at: Optional[str] = None
+    last_full_sweep_at: Optional[str] = None
+    listing_ids: list[str] = field(default_factory=list)
+
+
+class WatermarkTracker:
+    # Accumulates what a run has seen while rows stream past, without keeping the rows.
+
+    def __init__(self) -> None:
+        self.seen: set[str] = set()
+        self.max_published: Optional[datetime] = None
+
+    def observe(self, batch: ListingBatch) -> None:
+        self.seen.update(filter(None, batch.columns["listing_id"]))
+        # Broker rows repeat their listing's publish date, so parse each value once.
+        for value in batch.distinct("published"):
+            published = parse_datetime(value)
+            if published and (self.max_published is None or published > self.max_published):
+                self.max_published = published
+
+
+class WatermarkStore:
+    # Per-source crawl state persisted as a small JSON file so nightly runs can resume
+    # from the newest publish_date they have already seen.
+
+    def __init__(self, path: str, watermarks: Optional[dict[str, SourceWatermark]] = None) -> None:
+        self.path = path
+        self.watermarks = watermarks or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "WatermarkStore":
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, encoding="utf-8") as handle:
+            raw = json.load(handle)
+        return cls(path, {source: SourceWatermark(**data) for source, data in raw.items()})
+
+    def get(self, source: str) -> SourceWatermark:
+        with self._lock:
+            return self.watermarks.get(source) or SourceWatermark()
+
+    def needs_full_sweep(self, source: str, now: datetime, every_days: int) -> bool:
+        last_full = parse_datetime(self.get(source).last_full_sweep_at)
+        if last_full is None or every_days <= 0:
+            return True
+        return now - last_full >= timedelta(days=every_days)
+
+    def incremental_from(self, source: str, overlap_hours: int) -> Optional[int]:
+        published = parse_datetime(self.get(source).max_published)
+        if published is None:
+            return None
+        return int((published - timedelta(hours=overlap_hours)).timestamp())
+
+    def update(
+        self,
+        source: str,
+        tracker: WatermarkTracker,
+        run_at: datetime,
+        full_sweep: bool,
+    ) -> tuple[int, int]:
+        with self._lock:
+            previous = self.watermarks.get(source) or SourceWatermark()
+            known = set(previous.listing_ids)
+            seen = tracker.seen
+            max_published = parse_datetime(previous.max_published)
+            if tracker.max_published and (max_published is None or tracker.max_published > max_published):
+                max_published = tracker.max_published
+
+            new_ids = len(seen - known)
+            # A full sweep is authoritative for the listing set; incremental runs only add to it.
+            gone_ids = len(known - seen) if full_sweep else 0
+            self.watermarks[source] = SourceWatermark(
+                max_published=isoformat(max_published) if max_published else None,
+                last_run_at=isoformat(run_at),
+                last_full_sweep_at=isoformat(run_at) if full_sweep else previous.last_full_sweep_at,
+                listing_ids=sorted(seen if full_sweep else known | seen),
+            )
+            return new_ids, gone_ids
+
+    def save(self) -> None:
+        with self._lock:
+            ensure_dir(os.path.dirname(self.path) or ".")
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump(
+                    {source: asdict(mark) for source, mark in self.watermarks.items()},
+                    handle,
+                    ensure_ascii=False,
+                )
+            os.replace(tmp_path, self.path)
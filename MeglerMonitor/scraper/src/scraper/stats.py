@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, Optional
+
+from . import memo
+from .metrics import Histogram, histogram_for
+from .utils import ensure_dir, isoformat, now_utc
+
+# Stages are timed in thread-seconds: with concurrent fetch workers the "http" total can
+# exceed the wall time of the source, which is recorded separately as wall_seconds.
+STAGES = (
+    "rate_limit_wait",
+    "http",
+    "decode",
+    "normalize",
+    "csv",
+    "state",
+    "db_copy",
+    "db_insert",
+    "db_commit",
+    "db_rollback",
+)
+
+
+class SourceStats:
+    # Thread-safe counters and stage timers for one source in one run.
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.counters: dict[str, int] = {}
+        self.seconds: dict[str, float] = {}
+        self.calls: dict[str, int] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self.started = time.perf_counter()
+        self.wall_seconds: Optional[float] = None
+        self.ok: Optional[bool] = None
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = histogram_for(name)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - started)
+
+    def finish(self, ok: bool) -> None:
+        self.wall_seconds = time.perf_counter() - self.started
+        self.ok = ok
+        self.observe("run_duration_seconds", self.wall_seconds)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            order = sorted(self.seconds, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES))
+            stages = {
+                stage: {"seconds": round(self.seconds[stage], 4), "calls": self.calls[stage]}
+                for stage in order
+            }
+            wall = self.wall_seconds
+            if wall is None:
+                wall = time.perf_counter() - self.started
+            rows = self.counters.get("rows", 0)
+            return {
+                "ok": self.ok,
+                "wall_seconds": round(wall, 3),
+                "rows_per_second": round(rows / wall, 2) if wall else None,
+                "counters": dict(sorted(self.counters.items())),
+                "stages": stages,
+                "histograms": {
+                    name: histogram.as_dict() for name, histogram in sorted(self.histograms.items())
+                },
+            }
+
+
+class RunStats:
+    def __init__(self, run_id: str, snapshot_at: datetime) -> None:
+        self.run_id = run_id
+        self.snapshot_at = snapshot_at
+        self.started_at = now_utc()
+        self.started = time.perf_counter()
+        self._sources: dict[str, SourceStats] = {}
+        self._lock = threading.Lock()
+
+    def source(self, name: str) -> SourceStats:
+        with self._lock:
+            if name not in self._sources:
+                self._sources[name] = SourceStats(name)
+            return self._sources[name]
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            sources = dict(self._sources)
+        summary = {
+            "run_id": self.run_id,
+            "snapshot_at": isoformat(self.snapshot_at),
+            "started_at": isoformat(self.started_at),
+            "finished_at": isoformat(now_utc()),
+            "wall_seconds": round(time.perf_counter() - self.started, 3),
+            "sources": {name: stats.as_dict() for name, stats in sources.items()},
+        }
+        if memo.enabled():
+            summary["memo"] = memo.summary()
+        return summary
+
+    def write(self, path: str) -> dict:
+        summary = self.as_dict()
+        ensure_dir(os.path.dirname(path) or ".")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(summary, handle, indent=2)
+        os.replace(tmp_path, path)
+        return summary
+
+    def log(self, logger: logging.Logger, summary: Optional[dict] = None) -> None:
+        summary = summary or self.as_dict()
+        for name, source in summary["sources"].items():
+            counters = " ".join(f"{key}={value}" for key, value in source["counters"].items())
+            logger.info("Stats %s wall=%.2fs %s", name, source["wall_seconds"], counters)
+            for stage, timing in source["stages"].items():
+                logger.info(
+                    "Stats %s stage=%s seconds=%.3f calls=%s",
+                    name,
+                    stage,
+                    timing["seconds"],
+                    timing["calls"],
+                )
+        for name, cache in (summary.get("memo") or {}).items():
+            logger.info(
+                "Memo %s hit_rate=%s hits=%s misses=%s size=%s saved=%.3fs",
+                name,
+                cache["hit_rate"],
+                cache["hits"],
+                cache["misses"],
+                cache["size"],
+                cache["seconds_saved"],
+            )
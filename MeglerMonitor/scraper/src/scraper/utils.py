@@ -6,19 +6,35 @@ import logging
 import os
 import random
 import re
+import threading
 import time
+from array import array
 from dataclasses import asdict, dataclass
 from datetime import UTC, datetime, timedelta
 from decimal import Decimal
-from typing import Iterable, Iterator, List, Optional, Sequence
+from functools import lru_cache
+from operator import attrgetter
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Sequence
 
 import psycopg
 import requests
 from dateutil import parser as date_parser
-from psycopg import sql
 from requests.adapters import HTTPAdapter
 from urllib3 import Retry
 
+from . import memo, postcodes
+from .cassette import DEFAULT_CASSETTE_DIR, CassetteAdapter
+from .memo import memoized
+from .postcodes import DEFAULT_REGISTER_PATH, PostalPlace, PostalRegister, load_register
+
+if TYPE_CHECKING:
+    from .stats import SourceStats
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, install with the "fast" extra
+    orjson = None
+
 
 START_2024_TS = int(datetime(2024, 1, 1, tzinfo=UTC).timestamp())
 COMMISSION_RATE_DEFAULT = 0.0125
@@ -86,6 +102,7 @@ DNB_STATUS_MAP = {
 }
 
 DOTNET_EPOCH_TICKS = 621355968000000000
+DATETIME_CACHE_SIZE = 65536
 
 
 @dataclass(slots=True)
@@ -114,6 +131,158 @@ class ListingRow:
     def to_dict(self) -> dict[str, Optional[str | int | bool]]:
         return asdict(self)
 
+    def to_tuple(self) -> tuple:
+        return ROW_VALUES(self)
+
+
+ROW_VALUES = attrgetter(*LISTING_COLUMNS)
+# Low-cardinality columns are stored as int codes into a per-batch dictionary: a page of
+# listings shares one snapshot_at, a handful of chains, statuses and types, and every
+# broker row of a listing repeats its city, district and last_seen_at.
+DICTIONARY_COLUMNS = frozenset(
+    {
+        "source",
+        "city",
+        "district",
+        "chain",
+        "broker",
+        "status",
+        "property_type",
+        "segment",
+        "price_bucket",
+        "broker_role",
+        "role",
+        "is_sold",
+        "last_seen_at",
+        "snapshot_at",
+    }
+)
+
+
+COLUMN_KINDS = tuple((name, name in DICTIONARY_COLUMNS) for name in LISTING_COLUMNS)
+
+
+class ListingBatch:
+    # Struct-of-arrays counterpart of a list of ListingRow. Normalizers append rows column
+    # by column and the sinks read whole columns, so no per-row object or dict is built.
+
+    __slots__ = ("columns", "dictionaries", "_lookups")
+
+    def __init__(self) -> None:
+        self.columns: dict[str, list | array] = {
+            name: array("i") if name in DICTIONARY_COLUMNS else [] for name in LISTING_COLUMNS
+        }
+        self.dictionaries: dict[str, list] = {name: [] for name in DICTIONARY_COLUMNS}
+        self._lookups: dict[str, dict] = {name: {} for name in DICTIONARY_COLUMNS}
+
+    def __len__(self) -> int:
+        return len(self.columns["listing_id"])
+
+    def _encode(self, name: str, value: object) -> int:
+        lookup = self._lookups[name]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self.dictionaries[name])
+            self.dictionaries[name].append(value)
+        return code
+
+    def append(self, **values: object) -> None:
+        # Every column must be given, exactly as for ListingRow.
+        if len(values) != len(LISTING_COLUMNS):
+            missing = set(LISTING_COLUMNS) - set(values)
+            raise TypeError(f"ListingBatch.append() missing columns: {sorted(missing)}")
+        columns = self.columns
+        for name, encoded in COLUMN_KINDS:
+            value = values[name]
+            columns[name].append(self._encode(name, value) if encoded else value)
+
+    def append_row(self, row: ListingRow) -> None:
+        columns = self.columns
+        for (name, encoded), value in zip(COLUMN_KINDS, ROW_VALUES(row)):
+            columns[name].append(self._encode(name, value) if encoded else value)
+
+    def extend(self, other: "ListingBatch") -> None:
+        for name in LISTING_COLUMNS:
+            if name in DICTIONARY_COLUMNS:
+                translate = [self._encode(name, value) for value in other.dictionaries[name]]
+                self.columns[name].extend(translate[code] for code in other.columns[name])
+            else:
+                self.columns[name].extend(other.columns[name])
+
+    def set_column(self, name: str, values: Sequence) -> None:
+        if len(values) != len(self):
+            raise ValueError(f"Column {name} has {len(values)} values for {len(self)} rows")
+        if name in DICTIONARY_COLUMNS:
+            self.dictionaries[name] = []
+            self._lookups[name] = {}
+            self.columns[name] = array("i", [self._encode(name, value) for value in values])
+        else:
+            self.columns[name] = list(values)
+
+    def set_encoded(self, name: str, dictionary: Sequence, codes: array) -> None:
+        # Replaces a dictionary column with pre-encoded codes; `dictionary` must be distinct.
+        if len(codes) != len(self):
+            raise ValueError(f"Column {name} has {len(codes)} values for {len(self)} rows")
+        self.dictionaries[name] = list(dictionary)
+        self._lookups[name] = {value: code for code, value in enumerate(self.dictionaries[name])}
+        self.columns[name] = codes
+
+    def column(self, name: str) -> list:
+        if name in DICTIONARY_COLUMNS:
+            values = self.dictionaries[name]
+            return [values[code] for code in self.columns[name]]
+        return list(self.columns[name])
+
+    def distinct(self, name: str) -> list:
+        # Values present in the column, without expanding it row by row.
+        if name in DICTIONARY_COLUMNS:
+            return list(self.dictionaries[name])
+        return list(dict.fromkeys(self.columns[name]))
+
+    def tuples(self) -> Iterator[tuple]:
+        return zip(*(self.column(name) for name in LISTING_COLUMNS))
+
+    def rows(self) -> List[ListingRow]:
+        return [ListingRow(*values) for values in self.tuples()]
+
+    def to_json(self) -> dict:
+        return {
+            "columns": {
+                name: list(values) if name in DICTIONARY_COLUMNS else values
+                for name, values in self.columns.items()
+            },
+            "dictionaries": self.dictionaries,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "ListingBatch":
+        batch = cls()
+        for name in DICTIONARY_COLUMNS:
+            values = data["dictionaries"][name]
+            batch.dictionaries[name] = list(values)
+            batch._lookups[name] = {value: code for code, value in enumerate(values)}
+        for name in LISTING_COLUMNS:
+            values = data["columns"][name]
+            batch.columns[name] = array("i", values) if name in DICTIONARY_COLUMNS else list(values)
+        return batch
+
+    @classmethod
+    def from_columns(cls, columns: dict[str, Sequence]) -> "ListingBatch":
+        # listing_id goes first: its length is the row count the other columns are checked against.
+        batch = cls()
+        batch.columns["listing_id"] = list(columns["listing_id"])
+        for name in LISTING_COLUMNS:
+            if name != "listing_id":
+                batch.set_column(name, columns[name])
+        return batch
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[ListingRow]) -> "ListingBatch":
+        batch = cls()
+        for row in rows:
+            batch.append_row(row)
+        return batch
+
 
 def get_logger(name: str = "scraper") -> logging.Logger:
     logger = logging.getLogger(name)
@@ -129,7 +298,14 @@ def get_logger(name: str = "scraper") -> logging.Logger:
     return logger
 
 
-def build_session(user_agent: str, retries: int = 3, backoff: float = 0.3) -> requests.Session:
+def build_session(
+    user_agent: str,
+    retries: int = 3,
+    backoff: float = 0.3,
+    pool_size: int = 10,
+    cassette_mode: str = "passthrough",
+    cassette_dir: str = DEFAULT_CASSETTE_DIR,
+) -> requests.Session:
     session = requests.Session()
     retry = Retry(
         total=retries,
@@ -137,7 +313,17 @@ def build_session(user_agent: str, retries: int = 3, backoff: float = 0.3) -> re
         status_forcelist=[429, 500, 502, 503, 504],
         allowed_methods=["GET", "POST"],
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter: HTTPAdapter
+    if cassette_mode == "passthrough":
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    else:
+        adapter = CassetteAdapter(
+            cassette_mode,
+            cassette_dir,
+            max_retries=retry,
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+        )
     session.mount("https://", adapter)
     session.mount("http://", adapter)
     session.headers.update(
@@ -150,6 +336,13 @@ def build_session(user_agent: str, retries: int = 3, backoff: float = 0.3) -> re
     return session
 
 
+def decode_json(content: bytes) -> object:
+    # Parses raw response bytes directly; orjson skips the bytes->str decode step entirely.
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
 def jitter_sleep(min_ms: int, max_ms: int) -> None:
     period = random.uniform(min_ms, max_ms) / 1000
     time.sleep(period)
@@ -188,14 +381,25 @@ def parse_datetime(value: object) -> Optional[datetime]:
         except (ValueError, OSError):
             return None
     if isinstance(value, str):
+        return parse_datetime_text(value)
+    return None
+
+
+@lru_cache(maxsize=DATETIME_CACHE_SIZE)
+def parse_datetime_text(value: str) -> Optional[datetime]:
+    # Both APIs (and our own isoformat output) send ISO-8601, which fromisoformat handles
+    # far faster than dateutil; dateutil stays as the fallback for anything unusual.
+    # Publish dates repeat across broker rows and get re-parsed downstream, hence the cache.
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
         try:
             parsed = date_parser.parse(value)
-            if parsed.tzinfo is None:
-                return parsed.replace(tzinfo=UTC)
-            return parsed.astimezone(UTC)
-        except (ValueError, TypeError):
+        except (ValueError, TypeError, OverflowError):
             return None
-    return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=UTC)
+    return parsed.astimezone(UTC)
 
 
 def net_ticks_to_datetime(ticks: int) -> Optional[datetime]:
@@ -208,6 +412,7 @@ def net_ticks_to_datetime(ticks: int) -> Optional[datetime]:
     return epoch_start + timedelta(seconds=seconds, microseconds=microseconds)
 
 
+@memoized("detect_broker_role", maxsize=1024)
 def detect_broker_role(title: Optional[str]) -> Optional[str]:
     if not title:
         return None
@@ -221,33 +426,53 @@ def detect_broker_role(title: Optional[str]) -> Optional[str]:
     return "Annet"
 
 
-OSLO_DISTRICT_RANGES = [
-    ((160, 179), "Sentrum"),
-    ((200, 249), "Sentrum"),
-    ((450, 469), "St. Hanshaugen"),
-    ((370, 379), "Vestre Aker"),
-    ((460, 499), "St. Hanshaugen"),
-    ((550, 579), "Frogner"),
-    ((580, 599), "Frogner"),
-    ((600, 699), "Gamle Oslo"),
-    ((700, 799), "Grünerløkka"),
-    ((400, 449), "St. Hanshaugen"),
-    ((800, 899), "Sagene"),
-    ((900, 999), "Nordstrand"),
-]
-
-
 def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
+class CsvSink:
+    # Incremental CSV writer; several source workers may share one sink.
+
+    def __init__(self, path: str, lazy: bool = False) -> None:
+        self.path = path
+        self.rows_written = 0
+        self._handle = None
+        self._writer = None
+        self._lock = threading.Lock()
+        if not lazy:
+            self._open()
+
+    def _open(self) -> None:
+        ensure_dir(os.path.dirname(self.path))
+        self._handle = open(self.path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._handle)
+        self._writer.writerow(LISTING_COLUMNS)
+
+    def write(self, rows: ListingBatch | Iterable[ListingRow]) -> None:
+        if not isinstance(rows, ListingBatch):
+            rows = ListingBatch.from_rows(rows)
+        with self._lock:
+            if self._writer is None:
+                self._open()
+            self._writer.writerows(rows.tuples())
+            self.rows_written += len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+    def __enter__(self) -> "CsvSink":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
 def write_csv(rows: Sequence[ListingRow], path: str) -> None:
-    ensure_dir(os.path.dirname(path))
-    with open(path, "w", newline="", encoding="utf-8") as handle:
-        writer = csv.DictWriter(handle, fieldnames=LISTING_COLUMNS)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row.to_dict())
+    with CsvSink(path) as sink:
+        sink.write(rows)
 
 
 def dump_json(rows: Sequence[ListingRow], path: str) -> None:
@@ -256,7 +481,21 @@ def dump_json(rows: Sequence[ListingRow], path: str) -> None:
         json.dump([row.to_dict() for row in rows], handle, ensure_ascii=False, indent=2)
 
 
-def batched(iterable: Sequence[ListingRow], size: int = 500) -> Iterator[List[ListingRow]]:
+def rebatch(batches: Iterable[ListingBatch], size: int = 500) -> Iterator[ListingBatch]:
+    # Coalesces per-page or per-slice batches into load batches of at least `size` rows.
+    pending = ListingBatch()
+    for batch in batches:
+        if not batch:
+            continue
+        pending.extend(batch)
+        if len(pending) >= size:
+            yield pending
+            pending = ListingBatch()
+    if pending:
+        yield pending
+
+
+def batched(iterable: Iterable[ListingRow], size: int = 500) -> Iterator[List[ListingRow]]:
     batch: List[ListingRow] = []
     for item in iterable:
         batch.append(item)
@@ -271,142 +510,30 @@ def connect_db(db_url: str) -> psycopg.Connection:
     return psycopg.connect(db_url, autocommit=False)
 
 
-def insert_rows(connection: psycopg.Connection, rows: Sequence[ListingRow]) -> int:
-    if not rows:
-        return 0
-    with connection.cursor() as cur:
-        insert_stmt = sql.SQL(
-            """
-            INSERT INTO listings (
-                source,
-                listing_id,
-                title,
-                address,
-                city,
-                district,
-                chain,
-                broker,
-                price,
-                commission_est,
-                status,
-                published,
-                property_type,
-                segment,
-                price_bucket,
-                broker_role,
-                role,
-                is_sold,
-                last_seen_at,
-                snapshot_at
-            ) VALUES (
-                %(source)s,
-                %(listing_id)s,
-                %(title)s,
-                %(address)s,
-                %(city)s,
-                %(district)s,
-                %(chain)s,
-                %(broker)s,
-                %(price)s,
-                %(commission_est)s,
-                %(status)s,
-                %(published)s,
-                %(property_type)s,
-                %(segment)s,
-                %(price_bucket)s,
-                %(broker_role)s,
-                %(role)s,
-                %(is_sold)s,
-                %(last_seen_at)s,
-                %(snapshot_at)s
-            )
-            ON CONFLICT (source, listing_id, broker, snapshot_at) DO NOTHING
-            """
-        )
-        dict_rows = []
-        for row in rows:
-            payload = row.to_dict()
-            enrich_location_fields(payload)
-            dict_rows.append(payload)
-        cur.executemany(insert_stmt, dict_rows)
-
-        latest_stmt = sql.SQL(
-            """
-            INSERT INTO listings_latest (
-                source,
-                listing_id,
-                title,
-                address,
-                city,
-                district,
-                chain,
-                broker,
-                price,
-                commission_est,
-                status,
-                published,
-                property_type,
-                segment,
-                price_bucket,
-                broker_role,
-                role,
-                is_sold,
-                last_seen_at,
-                snapshot_at
-            ) VALUES (
-                %(source)s,
-                %(listing_id)s,
-                %(title)s,
-                %(address)s,
-                %(city)s,
-                %(district)s,
-                %(chain)s,
-                %(broker)s,
-                %(price)s,
-                %(commission_est)s,
-                %(status)s,
-                %(published)s,
-                %(property_type)s,
-                %(segment)s,
-                %(price_bucket)s,
-                %(broker_role)s,
-                %(role)s,
-                %(is_sold)s,
-                %(last_seen_at)s,
-                %(snapshot_at)s
-            )
-            ON CONFLICT (source, listing_id) DO UPDATE
-            SET
-                title = EXCLUDED.title,
-                address = EXCLUDED.address,
-                city = EXCLUDED.city,
-                district = EXCLUDED.district,
-                chain = EXCLUDED.chain,
-                broker = EXCLUDED.broker,
-                price = EXCLUDED.price,
-                commission_est = EXCLUDED.commission_est,
-                status = EXCLUDED.status,
-                published = EXCLUDED.published,
-                property_type = EXCLUDED.property_type,
-                segment = EXCLUDED.segment,
-                price_bucket = EXCLUDED.price_bucket,
-                broker_role = EXCLUDED.broker_role,
-                role = EXCLUDED.role,
-                is_sold = EXCLUDED.is_sold,
-                last_seen_at = EXCLUDED.last_seen_at,
-                snapshot_at = EXCLUDED.snapshot_at
-            WHERE listings_latest.snapshot_at <= EXCLUDED.snapshot_at
-            """
+def location_enriched_tuples(batch: ListingBatch) -> List[tuple]:
+    # Positional parameters in LISTING_COLUMNS order with city and district filled in the
+    # way enrich_location_fields does for a dict row.
+    title_index, address_index, city_index, district_index = (
+        LISTING_COLUMNS.index(name) for name in ("title", "address", "city", "district")
+    )
+    params = []
+    for values in batch.tuples():
+        city, district = enrich_location(
+            values[city_index], values[district_index], values[address_index], values[title_index]
         )
-        cur.executemany(latest_stmt, dict_rows)
-    connection.commit()
-    return len(rows)
+        if city != values[city_index] or district != values[district_index]:
+            values = list(values)
+            values[city_index] = city
+            values[district_index] = district
+            values = tuple(values)
+        params.append(values)
+    return params
 
 
-def snapshot_filename(root: str, label: str, snapshot_at: datetime) -> str:
+def snapshot_filename(root: str, label: str, snapshot_at: datetime, extension: str = "csv") -> str:
     date_str = snapshot_at.astimezone(UTC).date().isoformat()
     ensure_dir(root)
-    return os.path.join(root, f"{date_str}_{label}.csv")
+    return os.path.join(root, f"{date_str}_{label}.{extension}")
 
 
 def dnb_status(code: Optional[int]) -> Optional[str]:
@@ -415,6 +542,10 @@ def dnb_status(code: Optional[int]) -> Optional[str]:
     return STATUS_MAP_DNB.get(code, "unknown")
 
 
+@memoized(
+    "select_dnb_city",
+    key=lambda locations: tuple(loc.get("name") for loc in locations) if locations else None,
+)
 def select_dnb_city(locations: Optional[List[dict]]) -> Optional[str]:
     if not locations:
         return None
@@ -465,6 +596,7 @@ def getenv_float(name: str, default: float) -> float:
 # ---- Domain-specific helpers -------------------------------------------------
 
 
+@memoized("normalize_text")
 def normalize_text(value: Optional[str]) -> Optional[str]:
     if value is None:
         return None
@@ -527,6 +659,9 @@ SEGMENT_ALIASES = {
     "tomt": "Tomt",
 }
 
+# Priority order of SEGMENT_ALIASES, frozen once for the hot matching loop.
+SEGMENT_RULES = tuple(SEGMENT_ALIASES.items())
+
 SOLD_STATUSES = {"sold", "solgt"}
 
 
@@ -539,23 +674,68 @@ def derive_price_bucket(price: Optional[int]) -> Optional[str]:
     return None
 
 
+def match_segment(value: str) -> Optional[str]:
+    # Aliases are tried in SEGMENT_ALIASES order, so an earlier alias wins wherever it
+    # appears in the text ("Nybygg - 3-roms leilighet" is a Leilighet).
+    lowered = value.lower()
+    for key, segment in SEGMENT_RULES:
+        if key in lowered:
+            return segment
+    return None
+
+
+@lru_cache(maxsize=1024)
+def match_type_segment(property_type: str) -> Optional[str]:
+    # Property types come from the small HJEM_TYPE_MAP/DNB_PROPERTY_TYPE_MAP vocabulary.
+    return match_segment(property_type)
+
+
 def derive_segment(property_type: Optional[str], title: Optional[str]) -> Optional[str]:
-    for value in (property_type, title):
-        if not value:
-            continue
-        lowered = value.lower()
-        for key, segment in SEGMENT_ALIASES.items():
-            if key in lowered:
-                return segment
+    if property_type:
+        segment = match_type_segment(property_type)
+        if segment:
+            return segment
+    if title:
+        segment = match_segment(title)
+        if segment:
+            return segment
     return property_type or None
 
 
+def classify_segments(
+    property_types: Sequence[Optional[str]],
+    titles: Sequence[Optional[str]],
+) -> List[Optional[str]]:
+    # Batch form of derive_segment. Each distinct type and title is matched once per call,
+    # which pays off because every broker row of a listing repeats the same title.
+    type_segments: dict[str, Optional[str]] = {}
+    title_segments: dict[str, Optional[str]] = {}
+    segments: List[Optional[str]] = []
+    for property_type, title in zip(property_types, titles):
+        segment = None
+        if property_type:
+            if property_type not in type_segments:
+                type_segments[property_type] = match_segment(property_type)
+            segment = type_segments[property_type]
+        if segment is None and title:
+            if title not in title_segments:
+                title_segments[title] = match_segment(title)
+            segment = title_segments[title]
+        segments.append(segment or property_type or None)
+    return segments
+
+
 def determine_is_sold(status: Optional[str]) -> bool:
     if not status:
         return False
     return status.lower() in SOLD_STATUSES
 
 
+@memoized(
+    "map_hjem_type",
+    maxsize=256,
+    key=lambda values: tuple(values) if isinstance(values, list) else values,
+)
 def map_hjem_type(values: Optional[Iterable]) -> str:
     if not values:
         return "Annet"
@@ -568,6 +748,7 @@ def map_hjem_type(values: Optional[Iterable]) -> str:
     return "Annet"
 
 
+@memoized("map_dnb_type", maxsize=256)
 def map_dnb_type(value: object) -> str:
     try:
         key = int(value)
@@ -615,6 +796,8 @@ def extract_dnb_location_fields(locs: Iterable) -> tuple[list, Optional[str]]:
         elif loc_type in {"MUNICIPALITY", "AREA"} and not municipality:
             municipality = value_str
 
+    if not city and postal:
+        city = postal_city(postal)
     if not city:
         candidates = []
         if municipality:
@@ -661,55 +844,73 @@ def first_non_null(values: Iterable[Optional[str]]) -> Optional[str]:
 
 
 def extract_dnb_published(doc: dict, fallback: str) -> str:
+    # Candidates are tried in priority order and only derived when every earlier one
+    # is missing; most documents carry forSaleDate, so media ticks are rarely converted.
     for_sale = doc.get("forSaleDate")
+    if for_sale:
+        return for_sale
     created = doc.get("created")
+    if created:
+        return created
 
     showings = doc.get("showings") or []
-    showing_dates = sorted(
-        [s.get("start") for s in showings if s and s.get("start")],
-        key=lambda x: x,
-    )
+    showing_dates = [s.get("start") for s in showings if s and s.get("start")]
+    if showing_dates:
+        return min(showing_dates)
 
     media = doc.get("media") or []
-    media_dates = sorted(
-        filter(None, (ticks_to_iso8601(m.get("lastModified")) for m in media)),
-        key=lambda x: x,
-    )
+    media_dates = [date for date in (ticks_to_iso8601(m.get("lastModified")) for m in media) if date]
+    if media_dates:
+        return min(media_dates)
+
+    return fallback
+
+
+POSTAL_CODE_RE = re.compile(r"(?<!\d)\d{4}(?!\d)")
 
-    primary = first_non_null(
+
+@lru_cache(maxsize=1)
+def postal_register() -> PostalRegister:
+    return load_register(bring_path=getenv("SCRAPER_POSTAL_REGISTER", "") or None)
+
+
+def memo_fingerprint() -> str:
+    # Memoized results depend on this module, the register code and the register data.
+    return memo.fingerprint(
         [
-            for_sale,
-            created,
-            showing_dates[0] if showing_dates else None,
-            media_dates[0] if media_dates else None,
+            __file__,
+            postcodes.__file__,
+            DEFAULT_REGISTER_PATH,
+            getenv("SCRAPER_POSTAL_REGISTER", "") or None,
         ]
     )
 
-    return primary or fallback
+
+def lookup_postcode(postal_code: Optional[str]) -> Optional[PostalPlace]:
+    return postal_register().lookup(postal_code) if postal_code else None
+
+
+def postal_city(postal_code: Optional[str]) -> Optional[str]:
+    return postal_register().city(postal_code)
 
 
 def extract_postal_code(*values: Optional[str]) -> Optional[str]:
+    # The first value with a standalone four-digit number wins; within a value a code the
+    # register knows beats house numbers and years, and the last one ("Gate 12, 0150 Oslo")
+    # beats earlier ones.
+    register = postal_register()
     for value in values:
         if not value:
             continue
-        text = str(value)
-        digits = "".join(ch for ch in text if ch.isdigit())
-        if len(digits) >= 4:
-            return digits[:4]
+        candidates = POSTAL_CODE_RE.findall(str(value))
+        if candidates:
+            known = [code for code in candidates if register.city(code)]
+            return (known or candidates)[-1]
     return None
 
 
 def infer_district(city: Optional[str], postal_code: Optional[str]) -> Optional[str]:
-    if not city or city.lower() != "oslo" or not postal_code or len(postal_code) < 4:
-        return None
-    try:
-        code_int = int(postal_code[:4])
-    except ValueError:
-        return None
-    for (start, end), name in OSLO_DISTRICT_RANGES:
-        if start * 10 <= code_int <= end * 10 + 9:
-            return name
-    return None
+    return postal_register().district(postal_code, city)
 
 
 CITY_BLACKLIST = {"norge", "norway", "no", "as", "as.", "as,"}
@@ -733,14 +934,28 @@ def guess_city_from_text(*values: Optional[str]) -> Optional[str]:
     return None
 
 
-def enrich_location_fields(data: dict[str, Optional[str | int]]) -> None:
-    city = normalize_text(data.get("city"))
-    if not city:
-        city = guess_city_from_text(data.get("address"), data.get("title"))
-    if city:
-        data["city"] = city
-    postal_code = extract_postal_code(data.get("address"), data.get("title"))
-    if not data.get("district"):
-        inferred = infer_district(city, postal_code)
+@memoized("enrich_location", maxsize=65536)
+def enrich_location(
+    city: Optional[str],
+    district: Optional[str],
+    address: Optional[str],
+    title: Optional[str],
+) -> tuple[Optional[str], Optional[str]]:
+    # Returns the (city, district) pair enrich_location_fields would store.
+    postal_code = extract_postal_code(address, title)
+    normalized = normalize_text(city)
+    if not normalized:
+        normalized = postal_city(postal_code) or guess_city_from_text(address, title)
+    if normalized:
+        city = normalized
+    if not district:
+        inferred = infer_district(normalized, postal_code)
         if inferred:
-            data["district"] = inferred
+            district = inferred
+    return city, district
+
+
+def enrich_location_fields(data: dict[str, Optional[str | int]]) -> None:
+    data["city"], data["district"] = enrich_location(
+        data.get("city"), data.get("district"), data.get("address"), data.get("title")
+    )
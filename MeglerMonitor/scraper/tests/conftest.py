@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Iterator
+
+import psycopg
+import pytest
+from psycopg import sql
+
+# Database tests run against SCRAPER_TEST_DB_URL and are skipped without it. Each test gets
+# its own schema with the infra migrations applied, dropped again afterwards, so the
+# database only needs to allow CREATE SCHEMA.
+TEST_DB_URL = os.environ.get("SCRAPER_TEST_DB_URL", "")
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / "infra" / "migrations"
+PARTITION_MIGRATION = "006_partition_listings.sql"
+
+
+@pytest.fixture(params=["plain", "partitioned"])
+def db(request) -> Iterator[psycopg.Connection]:
+    # A loader connection (autocommit off, as connect_db opens it) whose search_path is a
+    # fresh schema holding listings either as a plain table or partitioned by month.
+    if not TEST_DB_URL:
+        pytest.skip("SCRAPER_TEST_DB_URL is not set")
+    migrations = sorted(MIGRATIONS_DIR.glob("*.sql"))
+    if request.param == "plain":
+        migrations = [path for path in migrations if path.name < PARTITION_MIGRATION]
+    schema = f"scraper_test_{os.getpid()}_{request.param}"
+    with psycopg.connect(TEST_DB_URL, autocommit=True) as admin:
+        admin.execute(sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(schema)))
+        admin.execute(sql.SQL("CREATE SCHEMA {}").format(sql.Identifier(schema)))
+        admin.execute(sql.SQL("SET search_path TO {}").format(sql.Identifier(schema)))
+        for path in migrations:
+            admin.execute(path.read_text(encoding="utf-8"))
+    connection = psycopg.connect(TEST_DB_URL, autocommit=False, options=f"-c search_path={schema}")
+    try:
+        yield connection
+    finally:
+        connection.close()
+        with psycopg.connect(TEST_DB_URL, autocommit=True) as admin:
+            admin.execute(
+                sql.SQL("DROP SCHEMA IF EXISTS {} CASCADE").format(sql.Identifier(schema))
+            )
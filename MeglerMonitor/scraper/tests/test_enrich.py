@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import pytest
+
+from scraper import enrich
+from scraper.utils import (
+    ListingBatch,
+    clean_price,
+    derive_price_bucket,
+    determine_is_sold,
+    estimate_commission,
+)
+
+# Values the batch kernels must treat exactly like the scalar helpers: missing, zero and
+# negative prices, bucket edges, prices a double cannot hold exactly, prices outside int64
+# and floats. All of them go through the NumPy kernels (or their per-value fallback).
+PRICES = [
+    None,
+    0,
+    -1,
+    -5_000_000,
+    1,
+    3,
+    5,
+    7,
+    4_999_999,
+    5_000_000,
+    9_999_999,
+    10_000_000,
+    19_999_999,
+    20_000_000,
+    123_456_789,
+    2**53 - 1,
+    2**53,
+    2**53 + 1,
+    2**60 + 3,
+    2**63 - 1,
+    2**63,
+    2**70,
+    -(2**70),
+    2.5,
+    4_999_999.5,
+    5_000_000.0,
+    float("nan"),
+]
+# Unparsed prices, as an importer column holds them before clean_prices.
+STRING_PRICES = ["4 500 000", "12000000", "4\u00a0999\u00a0999,5", "", "n/a", "1e30"]
+RATES = [0.0125, 0.5, 1.0, 0.0, -0.01]
+STATUSES = ["for_sale", "sold", "Solgt", None, "SOLD", "archived"]
+
+
+@pytest.fixture(params=["numpy", "scalar"])
+def kernels(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        assert enrich.price_array(PRICES) is not None
+    else:
+        monkeypatch.setattr(enrich, "np", None)
+    return request.param
+
+
+def row_rates(count: int) -> list[float]:
+    return [[0.0125, 0.5, 0.0, -0.01, 0.025, float("nan")][index % 6] for index in range(count)]
+
+
+@pytest.mark.parametrize("mixed", [[], [True], STRING_PRICES])
+@pytest.mark.parametrize("rate", RATES)
+def test_estimate_commissions_matches_scalar(kernels, rate, mixed):
+    # Bools and strings send the whole column through the scalar helpers.
+    prices = PRICES + mixed
+    expected = [estimate_commission(price, rate) for price in prices]
+    assert enrich.estimate_commissions(prices, rate) == expected
+
+
+def test_estimate_commissions_per_row_rates(kernels):
+    prices = PRICES + STRING_PRICES
+    rates = row_rates(len(prices))
+    expected = [estimate_commission(price, rate) for price, rate in zip(prices, rates)]
+    assert enrich.estimate_commissions(prices, rates) == expected
+
+
+def test_estimate_commissions_rounds_half_to_even(kernels):
+    prices = [1, 3, 5, 7, 9, 2**52 + 1]
+    expected = [estimate_commission(price, 0.5) for price in prices]
+    assert enrich.estimate_commissions(prices, 0.5) == expected == [0, 2, 2, 4, 4, 2**51]
+
+
+def test_estimate_commissions_overflow_like_scalar(kernels):
+    # int * float fails for ints beyond float64, in the scalar helper and the batch alike.
+    with pytest.raises(OverflowError):
+        estimate_commission(10**400, 0.0125)
+    with pytest.raises(OverflowError):
+        enrich.estimate_commissions([1, 10**400], 0.0125)
+
+
+def test_estimate_commissions_rejects_rate_count(kernels):
+    with pytest.raises(ValueError):
+        enrich.estimate_commissions([1, 2, 3], [0.01, 0.02])
+
+
+@pytest.mark.parametrize("mixed", [[], [True, False]])
+def test_derive_price_buckets_matches_scalar(kernels, mixed):
+    prices = PRICES + mixed
+    assert enrich.derive_price_buckets(prices) == [derive_price_bucket(price) for price in prices]
+
+
+def test_derive_price_buckets_cleaned_strings(kernels):
+    raw = STRING_PRICES + [price for price in PRICES if price == price]
+    prices = enrich.clean_prices(raw)
+    assert prices == [clean_price(price) for price in raw]
+    assert enrich.derive_price_buckets(prices) == [derive_price_bucket(price) for price in prices]
+
+
+def test_derive_price_buckets_raw_strings_like_scalar(kernels):
+    # Unparsed strings cannot be compared with the bucket bounds, in either path.
+    with pytest.raises(TypeError):
+        derive_price_bucket("4 500 000")
+    with pytest.raises(TypeError):
+        enrich.derive_price_buckets([1, "4 500 000"])
+
+
+def test_derive_price_buckets_only_ints(kernels):
+    # An all-int column is the one the kernels take without any scalar fallback.
+    prices = [price for price in PRICES if type(price) is int and abs(price) <= 2**53]
+    assert enrich.derive_price_buckets(prices) == [derive_price_bucket(price) for price in prices]
+
+
+def listing_batch(prices: list, statuses: list) -> ListingBatch:
+    batch = ListingBatch()
+    for index, (price, status) in enumerate(zip(prices, statuses)):
+        batch.append(
+            source="Hjem.no",
+            listing_id=str(index),
+            title=None,
+            address=None,
+            city=None,
+            district=None,
+            chain=None,
+            broker=None,
+            price=price,
+            commission_est=None,
+            status=status,
+            published=None,
+            property_type=None,
+            segment=None,
+            price_bucket=None,
+            broker_role=None,
+            role=None,
+            is_sold=None,
+            last_seen_at="",
+            snapshot_at="",
+        )
+    return batch
+
+
+@pytest.mark.parametrize("per_row", [False, True])
+def test_enrich_batch_matches_scalar(kernels, per_row):
+    statuses = [STATUSES[index % len(STATUSES)] for index in range(len(PRICES))]
+    rates = row_rates(len(PRICES)) if per_row else [0.0125] * len(PRICES)
+    batch = enrich.enrich_batch(listing_batch(PRICES, statuses), rates if per_row else 0.0125)
+    assert batch.column("commission_est") == [
+        estimate_commission(price, rate) for price, rate in zip(PRICES, rates)
+    ]
+    assert batch.column("price_bucket") == [derive_price_bucket(price) for price in PRICES]
+    assert batch.column("is_sold") == [determine_is_sold(status) for status in statuses]
+    # Only values present in a column stay in its dictionary.
+    assert set(batch.distinct("price_bucket")) == set(batch.column("price_bucket"))
+    assert set(batch.distinct("is_sold")) == set(batch.column("is_sold"))
+
+
+def test_enrich_batch_empty(kernels):
+    batch = ListingBatch()
+    assert enrich.enrich_batch(batch) is batch
+    assert len(batch) == 0
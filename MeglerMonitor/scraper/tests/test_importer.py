@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import json
+import os
+
+import pytest
+from psycopg.conninfo import make_conninfo
+
+from scraper.importer import clean_columns, main
+from scraper.loader import insert_rows
+
+SNAPSHOT = "2025-02-10T06:00:00+00:00"
+
+
+def record(listing_id: str, **values) -> dict:
+    return {
+        "source": "DNB",
+        "listing_id": listing_id,
+        "title": f"Leilighet {listing_id}",
+        "broker": "Kari",
+        "price": 4_500_000,
+        "status": "for_sale",
+        "snapshot_at": SNAPSHOT,
+        **values,
+    }
+
+
+def columns(records: list[dict]) -> dict[str, list]:
+    names = {name for item in records for name in item}
+    return {name: [item.get(name) for item in records] for name in names}
+
+
+def test_derived_values_are_kept_and_missing_ones_filled():
+    # A historical snapshot carries the commission and bucket of its own time.
+    batch = clean_columns(
+        columns(
+            [
+                record("1", commission_est="40 000", price_bucket="0-5M", is_sold="True"),
+                record("2", commission_est=None, price_bucket="", is_sold=None),
+                record("3", commission_est=60_000, price_bucket="5-10M", is_sold=False),
+            ]
+        ),
+        SNAPSHOT,
+        commission_rate=0.0125,
+    )
+    assert batch.column("commission_est") == [40_000, 56_250, 60_000]
+    assert batch.column("price_bucket") == ["0-5M", "0-5M", "5-10M"]
+    assert batch.column("is_sold") == [True, False, False]
+
+
+def test_rederive_recomputes_every_derived_value():
+    batch = clean_columns(
+        columns([record("1", commission_est=40_000, price_bucket="5-10M", is_sold="t")]),
+        SNAPSHOT,
+        commission_rate=0.0125,
+        rederive=True,
+    )
+    assert batch.column("commission_est") == [56_250]
+    assert batch.column("price_bucket") == ["0-5M"]
+    assert batch.column("is_sold") == [False]
+
+
+def write_ndjson(path, records: list[dict]) -> str:
+    path.write_text("".join(json.dumps(item) + "\n" for item in records), encoding="utf-8")
+    return str(path)
+
+
+def listing_ids(connection, table: str) -> list[str]:
+    # Ends the read transaction, so it does not hold up the next TRUNCATE.
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT listing_id FROM {table} ORDER BY listing_id")
+        ids = [row[0] for row in cur.fetchall()]
+    connection.rollback()
+    return ids
+
+
+@pytest.fixture
+def db_url(db) -> str:
+    # The test schema for connections main opens itself.
+    schema = db.execute("SELECT current_schema()").fetchone()[0]
+    db.rollback()
+    return make_conninfo(os.environ["SCRAPER_TEST_DB_URL"], options=f"-c search_path={schema}")
+
+
+def test_replace_rolls_back_when_a_file_fails(db, db_url, tmp_path):
+    insert_rows(db, clean_columns(columns([record("old")]), SNAPSHOT))
+    good = write_ndjson(tmp_path / "a.ndjson", [record(str(index)) for index in range(5)])
+    bad = tmp_path / "b.ndjson"
+    bad.write_text(json.dumps(record("5")) + "\n{not json\n", encoding="utf-8")
+    later = write_ndjson(tmp_path / "c.ndjson", [record("6")])
+    rejects = str(tmp_path / "rejects.csv")
+
+    argv = ["--replace", "--db-url", db_url, "--rejects", rejects, "--chunk-rows", "2"]
+    assert main([good, str(bad), later, *argv]) == 1
+    assert listing_ids(db, "listings") == ["old"]
+    assert listing_ids(db, "listings_latest") == ["old"]
+
+    assert main([good, later, *argv]) == 0
+    expected = ["0", "1", "2", "3", "4", "6"]
+    assert listing_ids(db, "listings") == expected
+    assert listing_ids(db, "listings_latest") == expected
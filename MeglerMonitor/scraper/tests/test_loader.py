@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import csv
+import random
+from dataclasses import replace
+
+import psycopg
+import pytest
+from psycopg import sql
+
+from scraper import loader
+from scraper.loader import (
+    RejectSink,
+    ensure_partitions,
+    insert_rows,
+    listings_partitioned,
+    rebuild_latest,
+)
+from scraper.stats import SourceStats
+from scraper.utils import LISTING_COLUMNS, ListingBatch, ListingRow, location_enriched_tuples
+
+# The per-row statements the COPY loader replaced: every row inserted into listings (the
+# first copy wins), then every row upserted into listings_latest unless it is older.
+COLUMNS = sql.SQL(", ").join(map(sql.Identifier, LISTING_COLUMNS))
+PLACEHOLDERS = sql.SQL(", ").join(sql.Placeholder() * len(LISTING_COLUMNS))
+LEGACY_INSERT = sql.SQL(
+    "INSERT INTO listings ({columns}) VALUES ({values}) "
+    "ON CONFLICT (source, listing_id, broker, snapshot_at) DO NOTHING"
+).format(columns=COLUMNS, values=PLACEHOLDERS)
+LEGACY_LATEST = sql.SQL(
+    "INSERT INTO listings_latest ({columns}) VALUES ({values}) "
+    "ON CONFLICT (source, listing_id) DO UPDATE SET {updates} "
+    "WHERE listings_latest.snapshot_at <= EXCLUDED.snapshot_at"
+).format(
+    columns=COLUMNS,
+    values=PLACEHOLDERS,
+    updates=sql.SQL(", ").join(
+        sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(name))
+        for name in LISTING_COLUMNS
+        if name not in ("source", "listing_id")
+    ),
+)
+SELECT_COLUMNS = sql.SQL(", ").join(
+    sql.SQL("{}::text").format(sql.Identifier(name)) for name in LISTING_COLUMNS
+)
+
+JAN = "2025-01-10T06:00:00+00:00"
+FEB = "2025-02-10T06:00:00+00:00"
+MAR = "2025-03-10T06:00:00+00:00"
+
+
+def listing(listing_id: str, broker: str = "Kari", snapshot_at: str = FEB, **values) -> ListingRow:
+    row = ListingRow(
+        source="DNB",
+        listing_id=listing_id,
+        title=f"Leilighet {listing_id}",
+        address="Storgata 1, 0155 Oslo",
+        city="Oslo",
+        district=None,
+        chain="DNB Eiendom",
+        broker=broker,
+        price=4_500_000,
+        commission_est=56_250,
+        status="for_sale",
+        published=JAN,
+        property_type="Leilighet",
+        segment="Leilighet",
+        price_bucket="0-5M",
+        broker_role="Eiendomsmegler",
+        role="Eiendomsmegler",
+        is_sold=False,
+        last_seen_at=snapshot_at,
+        snapshot_at=snapshot_at,
+    )
+    return replace(row, **values)
+
+
+def listings_table(connection) -> list[tuple]:
+    # listings in id order, without the ids themselves.
+    query = sql.SQL("SELECT {} FROM listings ORDER BY id").format(SELECT_COLUMNS)
+    with connection.cursor() as cur:
+        cur.execute(query)
+        return cur.fetchall()
+
+
+def latest_table(connection) -> dict[tuple, tuple]:
+    query = sql.SQL("SELECT {} FROM listings_latest").format(SELECT_COLUMNS)
+    with connection.cursor() as cur:
+        cur.execute(query)
+        return {(row[0], row[1]): row for row in cur.fetchall()}
+
+
+def reset(connection) -> None:
+    with connection.cursor() as cur:
+        cur.execute("TRUNCATE listings, listings_latest")
+    connection.commit()
+
+
+def legacy_insert(connection, rows: list[ListingRow]) -> None:
+    params = location_enriched_tuples(ListingBatch.from_rows(rows))
+    with connection.cursor() as cur:
+        if listings_partitioned(connection):
+            ensure_partitions(cur, params)
+        cur.executemany(LEGACY_INSERT, params)
+        cur.executemany(LEGACY_LATEST, params)
+    connection.commit()
+
+
+def test_duplicate_rows_keep_first_copy(db):
+    rows = [
+        listing("1", price=1_000_000),
+        listing("2"),
+        listing("1", price=2_000_000),
+        listing("1", broker="Ola", price=3_000_000),
+    ]
+    stats = SourceStats("dnb")
+    assert insert_rows(db, rows, stats) == 4
+    stored = listings_table(db)
+    price = LISTING_COLUMNS.index("price")
+    broker = LISTING_COLUMNS.index("broker")
+    # In copy order, with the second copy of (1, Kari, FEB) ignored.
+    assert [(row[1], row[broker], row[price]) for row in stored] == [
+        ("1", "Kari", "1000000"),
+        ("2", "Kari", "4500000"),
+        ("1", "Ola", "3000000"),
+    ]
+    assert stats.counters["db_rows"] == 4
+    assert stats.counters["db_rows_inserted"] == 3
+    assert stats.counters["db_latest_upserts"] == 2
+
+
+def test_latest_takes_newest_snapshot_then_last_copy(db):
+    insert_rows(
+        db,
+        [
+            listing("1", broker="Kari", snapshot_at=FEB, price=1),
+            listing("1", broker="Ola", snapshot_at=MAR, price=2),
+            listing("1", broker="Per", snapshot_at=MAR, price=3),
+            listing("1", broker="Anne", snapshot_at=JAN, price=4),
+        ],
+    )
+    latest = latest_table(db)
+    price = LISTING_COLUMNS.index("price")
+    broker = LISTING_COLUMNS.index("broker")
+    assert latest[("DNB", "1")][broker] == "Per"
+    assert latest[("DNB", "1")][price] == "3"
+
+    # An older snapshot never replaces the latest row; the same snapshot does.
+    insert_rows(db, [listing("1", broker="Anne", snapshot_at=FEB, price=5)])
+    assert latest_table(db)[("DNB", "1")][price] == "3"
+    insert_rows(db, [listing("1", broker="Siri", snapshot_at=MAR, price=6)])
+    assert latest_table(db)[("DNB", "1")][broker] == "Siri"
+    assert len(listings_table(db)) == 6
+
+
+def random_loads(seed: int, ids: int, rows: int, loads: int) -> list[list[ListingRow]]:
+    rng = random.Random(seed)
+    return [
+        [
+            listing(
+                str(rng.randrange(ids)),
+                broker=rng.choice(["Kari", "Ola", None]),
+                snapshot_at=rng.choice([JAN, FEB, MAR]),
+                price=rng.choice([None, rng.randrange(1, 30_000_000)]),
+                status=rng.choice(["for_sale", "sold"]),
+                last_seen_at=rng.choice([JAN, FEB, MAR, None]),
+                city=rng.choice(["Oslo", None]),
+            )
+            for _ in range(rows)
+        ]
+        for _ in range(loads)
+    ]
+
+
+def test_matches_row_by_row_upserts(db):
+    # Duplicates and conflicting copies spread over several chunks and loads.
+    loads = random_loads(5, ids=40, rows=300, loads=3)
+    for rows in loads:
+        legacy_insert(db, rows)
+    expected_listings = listings_table(db)
+    expected_latest = latest_table(db)
+
+    reset(db)
+    for rows in loads:
+        insert_rows(db, rows, chunk_rows=37)
+    assert listings_table(db) == expected_listings
+    assert latest_table(db) == expected_latest
+
+
+def test_rebuild_latest_matches_merge(db):
+    # rebuild_latest only sees the copy listings kept, so the loads hold no conflicting
+    # copies of a (source, listing_id, broker, snapshot_at) row.
+    loads, seen = [], set()
+    for rows in random_loads(9, ids=60, rows=200, loads=3):
+        unique = []
+        for row in rows:
+            key = (row.source, row.listing_id, row.broker, row.snapshot_at)
+            if key not in seen:
+                seen.add(key)
+                unique.append(row)
+        loads.append(unique)
+    for rows in loads:
+        insert_rows(db, rows, chunk_rows=37)
+    expected_listings = listings_table(db)
+    expected_latest = latest_table(db)
+
+    reset(db)
+    for rows in loads:
+        insert_rows(db, rows, chunk_rows=37, merge_latest=False)
+    assert latest_table(db) == {}
+    assert rebuild_latest(db) == len(expected_latest)
+    assert listings_table(db) == expected_listings
+    assert latest_table(db) == expected_latest
+
+
+def test_bad_row_is_rejected_alone(db, tmp_path):
+    rows = [listing(str(index)) for index in range(10)]
+    # Breaks the CHECK constraint on source.
+    rows[6] = listing("6", source="Finn.no")
+    stats = SourceStats("dnb")
+    reject_path = tmp_path / "rejects.csv"
+    with RejectSink(str(reject_path)) as rejects:
+        loaded = insert_rows(db, rows, stats, chunk_rows=10, rejects=rejects)
+    assert loaded == 9
+    assert rejects.rows_written == 1
+    assert stats.counters["db_rejected"] == 1
+    assert sorted(row[1] for row in listings_table(db)) == sorted(
+        str(index) for index in range(10) if index != 6
+    )
+    assert ("DNB", "6") not in latest_table(db)
+
+    with open(reject_path, newline="", encoding="utf-8") as handle:
+        records = list(csv.DictReader(handle))
+    assert len(records) == 1
+    assert records[0]["source"] == "Finn.no"
+    assert records[0]["listing_id"] == "6"
+    assert "check constraint" in records[0]["error"]
+
+
+def test_bad_timestamp_is_rejected_alone(db, tmp_path):
+    rows = [listing(str(index)) for index in range(8)]
+    rows[3] = listing("3", published="not a date")
+    with RejectSink(str(tmp_path / "rejects.csv")) as rejects:
+        assert insert_rows(db, rows, chunk_rows=8, rejects=rejects) == 7
+        assert rejects.rows_written == 1
+    assert len(listings_table(db)) == 7
+
+
+def test_detached_month_fails_the_load(db, tmp_path):
+    if not listings_partitioned(db):
+        pytest.skip("listings is not partitioned")
+    insert_rows(db, [listing("1", snapshot_at=FEB)])
+    with db.cursor() as cur:
+        cur.execute("ALTER TABLE listings DETACH PARTITION listings_2025_02")
+    db.commit()
+
+    stats = SourceStats("dnb")
+    rows = [listing(str(index), snapshot_at=FEB) for index in range(20)]
+    with RejectSink(str(tmp_path / "rejects.csv")) as rejects:
+        with pytest.raises(psycopg.errors.ObjectNotInPrerequisiteState, match="detached"):
+            insert_rows(db, rows, stats, chunk_rows=10, rejects=rejects)
+        assert rejects.rows_written == 0
+    assert "db_rejected" not in stats.counters
+    assert listings_table(db) == []
+
+
+def test_rows_without_partition_are_not_bisected(db, tmp_path, monkeypatch):
+    if not listings_partitioned(db):
+        pytest.skip("listings is not partitioned")
+    # Without the partition upkeep the month has nowhere to go.
+    monkeypatch.setattr(loader, "ensure_partitions", lambda cur, params: 0)
+    rows = [listing(str(index), snapshot_at="2031-06-01T00:00:00+00:00") for index in range(20)]
+    with RejectSink(str(tmp_path / "rejects.csv")) as rejects:
+        with pytest.raises(psycopg.errors.CheckViolation, match="no partition"):
+            insert_rows(db, rows, chunk_rows=10, rejects=rejects)
+        assert rejects.rows_written == 0
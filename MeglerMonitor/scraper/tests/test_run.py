@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime
+from types import SimpleNamespace
+
+import pytest
+
+from scraper.run import parse_args, plan_crawl
+from scraper.state import SourceWatermark, WatermarkStore
+
+NOW = datetime(2025, 6, 1, 12, tzinfo=UTC)
+PUBLISHED = "2025-05-30T08:00:00+00:00"
+
+
+def settings(tmp_path, watermark: SourceWatermark | None = None) -> SimpleNamespace:
+    store = WatermarkStore(str(tmp_path / "watermarks.json"))
+    if watermark is not None:
+        store.watermarks["hjem"] = watermark
+    return SimpleNamespace(
+        watermarks=store, snapshot_at=NOW, full_sweep_days=7, overlap_hours=24
+    )
+
+
+@pytest.fixture
+def swept(tmp_path) -> SimpleNamespace:
+    # A recent full sweep, so a plain run is incremental from the watermark.
+    return settings(
+        tmp_path,
+        SourceWatermark(max_published=PUBLISHED, last_full_sweep_at="2025-05-31T00:00:00+00:00"),
+    )
+
+
+def test_incremental_from_watermark(swept):
+    publish_from, full_sweep = plan_crawl("hjem", parse_args(["--hjem"]), swept)
+    assert full_sweep is False
+    assert publish_from == int(datetime(2025, 5, 29, 8, tzinfo=UTC).timestamp())
+
+
+def test_first_run_is_a_full_sweep(tmp_path):
+    assert plan_crawl("hjem", parse_args(["--hjem"]), settings(tmp_path)) == (None, True)
+
+
+@pytest.mark.parametrize(
+    "argv, expected_from",
+    [
+        (["--from", "1704067200"], 1704067200),
+        (["--to", "1735603200"], None),
+        (["--from", "1704067200", "--to", "1735603200"], 1704067200),
+    ],
+)
+@pytest.mark.parametrize("has_watermark", [False, True])
+def test_explicit_window_is_neither_full_nor_incremental(
+    tmp_path, swept, argv, expected_from, has_watermark
+):
+    # A --to-only run used to count as a full sweep (or run incrementally) and then
+    # overwrite the sweep stamp, listing ids and max_published from a truncated window.
+    run_settings = swept if has_watermark else settings(tmp_path)
+    args = parse_args(["--hjem", *argv])
+    assert plan_crawl("hjem", args, run_settings) == (expected_from, False)
+    assert plan_crawl("hjem", parse_args(["--hjem", "--full", *argv]), run_settings) == (
+        expected_from,
+        False,
+    )
+
+
+def test_dnb_always_sweeps(swept):
+    assert plan_crawl("dnb", parse_args(["--dnb", "--to", "1735603200"]), swept) == (None, True)